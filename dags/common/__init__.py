@@ -4,6 +4,7 @@ from common.operators.mssql_to_mssql import MsSqlToMsSql
 from common.operators.mssql_to_mssql import MsSqlToMsSqlWithLookup
 from common.operators.mssql_to_mssql import MsSqlToMsSqlUsingCTDS
 from common.operators.mssql_to_csv import MsSqlToCSV
+from common.operators.mssql_to_parquet import MsSqlToParquet
 from common.operators.csv_to_mssql import CSVToMsSql
 from common.operators.excel_to_mssql import ExcelToMsSql
 from common.operators.zip_operator import ZipOperator, UnzipOperator
@@ -19,6 +20,7 @@ class Plugin(AirflowPlugin):
                  MsSqlToMsSqlWithLookup,
                  MsSqlToMsSqlUsingCTDS,
                  MsSqlToCSV,
+                 MsSqlToParquet,
                  CSVToMsSql,
                  ExcelToMsSql,
                  ZipOperator,
@@ -1,9 +1,11 @@
 import _tds
+import os
 import pymssql
+import queue
 import sys
-from contextlib import closing
+import threading
+from contextlib import closing, contextmanager
 from datetime import datetime
-from pprint import pprint
 
 import ctds
 import numpy
@@ -11,11 +13,74 @@ from airflow.exceptions import AirflowException
 from airflow.hooks.dbapi_hook import DbApiHook
 from builtins import str
 from past.builtins import basestring
+from common.utils.mssql_statistics import parse_statistics, format_statistics, SHOWPLAN_COLUMN
+
+# Table schemas by (mssql_conn_id, database, table), see MsSqlHook.get_table_schema
+_table_schema_cache = {}
+
+# Errors caused by the inserted data, other errors such as a missing table or a lost connection are not isolated to rows
+ROW_ERRORS = (ctds.DataError, ctds.IntegrityError)
+
+
+def _isolate_rows(conn, table, rows, tablock):
+    try:
+        return conn.bulk_insert(table=table, rows=rows, tablock=tablock), []
+    except ROW_ERRORS as err:
+        if len(rows) == 1:
+            return 0, [(0, err)]
+    return _insert_halves(conn, table, rows, tablock)
+
+
+def _insert_halves(conn, table, rows, tablock):
+    middle = len(rows) // 2
+    rows_saved, failed = _isolate_rows(conn, table, rows[:middle], tablock)
+    rows_saved_end, failed_end = _isolate_rows(conn, table, rows[middle:], tablock)
+    return rows_saved + rows_saved_end, failed + [(middle + position, err) for position, err in failed_end]
+
+
+def bulk_insert_isolating(conn, table, rows, tablock=True):
+    """
+    Bulk inserts rows in one batch at full speed and, only when the batch fails because of its data,
+    inserts halves of it recursively to isolate the failing rows, so that the other rows are still inserted.
+    A batch is committed or rolled back as a whole, so no row is inserted twice.
+    When every row of a batch of several rows fails alone with the same error as the whole batch,
+    the error is not caused by single rows and is raised.
+    :param conn: cTDS connection with autocommit
+    :type conn: ctds.Connection
+    :param table: Name of the target table
+    :type table: str
+    :param rows: Rows as dictionaries or tuples
+    :type rows: list
+    :param tablock: Table lock hint for fast inserts
+    :type tablock: bool
+    :return: Number of rows inserted and a list of (position, error) of the rows which failed
+    :type tuple
+    """
+    if not rows:
+        return 0, []
+    try:
+        return conn.bulk_insert(table=table, rows=rows, tablock=tablock), []
+    except ROW_ERRORS as err:
+        if len(rows) == 1:
+            return 0, [(0, err)]
+        batch_error = err
+
+    rows_saved, failed = _insert_halves(conn, table, rows, tablock)
+    if not rows_saved and all(type(err) is type(batch_error) and str(err) == str(batch_error) for _, err in failed):
+        raise batch_error
+    return rows_saved, failed
 
 
 class MsSqlHook(DbApiHook):
     """
     Interact with Microsoft SQL Server.
+
+    :param profile_statistics: Run statements with SET STATISTICS IO, TIME ON and collect per statement
+        logical reads, CPU and elapsed time into the statistics attribute.
+    :type profile_statistics: bool
+    :param plan_path: Directory to save the actual XML execution plans (.sqlplan) of profiled statements.
+        Plans are not captured if not set.
+    :type plan_path: str
     """
 
     conn_name_attr = 'mssql_conn_id'
@@ -23,8 +88,12 @@ class MsSqlHook(DbApiHook):
     supports_autocommit = True
 
     def __init__(self, *args, **kwargs):
+        self.profile_statistics = kwargs.pop("profile_statistics", False)
+        self.plan_path = kwargs.pop("plan_path", None)
         super(MsSqlHook, self).__init__(*args, **kwargs)
         self.schema = kwargs.pop("schema", None)
+        self.statistics = []
+        self._messages = None
 
     def get_conn(self):
         """
@@ -57,9 +126,87 @@ class MsSqlHook(DbApiHook):
             paramstyle='named')
         return conn
 
+    def get_conn_pool(self, size, use_ctds=False):
+        """
+        Returns a pool of up to size connections, created on demand.
+        :param size: Maximum number of open connections
+        :type size: int
+        :param use_ctds: Create cTDS connections instead of pymssql connections
+        :type use_ctds: bool
+        """
+        return MsSqlConnectionPool(self.get_ctds_conn if use_ctds else self.get_conn, size)
+
     def set_autocommit(self, conn, autocommit):
         conn.autocommit(autocommit)
 
+    def enable_statistics(self, conn, cursor):
+        """
+        Turns on statistics for the connection session when profile_statistics is set.
+        Server messages are captured with a message handler for pymssql connections
+        and read from cursor.messages for cTDS connections.
+        """
+        if not self.profile_statistics:
+            return
+
+        if hasattr(conn, '_conn'):
+            self._messages = []
+            conn._conn.set_msghandler(lambda *message: self._messages.append(message[-1]))
+        cursor.execute('SET STATISTICS IO, TIME ON')
+        if self.plan_path:
+            cursor.execute('SET STATISTICS XML ON')
+
+    def collect_statistics(self, cursor, sql):
+        """
+        Parses the statistics messages of the last executed statement after its rows were fetched
+        and saves the actual execution plans from the remaining result sets.
+        :param cursor: Cursor the statement was executed with
+        :param sql: The executed statement
+        :type sql: str
+        :return: Parsed statistics or None if profiling is disabled
+        :type dict
+        """
+        if not self.profile_statistics:
+            return None
+
+        plans = []
+        while True:
+            if cursor.description and _column_name(cursor.description[0]) == SHOWPLAN_COLUMN:
+                plans.extend(row[0] for row in cursor.fetchall())
+            if not cursor.nextset():
+                break
+
+        if self._messages is not None:
+            messages = list(self._messages)
+            del self._messages[:]
+        else:
+            messages = [m.get('description', '') for m in getattr(cursor, 'messages', None) or []]
+
+        statistics = parse_statistics(messages)
+        statistics['sql'] = sql
+        statistics['plans'] = self._save_plans(plans)
+        self.statistics.append(statistics)
+        self.log.info('Statement {0} statistics: {1}'.format(len(self.statistics), format_statistics(statistics)))
+        return statistics
+
+    def _save_plans(self, plans):
+        filepaths = []
+        if plans and self.plan_path:
+            os.makedirs(self.plan_path, exist_ok=True)
+            for i, plan in enumerate(plans):
+                filepath = os.path.join(self.plan_path, 'plan_{0:%Y%m%dT%H%M%S}_{1}_{2}.sqlplan'.format(
+                    datetime.now(), len(self.statistics) + 1, i + 1))
+                with open(filepath, 'w', encoding='utf-8') as f:
+                    f.write(plan)
+                filepaths.append(filepath)
+                self.log.info('Saved actual execution plan to {0}'.format(filepath))
+        return filepaths
+
+    @contextmanager
+    def _cursor(self, conn):
+        with closing(conn.cursor()) as cur:
+            self.enable_statistics(conn, cur)
+            yield cur
+
     def get_records_dict(self, sql, parameters=None):
         """
         Executes the sql and returns a set of records.
@@ -70,7 +217,7 @@ class MsSqlHook(DbApiHook):
         :type parameters: mapping or iterable
         """
         with closing(self.get_conn()) as conn:
-            with closing(conn.cursor()) as cur:
+            with self._cursor(conn) as cur:
                 if parameters is not None:
                     cur.execute(sql, parameters)
                 else:
@@ -79,6 +226,7 @@ class MsSqlHook(DbApiHook):
                 results = []
                 for row in cur.fetchall():
                     results.append(dict(zip(columns, row)))
+                self.collect_statistics(cur, sql)
                 return results
 
     def get_first_dict(self, sql, parameters=None):
@@ -94,13 +242,63 @@ class MsSqlHook(DbApiHook):
             sql = sql.encode('utf-8')
 
         with closing(self.get_conn()) as conn:
-            with closing(conn.cursor()) as cur:
+            with self._cursor(conn) as cur:
                 if parameters is not None:
                     cur.execute(sql, parameters)
                 else:
                     cur.execute(sql)
-                return dict(zip([column[0] for column in cur.description],
-                                cur.fetchone()))
+                result = dict(zip([column[0] for column in cur.description],
+                                  cur.fetchone()))
+                if self.profile_statistics:
+                    cur.fetchall()
+                    self.collect_statistics(cur, sql)
+                return result
+
+    def get_table_columns(self, table):
+        """
+        Returns the insertable column names of a table of the connection database in column order,
+        computed columns are left out.
+        :param table: Table name, optionally with schema, e.g. 'dbo.Accounts' or '[dbo].[Accounts]',
+            or a temporary table, e.g. '#Accounts'
+        :type table: str
+        """
+        # temporary tables are objects of tempdb, not of the connection database
+        catalog = 'tempdb.' if table.lstrip('[').startswith('#') else ''
+        rows = self.get_records(
+            sql="SELECT name FROM {0}sys.columns WHERE object_id = OBJECT_ID(%(table)s) AND is_computed = 0 "
+                "ORDER BY column_id".format(catalog),
+            parameters={"table": 'tempdb..' + table if catalog else table})
+        if not rows:
+            raise AirflowException("Table {0} does not exist or has no columns".format(table))
+        return [row[0] for row in rows]
+
+    def get_table_schema(self, table):
+        """
+        Returns the columns of a table of the connection database in column order from INFORMATION_SCHEMA
+        as dictionaries with name, type, max_length, precision, scale and nullable.
+        Schemas are cached per connection, database and table for the lifetime of the process.
+        :param table: Table name, optionally with schema, e.g. 'dbo.Accounts' or '[dbo].[Accounts]'
+        :type table: str
+        """
+        key = (self.mssql_conn_id, self.schema, table)
+        if key not in _table_schema_cache:
+            rows = self.get_records(
+                sql="SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE, "
+                    "IS_NULLABLE FROM INFORMATION_SCHEMA.COLUMNS "
+                    "WHERE TABLE_NAME = PARSENAME(%(table)s, 1) "
+                    "AND TABLE_SCHEMA = ISNULL(PARSENAME(%(table)s, 2), SCHEMA_NAME()) "
+                    "ORDER BY ORDINAL_POSITION",
+                parameters={"table": table})
+            if not rows:
+                raise AirflowException("Table {0} does not exist or has no columns".format(table))
+            _table_schema_cache[key] = [{"name": name,
+                                         "type": data_type,
+                                         "max_length": max_length,
+                                         "precision": precision,
+                                         "scale": scale,
+                                         "nullable": is_nullable == 'YES'}
+                                        for name, data_type, max_length, precision, scale, is_nullable in rows]
+        return [dict(column) for column in _table_schema_cache[key]]
 
     def insert_rows(self, table, rows, target_fields=None, commit_every=1000):
         """
@@ -211,18 +409,121 @@ class MsSqlHook(DbApiHook):
 
                 try:
                     rows_saved = conn.bulk_insert(table=table, rows=data, batch_size=commit_every, tablock=True)
-                    if rows_saved != len(rows):
-                        self.log.error('Table: {}'.format(table))
-                        pprint(data)
-                        raise AirflowException('ERROR bulk_insert only = {} should have been {}'
-                                               .format(rows_saved, len(rows)))
-                except _tds.DatabaseError:
+                except _tds.DatabaseError as err:
+                    self.log.error('Bulk insert of {0} rows to table {1} failed: {2}'.format(len(rows), table, err))
+                    raise AirflowException('ERROR DatabaseError: {0}'.format(err))
+                if rows_saved != len(rows):
                     self.log.error('Table: {}'.format(table))
-                    pprint(data)
-                    raise AirflowException('ERROR DatabaseError: '.format(rows_saved, len(rows)))
+                    raise AirflowException('ERROR bulk_insert only = {} should have been {}'
+                                           .format(rows_saved, len(rows)))
 
     def run(self, sql, autocommit=False, parameters=None):
-        return super(MsSqlHook, self).run(sql, autocommit=autocommit, parameters=parameters)
+        if not self.profile_statistics:
+            return super(MsSqlHook, self).run(sql, autocommit=autocommit, parameters=parameters)
+
+        if isinstance(sql, basestring):
+            sql = [sql]
+
+        with closing(self.get_conn()) as conn:
+            if self.supports_autocommit:
+                self.set_autocommit(conn, autocommit)
+
+            with self._cursor(conn) as cur:
+                for s in sql:
+                    self.log.info('{0} with parameters {1}'.format(s, parameters))
+                    if parameters is not None:
+                        cur.execute(s, parameters)
+                    else:
+                        cur.execute(s)
+                    self.collect_statistics(cur, s)
+
+            if not autocommit:
+                conn.commit()
+
+    def get_first(self, sql, parameters=None):
+        if not self.profile_statistics:
+            return super(MsSqlHook, self).get_first(sql=sql, parameters=parameters)
+
+        with closing(self.get_conn()) as conn:
+            with self._cursor(conn) as cur:
+                if parameters is not None:
+                    cur.execute(sql, parameters)
+                else:
+                    cur.execute(sql)
+                row = cur.fetchone()
+                cur.fetchall()
+                self.collect_statistics(cur, sql)
+                return row
 
     def get_records(self, sql, parameters=None):
-        return super(MsSqlHook, self).get_records(sql=sql, parameters=parameters)
+        if not self.profile_statistics:
+            return super(MsSqlHook, self).get_records(sql=sql, parameters=parameters)
+
+        with closing(self.get_conn()) as conn:
+            with self._cursor(conn) as cur:
+                if parameters is not None:
+                    cur.execute(sql, parameters)
+                else:
+                    cur.execute(sql)
+                rows = cur.fetchall()
+                self.collect_statistics(cur, sql)
+                return rows
+
+
+def _column_name(column):
+    """Returns column name from a pymssql or cTDS cursor description item"""
+    return getattr(column, 'name', None) or column[0]
+
+
+class MsSqlConnectionPool(object):
+    """
+    Thread safe pool of connections created on demand with a connection factory,
+    e.g. MsSqlHook.get_conn. Use as a context manager to close all connections on exit.
+
+    :param connection_factory: Callable returning a new connection
+    :type connection_factory: callable
+    :param size: Maximum number of open connections
+    :type size: int
+    """
+
+    def __init__(self, connection_factory, size):
+        self.connection_factory = connection_factory
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._connections) < self.size:
+                conn = self.connection_factory()
+                self._connections.append(conn)
+                return conn
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection from the pool, waiting for an idle one when all are in use."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._idle = queue.LifoQueue()
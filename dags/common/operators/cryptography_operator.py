@@ -2,6 +2,7 @@ from airflow.hooks.base_hook import BaseHook
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
 from airflow.exceptions import AirflowException
+from common.utils.file_utils import import_gpg_key
 
 import gnupg
 import os
@@ -85,10 +86,7 @@ class CryptographyOperator(BaseOperator):
         """Encrypts the source file using GPG with key_file and passphrase provided in connection."""
         self.log.info("Encrypting file {0} to {1}.".format(src_filepath, dest_filepath))
 
-        gpg = gnupg.GPG(options=self.gpg_options)
-        key_data = open(self.key_file, mode='rb').read()
-        import_result = gpg.import_keys(key_data)
-        self.log.info("Key import results: {0}".format(import_result.results))
+        gpg = import_gpg_key(self.key_file, self.gpg_options, log=self.log)
 
         with open(src_filepath, 'rb') as f:
             status = gpg.encrypt_file(f,
@@ -110,10 +108,7 @@ class CryptographyOperator(BaseOperator):
         """Decrypts the source file using GPG with key_file and passphrase provided in connection."""
         self.log.info("Decrypting file {0} to {1}.".format(src_filepath, dest_filepath))
 
-        gpg = gnupg.GPG(options=self.gpg_options)
-        key_data = open(self.key_file, mode='rb').read()
-        import_result = gpg.import_keys(key_data)
-        self.log.info("Key import results: {0}".format(import_result.results))
+        gpg = import_gpg_key(self.key_file, self.gpg_options, log=self.log)
 
         with open(src_filepath, 'rb') as f:
             status = gpg.decrypt_file(f,
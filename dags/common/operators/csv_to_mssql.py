@@ -1,19 +1,76 @@
+from airflow.hooks.base_hook import BaseHook
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
+from airflow.exceptions import AirflowException
 
 from hooks.mssql_hook import MsSqlHook
-from utils.etl_utils import apply_transformations
+from utils.etl_utils import apply_transformations, apply_transformations_with_rejects, \
+    prepare_transformations, resolve_schema
+from common.utils.transfer_stats import TransferStats
+from common.utils.file_utils import gpg_input_options, input_format, open_input, split_lines
+from common.utils.reject_file import RejectFile, bulk_insert_rejecting
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pyarrow import csv as pa_csv
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import codecs
 import csv
+import glob
+import io
+import mmap
+import multiprocessing
+import os.path as op
+import threading
+
+# Read options and transformations of the running load, inherited by forked parse workers
+_parse_context = {}
+
+
+def _parse_range(task):
+    """Parses and transforms a byte range of the source file in a worker process"""
+    i, start, end = task
+    with open(_parse_context['filepath'], 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = io.BytesIO(mm[start:end])
+
+    args = dict(_parse_context['args'], filepath_or_buffer=data)
+    if _parse_context['widths']:
+        df = pd.read_fwf(**args, widths=_parse_context['widths'])
+    else:
+        df = pd.read_csv(**args)
+    if not _parse_context['rejecting']:
+        records = list(apply_transformations(df, _parse_context['transformations'], _parse_context['columns'],
+                                             _parse_context['converters']))
+        return i, df.shape[0], records, None, None
+
+    records, source, rejects = apply_transformations_with_rejects(
+        df, _parse_context['transformations'], _parse_context['schema'], _parse_context['converters'],
+        _parse_context['columns'])
+    return i, df.shape[0], records, source, rejects
 
 
 class CSVToMsSql(BaseOperator):
     """
     Transfers data from CSV file to MsSql table.
 
-    :param src_filepath: Source file path.
-    :type src_filepath: str
+    :param src_filepath: Source file path, a glob pattern or a list of file paths. (templated)
+        Multiple files are loaded concurrently by max_workers workers, each on its own pooled connection.
+        Files ending with .gz, .zip (a single file) or .gpg are decompressed or decrypted as streams
+        while they are parsed, without writing the content to disk. Not supported with parallel_workers.
+    :type src_filepath: str or list
+    :param crypto_conn_id: Connection with the gpg key_file and options in extra and the key passphrase
+        as password, like for CryptographyOperator, to decrypt .gpg files.
+    :type crypto_conn_id: str
+    :param file_list_xcom_location: Task id to pull the list of files to load from XCom,
+        e.g. the files downloaded, unzipped or decrypted by a previous task. Overrides src_filepath.
+    :type file_list_xcom_location: str
+    :param max_workers: Number of files loaded concurrently. Default is 1.
+    :type max_workers: int
+    :param raise_on_error: Fail the task after all files are loaded when any file failed. Default is True.
+    :type raise_on_error: bool
     :param dest_mssql_conn_id: Destination MsSql connection.
     :type dest_mssql_conn_id: str
     :param dest_table: Destination table name
@@ -49,21 +106,72 @@ class CSVToMsSql(BaseOperator):
         Example: transformations={
             "RENAME:Billingcycle": "BillingCycle",
             "InstitutionID": 1042,
-            "AccountNumber": lambda row: row['AccountNumber'].strip(),
+            "AccountNumber": vectorized(lambda df: df['AccountNumber'].str.strip()),
             "CustomerName": lambda row: "{} {}".format(row["FirstName"].strip(), row["LastName"].strip()[:100]),
             "Address": lambda row: ctds.SqlVarChar(row["Address"].encode("utf-16le")),
             "FILTER:CheckEmpty": lambda row: row['AccountNumber'].strip() != ""}
+        Callables are called per row, unless marked with common.utils.etl_utils.vectorized
+        to be called once per chunk with the data frame.
     :type transformations: dict
     :param rows_chunk: Number of rows per chunk to commit.
     :type rows_chunk: int
+    :param row_format: 'dict' to insert rows as dictionaries mapped to columns by name,
+        or 'tuple' to insert rows as tuples ordered once by the destination table columns.
+        Columns of the destination table which are not in the transformed data are inserted as NULL
+        and other columns are left out.
+    :type row_format: str
     :param tablock: Table lock hint for fast inserts
     :type tablock: bool
+    :param schema: 'table' to take the column types from the destination table, or a declared schema as a dictionary
+        of SQL type names, converter callables or column dictionaries by column name,
+        e.g. {"Amount": "decimal", "OpenDate": "date", "Active": "bit"}.
+        Values of int, decimal, float, bit, date and datetime columns are converted to native Python types
+        after transformations, and inserted with their SQL types; empty values are inserted as NULL.
+        Transformations see the values as they are read, so FILTER transformations can drop rows such as trailers
+        which can not be converted. Columns are matched by their names after transformations, i.e. after RENAME,
+        like the destination table columns.
+        Other columns are read with dtype. Default None reads all columns with dtype.
+    :type schema: str or dict
+    :param date_formats: strptime formats tried in order to parse date and datetime columns of schema.
+        Default is ISO formats, see common.utils.etl_utils.DATE_FORMATS.
+    :type date_formats: list
+    :param reject_filepath: Quarantine rows which can not be loaded into this CSV file instead of failing the load,
+        with the reason in the last column RejectReason. (templated)
+        Rows are validated after transformations against schema, or the destination table schema if schema
+        is not set: NULL in NOT NULL columns and too long strings; with schema also values which can not
+        be converted. Chunks are bulk inserted as before and only a chunk which fails on the server is split
+        to isolate its failing rows. Reject counts by reason are pushed to XCom with key 'reject_summary'.
+    :type reject_filepath: str
+    :param max_rejects: Fail the task when more rows are rejected, as a count, or as a fraction
+        of the source rows when a float below 1. Default None is no limit.
+    :type max_rejects: int or float
+    :param engine: 'pandas' or 'pyarrow' to read the file with Arrow's multithreaded streaming CSV reader.
+        Record batches are inserted directly, or converted to data frames when there are transformations
+        or a schema.
+        widths, skipfooter and parallel_workers are not supported with pyarrow.
+    :type engine: str
+    :param block_size: Number of bytes read per record batch by the pyarrow engine.
+    :type block_size: int
+    :param parallel_workers: Number of worker processes which parse and transform the file in parallel,
+        while the rows are inserted by the operator process. The file is split into byte ranges
+        of parallel_chunk_bytes aligned to line breaks, so quoted fields must not contain line breaks.
+        skipfooter is not supported in this mode and transformations must return picklable values.
+        Default is 0 (no parallel parsing).
+    :type parallel_workers: int
+    :param parallel_chunk_bytes: Approximate size of the byte ranges parsed by the workers.
+    :type parallel_chunk_bytes: int
+    :param parallel_ordered: Insert parsed ranges in file order. If False, ranges are inserted as they are ready.
+    :type parallel_ordered: bool
+
+    Returns: total inserted rows, or for multiple files a dictionary with rows_total,
+        per file results (filepath, rows_total, error) and the list of failed files
+    :type int or dict
 
-    Returns: total inserted rows
-    :type int
+    Per-chunk transfer metrics are emitted through Airflow Stats and pushed to XCom with key 'transfer_stats'.
     """
 
-    template_fields = ('src_filepath', 'dest_preoperator', 'dest_preoperator_params', 'transformations_templated')
+    template_fields = ('src_filepath', 'dest_preoperator', 'dest_preoperator_params', 'transformations_templated',
+                       'file_list_xcom_location', 'reject_filepath')
     template_ext = ('.sql',)
     ui_color = '#d4f4d5'
 
@@ -88,6 +196,20 @@ class CSVToMsSql(BaseOperator):
             transformations=None,
             rows_chunk=5000,
             tablock=True,
+            row_format='dict',
+            parallel_workers=0,
+            parallel_chunk_bytes=64 * 1024 * 1024,
+            parallel_ordered=True,
+            engine='pandas',
+            block_size=16 * 1024 * 1024,
+            file_list_xcom_location=None,
+            max_workers=1,
+            raise_on_error=True,
+            crypto_conn_id=None,
+            schema=None,
+            date_formats=None,
+            reject_filepath=None,
+            max_rejects=None,
             *args, **kwargs):
         super(CSVToMsSql, self).__init__(*args, **kwargs)
         self.src_filepath = src_filepath
@@ -108,27 +230,147 @@ class CSVToMsSql(BaseOperator):
         self.transformations = transformations
         self.rows_chunk = rows_chunk
         self.tablock = tablock
+        self.row_format = row_format
+        if self.row_format not in ('dict', 'tuple'):
+            raise AirflowException('Invalid row_format {0}, expected dict or tuple'.format(row_format))
+        self.parallel_workers = parallel_workers
+        self.parallel_chunk_bytes = parallel_chunk_bytes
+        self.parallel_ordered = parallel_ordered
+        if self.parallel_workers and self.skipfooter:
+            raise AirflowException('skipfooter is not supported with parallel_workers')
+        self.engine = engine
+        self.block_size = block_size
+        if self.engine not in ('pandas', 'pyarrow'):
+            raise AirflowException('Invalid engine {0}, expected pandas or pyarrow'.format(engine))
+        if self.engine == 'pyarrow' and (self.widths or self.skipfooter or self.parallel_workers):
+            raise AirflowException('widths, skipfooter and parallel_workers are not supported with pyarrow engine')
+        self.file_list_xcom_location = file_list_xcom_location
+        self.max_workers = max_workers
+        self.raise_on_error = raise_on_error
+        if self.parallel_workers and self.max_workers > 1:
+            raise AirflowException('parallel_workers is not supported with max_workers > 1')
+        if self.parallel_workers and codecs.lookup(self.encoding).name.startswith(('utf-16', 'utf-32')):
+            raise AirflowException('Encoding {0} is not supported with parallel_workers'.format(encoding))
+        self.crypto_conn_id = crypto_conn_id
+        self._input_options = {}
+        self.schema = schema
+        self.date_formats = date_formats
+        self.reject_filepath = reject_filepath
+        self.max_rejects = max_rejects
+        self._schema = None
+        self._converters = {}
+        self._reject_file = None
 
-    def _apply_transformations(self, df):
-        """"Apply various transformations for each row on CSV data"""
+    def _transform_chunk(self, df, transformations, columns):
+        """Returns the records of a chunk and, with a reject file, their source rows after writing rejected rows"""
+        if self._reject_file is None:
+            return list(apply_transformations(df, transformations, columns, self._converters)), None
+
+        records, source, rejects = apply_transformations_with_rejects(
+            df, transformations, self._schema, self._converters, columns)
+        self._reject_file.reject(rejects, df.shape[0])
+        return records, source
+
+    def _insert(self, dest_conn, records, source):
+        """Bulk inserts records of a chunk, see bulk_insert_rejecting"""
+        return bulk_insert_rejecting(dest_conn, self.dest_table, records, source, self._reject_file,
+                                     tablock=self.tablock, batch_size=self.rows_chunk)
+
+    def _apply_transformations(self, df, stats, columns=None):
+        """"Apply various transformations for each row on CSV data and insert it chunk by chunk"""
         src_rows_total, dest_rows_total = 0, 0
         transformations = {**(self.transformations or {}), **(self.transformations_templated or {})}
 
         self.log.info("Applying transformations: {0}".format(transformations))
-        for chunk in df:
+        transformations = prepare_transformations(transformations)
+        for chunk in stats.iterate(df, 'fetch'):
             if not src_rows_total:
                 self.log.info("CSV field names: {0} ".format(chunk.columns.tolist()))
 
             src_rows_total = src_rows_total + chunk.shape[0]
-            for record in apply_transformations(chunk, transformations):
-                yield record
-                dest_rows_total = dest_rows_total + 1
+            with stats.timer('transform'):
+                records, source = self._transform_chunk(chunk, transformations, columns)
+            dest_rows_total = dest_rows_total + len(records)
+            yield records, source
 
-            self.log.info("Total inserted to {0} table: {1} rows".format(self.dest_table, dest_rows_total))
         self.log.info("Total filter out rows: {0}".format(src_rows_total - dest_rows_total))
 
-    def _execute(self, dest_hook):
-        args = {"filepath_or_buffer": self.src_filepath,
+    def _get_columns(self, dest_hook):
+        if self.row_format != 'tuple':
+            return None
+        columns = dest_hook.get_table_columns(self.dest_table)
+        self.log.info("Inserting rows as tuples of {0} columns: {1}".format(self.dest_table, columns))
+        return columns
+
+    def _arrow_column_types(self, names):
+        """Maps dtype to Arrow column types, str columns are read as strings without NULLs like na_filter=False"""
+        def arrow_type(t):
+            return pa.string() if t in (str, 'str', object) else pa.from_numpy_dtype(np.dtype(t))
+
+        if isinstance(self.dtype, dict):
+            return {name: arrow_type(t) for name, t in self.dtype.items()}
+        return {name: arrow_type(self.dtype) for name in names}
+
+    @staticmethod
+    def _batch_rows(batch, columns):
+        """Converts an Arrow record batch to rows as dictionaries, or tuples of columns in order"""
+        names = batch.schema.names
+        if columns is None:
+            return [dict(zip(names, row)) for row in zip(*[column.to_pylist() for column in batch.columns])]
+        values = [batch.column(names.index(c)).to_pylist() if c in names else [None] * batch.num_rows
+                  for c in columns]
+        return list(zip(*values))
+
+    def _execute_arrow(self, stats, filepath, get_dest_conn, columns):
+        names = self._read_header({"delimiter": self.delimiter,
+                                   "dtype": str,
+                                   "quotechar": self.quotechar,
+                                   "quoting": self.quoting,
+                                   "encoding": self.encoding}, filepath)
+        read_options = pa_csv.ReadOptions(use_threads=True,
+                                          block_size=self.block_size,
+                                          skip_rows=self.skiprows + (0 if self.names else 1),
+                                          column_names=names,
+                                          encoding=self.encoding)
+        parse_options = pa_csv.ParseOptions(delimiter=self.delimiter,
+                                            quote_char=False if self.quoting == csv.QUOTE_NONE else self.quotechar)
+        convert_options = pa_csv.ConvertOptions(column_types=self._arrow_column_types(names),
+                                                strings_can_be_null=False)
+        self.log.info("Reading data from CSV with pyarrow options: {0}, {1}, {2}".format(
+            read_options, parse_options, convert_options))
+        self.log.info("CSV field names: {0} ".format(names))
+
+        transformations = {**(self.transformations or {}), **(self.transformations_templated or {})}
+        self.log.info("Applying transformations: {0}".format(transformations))
+        transformations = prepare_transformations(transformations)
+
+        src_rows_total, rows_total = 0, 0
+        with open_input(filepath, **self._input_options) as f, get_dest_conn() as dest_conn:
+            reader = pa_csv.open_csv(f, read_options=read_options,
+                                     parse_options=parse_options, convert_options=convert_options)
+            for batch in stats.iterate(reader, 'fetch'):
+                src_rows_total = src_rows_total + batch.num_rows
+                with stats.timer('transform'):
+                    if transformations or self._converters or self._reject_file:
+                        records, source = self._transform_chunk(batch.to_pandas(), transformations, columns)
+                    else:
+                        records, source = self._batch_rows(batch, columns), None
+                with stats.timer('insert'):
+                    rows_total = rows_total + self._insert(dest_conn, records, source)
+                stats.add_chunk(records)
+                self.log.info("Total inserted to {0} table: {1} rows".format(self.dest_table, rows_total))
+
+        self.log.info("Total filter out rows: {0}".format(src_rows_total - rows_total))
+        self.log.info("Finished data transfer.")
+        return rows_total
+
+    def _execute(self, stats, filepath, get_dest_conn, columns):
+        if self.parallel_workers:
+            return self._execute_parallel(stats, filepath, get_dest_conn, columns)
+        if self.engine == 'pyarrow':
+            return self._execute_arrow(stats, filepath, get_dest_conn, columns)
+
+        args = {"filepath_or_buffer": filepath,
                 "delimiter": self.delimiter,
                 "header": None if self.names else 0,
                 "names": self.names,
@@ -145,22 +387,154 @@ class CSVToMsSql(BaseOperator):
         self.log.info("Reading data from CSV with options: {0} ".format(args))
         if self.widths:
             self.log.info("Field widths: {0} ".format(self.widths))
-            df = pd.read_fwf(**args, widths=self.widths)
-        else:
-            df = pd.read_csv(**args)
 
-        self.log.info("Transferring data from csv file {0} to table {1}".format(self.src_filepath, self.dest_table))
-        with dest_hook.get_ctds_conn() as dest_conn:
-            rows_total = dest_conn.bulk_insert(
-                table=self.dest_table,
-                rows=iter(self._apply_transformations(df)),
-                batch_size=self.rows_chunk,
-                tablock=self.tablock)
+        self.log.info("Transferring data from csv file {0} to table {1}".format(filepath, self.dest_table))
+        rows_total = 0
+        with ExitStack() as stack, get_dest_conn() as dest_conn:
+            if input_format(filepath):
+                self.log.info("Decompressing or decrypting {0} as a stream".format(filepath))
+                f = stack.enter_context(open_input(filepath, **self._input_options))
+                args['filepath_or_buffer'] = io.TextIOWrapper(f, encoding=self.encoding, newline='')
+            if self.widths:
+                df = pd.read_fwf(**args, widths=self.widths)
+            else:
+                df = pd.read_csv(**args)
+
+            for records, source in self._apply_transformations(df, stats, columns):
+                with stats.timer('insert'):
+                    rows_total = rows_total + self._insert(dest_conn, records, source)
+                stats.add_chunk(records)
+                self.log.info("Total inserted to {0} table: {1} rows".format(self.dest_table, rows_total))
 
         self.log.info("Finished data transfer.")
 
         return rows_total
 
+    def _read_header(self, args, filepath):
+        """Returns column names from the header line of the file, after skiprows lines"""
+        if self.names:
+            return self.names
+        with open_input(filepath, **self._input_options) as f:
+            for _ in range(self.skiprows):
+                f.readline()
+            header = f.readline()
+        header_args = dict(args, filepath_or_buffer=io.BytesIO(header), header=0, names=None)
+        if self.widths:
+            return pd.read_fwf(**header_args, widths=self.widths).columns.tolist()
+        return pd.read_csv(**header_args).columns.tolist()
+
+    def _execute_parallel(self, stats, filepath, get_dest_conn, columns):
+        if input_format(filepath):
+            raise AirflowException('Compressed or encrypted file {0} is not supported with parallel_workers'
+                                   .format(filepath))
+        args = {"delimiter": self.delimiter,
+                "header": None,
+                "dtype": self.dtype,
+                "quotechar": self.quotechar,
+                "quoting": self.quoting,
+                "encoding": self.encoding,
+                "na_filter": False}
+        args['names'] = self._read_header(args, filepath)
+        self.log.info("CSV field names: {0} ".format(args['names']))
+
+        ranges = split_lines(filepath, self.parallel_chunk_bytes,
+                             skip_lines=self.skiprows + (0 if self.names else 1))
+        self.log.info("Parsing {0} byte ranges of {1} with {2} workers".format(
+            len(ranges), filepath, self.parallel_workers))
+
+        transformations = {**(self.transformations or {}), **(self.transformations_templated or {})}
+        self.log.info("Applying transformations: {0}".format(transformations))
+        _parse_context.update(filepath=filepath, args=args, widths=self.widths, columns=columns,
+                              converters=self._converters, transformations=prepare_transformations(transformations),
+                              schema=self._schema, rejecting=self._reject_file is not None)
+
+        # bounds the parsed ranges waiting to be inserted
+        window = threading.Semaphore(self.parallel_workers * 2)
+        stop = threading.Event()
+
+        def tasks():
+            for i, (start, end) in enumerate(ranges):
+                while not window.acquire(timeout=1):
+                    if stop.is_set():
+                        return
+                yield i, start, end
+
+        src_rows_total, rows_total = 0, 0
+        try:
+            with multiprocessing.get_context('fork').Pool(self.parallel_workers) as pool:
+                try:
+                    if self.parallel_ordered:
+                        results = pool.imap(_parse_range, tasks())
+                    else:
+                        results = pool.imap_unordered(_parse_range, tasks())
+
+                    with get_dest_conn() as dest_conn:
+                        for i, src_rows, records, source, rejects in stats.iterate(results, 'fetch'):
+                            window.release()
+                            src_rows_total = src_rows_total + src_rows
+                            if rejects is not None:
+                                self._reject_file.reject(rejects, src_rows)
+                            with stats.timer('insert'):
+                                rows_total = rows_total + self._insert(dest_conn, records, source)
+                            stats.add_chunk(records)
+                            self.log.info("Range {0}: total inserted to {1} table: {2} rows".format(
+                                i, self.dest_table, rows_total))
+                finally:
+                    stop.set()
+        finally:
+            _parse_context.clear()
+
+        self.log.info("Total filter out rows: {0}".format(src_rows_total - rows_total))
+        self.log.info("Finished data transfer.")
+        return rows_total
+
+    def _get_files(self, context):
+        """Returns the list of files to load, or None for a single src_filepath. An empty list raises"""
+        if self.file_list_xcom_location:
+            files = context['task_instance'].xcom_pull(self.file_list_xcom_location)
+            files = [files] if isinstance(files, str) else list(files or [])
+            source = 'XCom of task {0}'.format(self.file_list_xcom_location)
+        elif isinstance(self.src_filepath, (list, tuple)):
+            files = list(self.src_filepath)
+            source = 'src_filepath'
+        elif any(c in self.src_filepath for c in '*?[') and not op.isfile(self.src_filepath):
+            files = sorted(glob.glob(self.src_filepath))
+            source = 'pattern {0}'.format(self.src_filepath)
+        else:
+            return None
+        if not files:
+            raise AirflowException('No files to load from {0}'.format(source))
+        return files
+
+    def _load_file(self, pool, filepath, columns):
+        """Loads one file of a multi-file load on a pooled connection, errors are returned in the result"""
+        stats = TransferStats('mssql_transfer.{0}.{1}'.format(self.dag_id, self.task_id), log=self.log)
+        result = {"filepath": filepath, "rows_total": 0, "error": None}
+        try:
+            self.log.info("Loading file {0}".format(filepath))
+            result['rows_total'] = self._execute(stats, filepath, pool.connection, columns)
+        except Exception as err:
+            self.log.error("Failed to load file {0}: {1}".format(filepath, str(err)))
+            result['error'] = str(err)
+        result['transfer_stats'] = stats.summary()
+        return result
+
+    def _execute_files(self, dest_hook, files, columns, context):
+        self.log.info("Loading {0} files with {1} workers: {2}".format(len(files), self.max_workers, files))
+        with dest_hook.get_conn_pool(self.max_workers, use_ctds=True) as pool, \
+                ThreadPoolExecutor(self.max_workers) as executor:
+            results = list(executor.map(lambda filepath: self._load_file(pool, filepath, columns), files))
+
+        context['task_instance'].xcom_push(key='transfer_stats',
+                                           value={r['filepath']: r.pop('transfer_stats') for r in results})
+        summary = {"rows_total": sum(r['rows_total'] for r in results),
+                   "files": results,
+                   "errors": [r['filepath'] for r in results if r['error']]}
+        self.log.info("Load summary: {0}".format(summary))
+        if summary['errors'] and self.raise_on_error:
+            raise AirflowException("Failed to load files: {0}".format(summary['errors']))
+        return summary
+
     def execute(self, context):
         dest_hook = MsSqlHook(mssql_conn_id=self.dest_mssql_conn_id)
 
@@ -170,4 +544,29 @@ class CSVToMsSql(BaseOperator):
                           parameters=self.dest_preoperator_params,
                           autocommit=True)
 
-        return self._execute(dest_hook)
+        if self.crypto_conn_id:
+            self._input_options = gpg_input_options(BaseHook.get_connection(self.crypto_conn_id), log=self.log)
+        self._schema, self._converters = resolve_schema(self.schema, dest_hook, self.dest_table, self.date_formats,
+                                                        validate=bool(self.reject_filepath))
+        if self._converters:
+            self.log.info("Converting columns to native types: {0}".format(sorted(self._converters)))
+        if self.reject_filepath:
+            self._reject_file = RejectFile(self.reject_filepath, sep=self.delimiter, max_rejects=self.max_rejects,
+                                           encoding=self.encoding, log=self.log)
+        columns = self._get_columns(dest_hook)
+        files = self._get_files(context)
+        try:
+            if files is not None:
+                result = self._execute_files(dest_hook, files, columns, context)
+            else:
+                stats = TransferStats('mssql_transfer.{0}.{1}'.format(self.dag_id, self.task_id), log=self.log)
+                result = self._execute(stats, self.src_filepath, dest_hook.get_ctds_conn, columns)
+                context['task_instance'].xcom_push(key='transfer_stats', value=stats.summary())
+        finally:
+            if self._reject_file is not None:
+                self.log.info("Reject summary: {0}".format(self._reject_file.summary()))
+                context['task_instance'].xcom_push(key='reject_summary', value=self._reject_file.summary())
+
+        if self._reject_file is not None:
+            self._reject_file.check()
+        return result
@@ -1,29 +1,60 @@
+from airflow.hooks.base_hook import BaseHook
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
+from airflow.exceptions import AirflowException
 
 from hooks._mssql_hook import MsSqlHook
-from common.utils.etl_utils import apply_transformations
+from common.utils.etl_utils import apply_transformations, apply_transformations_with_rejects, \
+    prepare_transformations, resolve_schema
+from common.utils.file_utils import gpg_input_options, input_format, open_input
+from common.utils.reject_file import RejectFile, bulk_insert_rejecting
+from common.utils.transfer_stats import TransferStats
+from common.utils.xlsx_utils import header_names, iter_sheet_rows
+from openpyxl import load_workbook
 
+import io
+import multiprocessing
+import os
 import pandas as pd
 
+# Operator and source workbook of the running multi-sheet load, inherited by forked sheet workers
+_load_context = {}
+
+
+def _load_sheet(sheet_name):
+    """Loads a sheet of a multi-sheet load in a worker process"""
+    return _load_context['operator']._load_sheet(_load_context['io_input'], sheet_name)
+
 
 class ExcelToMsSql(BaseOperator):
     """
     Transfers data from Excel file to MsSql table.
 
-    :param src_filepath: Source file path.
+    :param src_filepath: Source file path. Files ending with .gz, .zip (a single file) or .gpg are decompressed
+        or decrypted into memory without writing the content to disk, as the workbook is read with random access.
     :type src_filepath: str
+    :param crypto_conn_id: Connection with the gpg key_file and options in extra and the key passphrase
+        as password, like for CryptographyOperator, to decrypt .gpg files.
+    :type crypto_conn_id: str
     :param dest_mssql_conn_id: Destination MsSql connection.
     :type dest_mssql_conn_id: str
-    :param dest_table: Destination table name
-    :type dest_table: str
+    :param dest_table: Destination table name, or a dictionary of destination table names by sheet name
+        to load multiple sheets into their own tables.
+    :type dest_table: str or dict
     :param dest_preoperator: SQL query to execute against the destination before data transfer. (templated)
     :type dest_preoperator: str
     :param dest_preoperator_params: Parameters to use in destination preoperator sql query. (templated)
     :type dest_preoperator_params: dict
     :param sheet_name: Strings are used for sheet names. Integers are used in zero-indexed sheet positions.
-        Lists of strings/integers are used to request multiple sheets. Specify None to get all sheets.
+        Lists of strings/integers are used to request multiple sheets. Specify None to get all sheets,
+        or all sheets of the dest_table dictionary. Multiple sheets are parsed and inserted concurrently
+        by max_workers worker processes, each on its own connection, and require an xlsx file.
+        Use streaming so that each process only parses its own sheet.
     :type sheet_name: str, int, list, or None, default 0
+    :param max_workers: Number of sheets loaded concurrently. Default is the number of sheets, up to the CPU count.
+    :type max_workers: int
+    :param raise_on_error: Fail the task after all sheets are loaded when any sheet failed. Default is True.
+    :type raise_on_error: bool
     :param skiprows: Number of header rows to skip from input csv file. Default is 0.
     :type skiprows: int
     :param skipfooter: Number of footer rows to skip from input csv file. Default is 0.
@@ -41,21 +72,63 @@ class ExcelToMsSql(BaseOperator):
         Example: transformations={
             "RENAME:Billingcycle": "BillingCycle",
             "InstitutionID": 1042,
-            "AccountNumber": lambda row: row['AccountNumber'].strip(),
+            "AccountNumber": vectorized(lambda df: df['AccountNumber'].str.strip()),
             "CustomerName": lambda row: "{} {}".format(row["FirstName"].strip(), row["LastName"].strip()[:100]),
             "Address": lambda row: ctds.SqlVarChar(row["Address"].encode("utf-16le")),
             "FILTER:CheckEmpty": lambda row: row['AccountNumber'].strip() != ""}
+        Callables are called per row, unless marked with common.utils.etl_utils.vectorized
+        to be called once per chunk with the data frame.
     :type transformations: dict
     :param rows_chunk: Number of rows per chunk to commit.
     :type rows_chunk: int
+    :param row_format: 'dict' to insert rows as dictionaries mapped to columns by name,
+        or 'tuple' to insert rows as tuples ordered once by the destination table columns.
+        Columns of the destination table which are not in the transformed data are inserted as NULL
+        and other columns are left out.
+    :type row_format: str
     :param tablock: Table lock hint for fast inserts
     :type tablock: bool
+    :param schema: 'table' to take the column types from the destination table of each sheet,
+        or a declared schema as a dictionary of SQL type names, converter callables or column dictionaries
+        by column name,
+        e.g. {"Amount": "decimal", "OpenDate": "date", "Active": "bit"}.
+        Values of int, decimal, float, bit, date and datetime columns are converted to native Python types
+        after transformations, and inserted with their SQL types; empty values are inserted as NULL.
+        Transformations see the values as they are read, so FILTER transformations can drop rows such as trailers
+        which can not be converted. Columns are matched by their names after transformations, i.e. after RENAME,
+        like the destination table columns.
+        Other columns are read with dtype. Default None reads all columns with dtype.
+    :type schema: str or dict
+    :param date_formats: strptime formats tried in order to parse date and datetime columns of schema.
+        Default is ISO formats, see common.utils.etl_utils.DATE_FORMATS.
+    :type date_formats: list
+    :param reject_filepath: Quarantine rows which can not be loaded into this CSV file instead of failing the load,
+        with the reason in the last column RejectReason. (templated)
+        Rows are validated after transformations against schema, or the destination table schema if schema
+        is not set: NULL in NOT NULL columns and too long strings; with schema also values which can not
+        be converted. Chunks are bulk inserted as before and only a chunk which fails on the server is split
+        to isolate its failing rows. Reject counts by reason are pushed to XCom with key 'reject_summary',
+        for multiple sheets they are returned per sheet and the rows of each sheet are rejected to
+        reject_filepath with the sheet name before the extension, e.g. rejects.Accounts.csv.
+    :type reject_filepath: str
+    :param max_rejects: Fail the task (or the sheet) when more rows are rejected, as a count, or as a fraction
+        of the source rows when a float below 1. Default None is no limit.
+    :type max_rejects: int or float
+    :param streaming: Read the sheet row by row with openpyxl in read only mode and insert it chunk by chunk
+        of rows_chunk rows, instead of loading the whole sheet into a data frame. Memory use is bounded by the
+        chunk size and reading overlaps with inserting. Requires an xlsx file.
+        Types of columns which are not read as str are inferred per chunk.
+    :type streaming: bool
 
-    Returns: total inserted rows
-    :type int
+    Returns: total inserted rows, or for multiple sheets a dictionary with rows_total,
+        per sheet results (sheet_name, dest_table, rows_total, error) and the list of failed sheets
+    :type int or dict
+
+    Per-chunk transfer metrics are emitted through Airflow Stats and pushed to XCom with key 'transfer_stats'.
     """
 
-    template_fields = ('src_filepath', 'dest_preoperator', 'dest_preoperator_params', 'transformations_templated')
+    template_fields = ('src_filepath', 'dest_preoperator', 'dest_preoperator_params', 'transformations_templated',
+                       'reject_filepath')
     template_ext = ('.sql',)
     ui_color = '#d4f4d5'
 
@@ -76,6 +149,15 @@ class ExcelToMsSql(BaseOperator):
             transformations=None,
             rows_chunk=5000,
             tablock=True,
+            row_format='dict',
+            crypto_conn_id=None,
+            streaming=False,
+            max_workers=None,
+            raise_on_error=True,
+            schema=None,
+            date_formats=None,
+            reject_filepath=None,
+            max_rejects=None,
             *args, **kwargs):
         super(ExcelToMsSql, self).__init__(*args, **kwargs)
         self.src_filepath = src_filepath
@@ -92,25 +174,102 @@ class ExcelToMsSql(BaseOperator):
         self.transformations = transformations
         self.rows_chunk = rows_chunk
         self.tablock = tablock
+        self.row_format = row_format
+        if self.row_format not in ('dict', 'tuple'):
+            raise AirflowException('Invalid row_format {0}, expected dict or tuple'.format(row_format))
+        self.crypto_conn_id = crypto_conn_id
+        self.streaming = streaming
+        self.max_workers = max_workers
+        self.raise_on_error = raise_on_error
+        self.schema = schema
+        self.date_formats = date_formats
+        self.reject_filepath = reject_filepath
+        self.max_rejects = max_rejects
+
+    def _read_input(self):
+        """Returns the source file path, or the decompressed or decrypted workbook in memory"""
+        if not input_format(self.src_filepath):
+            return self.src_filepath
+        self.log.info("Decompressing or decrypting {0} into memory".format(self.src_filepath))
+        options = {}
+        if self.crypto_conn_id:
+            options = gpg_input_options(BaseHook.get_connection(self.crypto_conn_id), log=self.log)
+        with open_input(self.src_filepath, **options) as f:
+            return io.BytesIO(f.read())
 
-    def _apply_transformations(self, df):
-        """"Apply various transformations for each row on CSV data"""
-        dest_rows_total = 0
-        src_rows_total = df.shape[0]
+    def _apply_transformations(self, chunks, stats, columns=None, converters=None, schema=None, reject_file=None):
+        """"Apply various transformations for each row on chunks of Excel data"""
+        src_rows_total, dest_rows_total = 0, 0
         transformations = {**(self.transformations or {}), **(self.transformations_templated or {})}
 
         self.log.info("Applying transformations: {0}".format(transformations))
-        self.log.info("Excel field names: {0} ".format(df.columns.tolist()))
-        for record in apply_transformations(df, transformations):
-            dest_rows_total = dest_rows_total + 1
-            yield record
+        transformations = prepare_transformations(transformations)
+        for i, chunk in enumerate(chunks):
+            if not i:
+                self.log.info("Excel field names: {0} ".format(chunk.columns.tolist()))
+            src_rows_total = src_rows_total + chunk.shape[0]
+            with stats.timer('transform'):
+                if reject_file is None:
+                    records, source = list(apply_transformations(chunk, transformations, columns, converters)), None
+                else:
+                    records, source, rejects = apply_transformations_with_rejects(
+                        chunk, transformations, schema, converters, columns)
+                    reject_file.reject(rejects, chunk.shape[0])
+            dest_rows_total = dest_rows_total + len(records)
+            yield records, source
 
-        self.log.info("Total inserted to {0} table: {1} rows".format(self.dest_table, dest_rows_total))
         self.log.info("Total filter out rows: {0}".format(src_rows_total - dest_rows_total))
 
-    def _execute(self, dest_hook):
-        args = {"io": self.src_filepath,
-                "sheet_name": self.sheet_name,
+    def _chunk_frame(self, rows, names):
+        """
+        Builds a data frame of rows with dtype applied and empty cells as '' like read_excel(...).fillna('').
+        Types of columns without dtype, or with dtype object, are inferred from the rows of the chunk only.
+        """
+        rows = [row[:len(names)] + (None,) * (len(names) - len(row)) for row in rows]
+        # cell values are kept as read, so that they do not depend on the other rows of the chunk
+        df = pd.DataFrame(rows, columns=names, dtype=object)
+        dtypes = self.dtype if isinstance(self.dtype, dict) else dict.fromkeys(names, self.dtype)
+        for name in names:
+            dtype = dtypes.get(name)
+            if dtype is None or dtype is object:
+                df[name] = df[name].infer_objects()
+            elif dtype in (str, 'str'):
+                df[name] = ['' if value is None else str(value) for value in df[name]]
+            else:
+                df[name] = df[name].astype(dtype)
+        return df.fillna('')
+
+    def _read_chunks(self, io_input, sheet_name):
+        """Streams the sheet with openpyxl in read only mode and yields data frames of rows_chunk rows"""
+        workbook = load_workbook(io_input, read_only=True, data_only=True)
+        try:
+            if isinstance(sheet_name, int):
+                worksheet = workbook.worksheets[sheet_name]
+            else:
+                worksheet = workbook[sheet_name]
+
+            rows = iter_sheet_rows(worksheet, skiprows=self.skiprows, skipfooter=self.skipfooter)
+            names = self.names or header_names(next(rows, ()))
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= self.rows_chunk:
+                    yield self._chunk_frame(chunk, names)
+                    chunk = []
+            if chunk:
+                yield self._chunk_frame(chunk, names)
+        finally:
+            workbook.close()
+
+    def _get_chunks(self, stats, io_input, sheet_name):
+        """Returns data frames of rows_chunk rows of the sheet, streamed or sliced from the whole sheet"""
+        if self.streaming:
+            self.log.info("Streaming data from Excel file {0}, sheet {1} in chunks of {2} rows".format(
+                self.src_filepath, sheet_name, self.rows_chunk))
+            return stats.iterate(self._read_chunks(io_input, sheet_name), 'fetch')
+
+        args = {"io": io_input,
+                "sheet_name": sheet_name,
                 "header": None if self.names else 0,
                 "names": self.names,
                 "dtype": self.dtype,
@@ -120,20 +279,110 @@ class ExcelToMsSql(BaseOperator):
                 "na_values": ''}
 
         self.log.info("Reading data from Excel file with options: {0} ".format(args))
-        df = pd.read_excel(**args).fillna('')
+        with stats.timer('fetch'):
+            df = pd.read_excel(**args).fillna('')
+        return (df.iloc[start:start + self.rows_chunk].copy() for start in range(0, df.shape[0], self.rows_chunk))
+
+    def _get_dest_table(self, sheet_name):
+        if not isinstance(self.dest_table, dict):
+            return self.dest_table
+        if sheet_name not in self.dest_table:
+            raise AirflowException('No destination table for sheet {0} in dest_table'.format(sheet_name))
+        return self.dest_table[sheet_name]
 
+    def _execute(self, dest_hook, stats, io_input, sheet_name, dest_table, reject_file=None):
+        chunks = self._get_chunks(stats, io_input, sheet_name)
         self.log.info("Transferring data from excel file {0}, sheet {1} to table {2}".
-                      format(self.src_filepath, self.sheet_name, self.dest_table))
+                      format(self.src_filepath, sheet_name, dest_table))
+        columns = None
+        if self.row_format == 'tuple':
+            columns = dest_hook.get_table_columns(dest_table)
+            self.log.info("Inserting rows as tuples of {0} columns: {1}".format(dest_table, columns))
+        schema, converters = resolve_schema(self.schema, dest_hook, dest_table, self.date_formats,
+                                            validate=bool(self.reject_filepath))
+        if converters:
+            self.log.info("Converting columns to native types: {0}".format(sorted(converters)))
+
+        rows_total = 0
         with dest_hook.get_ctds_conn() as dest_conn:
-            rows_total = dest_conn.bulk_insert(
-                table=self.dest_table,
-                rows=iter(self._apply_transformations(df)),
-                batch_size=self.rows_chunk,
-                tablock=self.tablock)
+            for records, source in self._apply_transformations(chunks, stats, columns, converters, schema,
+                                                               reject_file):
+                with stats.timer('insert'):
+                    rows_total = rows_total + bulk_insert_rejecting(
+                        dest_conn, dest_table, records, source, reject_file, tablock=self.tablock,
+                        batch_size=self.rows_chunk)
+                stats.add_chunk(records)
+                self.log.info("Total inserted to {0} table: {1} rows".format(dest_table, rows_total))
 
         self.log.info("Finished data transfer.")
+        if reject_file is not None:
+            reject_file.check()
         return rows_total
 
+    def _get_sheets(self, io_input):
+        """Returns the names of the sheets to load, or None for a single sheet_name"""
+        if isinstance(self.sheet_name, (str, int)):
+            return None
+
+        workbook = load_workbook(io_input, read_only=True)
+        try:
+            sheet_names = workbook.sheetnames
+        finally:
+            workbook.close()
+
+        if self.sheet_name is None:
+            if isinstance(self.dest_table, dict):
+                return [name for name in sheet_names if name in self.dest_table]
+            return sheet_names
+        positions = [name for name in self.sheet_name if isinstance(name, int)]
+        if any(not -len(sheet_names) <= position < len(sheet_names) for position in positions):
+            raise AirflowException('Sheet positions {0} out of range of the {1} sheets of {2}'.format(
+                positions, len(sheet_names), self.src_filepath))
+        return [sheet_names[name] if isinstance(name, int) else name for name in self.sheet_name]
+
+    def _load_sheet(self, io_input, sheet_name):
+        """Loads one sheet of a multi-sheet load on its own connection, errors are returned in the result"""
+        stats = TransferStats('mssql_transfer.{0}.{1}'.format(self.dag_id, self.task_id), log=self.log)
+        result = {"sheet_name": sheet_name, "dest_table": None, "rows_total": 0, "error": None}
+        reject_file = None
+        if self.reject_filepath:
+            root, extension = os.path.splitext(self.reject_filepath)
+            reject_file = RejectFile('{0}.{1}{2}'.format(root, sheet_name, extension), max_rejects=self.max_rejects,
+                                     log=self.log)
+        try:
+            result['dest_table'] = self._get_dest_table(sheet_name)
+            dest_hook = MsSqlHook(mssql_conn_id=self.dest_mssql_conn_id)
+            result['rows_total'] = self._execute(dest_hook, stats, io_input, sheet_name, result['dest_table'],
+                                                 reject_file)
+        except Exception as err:
+            self.log.error("Failed to load sheet {0}: {1}".format(sheet_name, str(err)))
+            result['error'] = str(err)
+        result['transfer_stats'] = stats.summary()
+        if reject_file is not None:
+            result['rejects'] = reject_file.summary()
+        return result
+
+    def _execute_sheets(self, sheets, io_input, context):
+        max_workers = self.max_workers or min(len(sheets), os.cpu_count() or 1)
+        self.log.info("Loading {0} sheets with {1} workers: {2}".format(len(sheets), max_workers, sheets))
+
+        _load_context.update(operator=self, io_input=io_input)
+        try:
+            with multiprocessing.get_context('fork').Pool(max_workers) as pool:
+                results = pool.map(_load_sheet, sheets, chunksize=1)
+        finally:
+            _load_context.clear()
+
+        context['task_instance'].xcom_push(key='transfer_stats',
+                                           value={r['sheet_name']: r.pop('transfer_stats') for r in results})
+        summary = {"rows_total": sum(r['rows_total'] for r in results),
+                   "sheets": results,
+                   "errors": [r['sheet_name'] for r in results if r['error']]}
+        self.log.info("Load summary: {0}".format(summary))
+        if summary['errors'] and self.raise_on_error:
+            raise AirflowException("Failed to load sheets: {0}".format(summary['errors']))
+        return summary
+
     def execute(self, context):
         dest_hook = MsSqlHook(mssql_conn_id=self.dest_mssql_conn_id)
 
@@ -143,4 +392,21 @@ class ExcelToMsSql(BaseOperator):
                           parameters=self.dest_preoperator_params,
                           autocommit=True)
 
-        return self._execute(dest_hook)
+        io_input = self._read_input()
+        sheets = self._get_sheets(io_input)
+        if sheets is not None:
+            return self._execute_sheets(sheets, io_input, context)
+
+        stats = TransferStats('mssql_transfer.{0}.{1}'.format(self.dag_id, self.task_id), log=self.log)
+        reject_file = None
+        if self.reject_filepath:
+            reject_file = RejectFile(self.reject_filepath, max_rejects=self.max_rejects, log=self.log)
+        try:
+            rows_total = self._execute(dest_hook, stats, io_input, self.sheet_name,
+                                       self._get_dest_table(self.sheet_name), reject_file)
+        finally:
+            if reject_file is not None:
+                self.log.info("Reject summary: {0}".format(reject_file.summary()))
+                context['task_instance'].xcom_push(key='reject_summary', value=reject_file.summary())
+        context['task_instance'].xcom_push(key='transfer_stats', value=stats.summary())
+        return rows_total
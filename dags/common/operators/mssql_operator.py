@@ -1,18 +1,125 @@
 from airflow.operators.mssql_operator import MsSqlOperator
+from airflow.exceptions import AirflowException
 from airflow.models import BaseOperator
+from airflow.stats import Stats
 from airflow.utils.decorators import apply_defaults
 from common.hooks._mssql_hook import MsSqlHook
+from common.utils.query_cache import QueryCache
+from common.utils.transfer_stats import approximate_size
+from common.utils.xcom_utils import spill_records
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+
+import os.path as op
+import time
 
 
 class MsSqlOperator(MsSqlOperator):
     """
-    Extend MsSqlOperator with modified templated fields.
+    Extend MsSqlOperator with modified templated fields and parallel statement batches.
+
+    :param profile_statistics: Run the sql with SET STATISTICS IO, TIME ON and log per statement
+        logical reads, CPU and elapsed time. Statistics are pushed to XCom with key 'sql_statistics'.
+        Not supported with max_parallel > 1 or with dictionary statements.
+    :type profile_statistics: bool
+    :param plan_path: Directory to save the actual XML execution plans of profiled statements, e.g. data_path.
+    :type plan_path: str
+    :param max_parallel: Maximum number of statements from a list of sql statements to run concurrently,
+        each on its own pooled connection. Statements are items of sql as a string or a dictionary with
+        an optional dependency group. Groups run in ascending order, statements of a group run concurrently.
+        Statements without group belong to group 0.
+        Example: sql=[{"sql": "rebuild_summary_a.sql", "group": 1},
+                      {"sql": "rebuild_summary_b.sql", "group": 1},
+                      {"sql": "rebuild_totals.sql", "group": 2}]
+        Per statement timings and row counts are logged and returned.
+    :type max_parallel: int
     """
 
     template_fields = ('sql', 'parameters')
     template_ext = ('.sql',)
     ui_color = '#f9a75e'
 
+    @apply_defaults
+    def __init__(
+            self,
+            profile_statistics=False,
+            plan_path=None,
+            max_parallel=1,
+            *args, **kwargs):
+        super(MsSqlOperator, self).__init__(*args, **kwargs)
+        self.profile_statistics = profile_statistics
+        self.plan_path = plan_path
+        self.max_parallel = max_parallel
+        if self.profile_statistics and (self.max_parallel > 1 or self._is_batch()):
+            raise AirflowException('profile_statistics is not supported with max_parallel > 1 or dictionary statements')
+
+    def _is_batch(self):
+        """Returns True when sql is a list of statements run by _execute_batch."""
+        return isinstance(self.sql, (list, tuple)) and \
+            (self.max_parallel > 1 or any(isinstance(statement, dict) for statement in self.sql))
+
+    def _run_statement(self, hook, pool, sql):
+        """Runs a statement on a pooled connection, returns affected rows and elapsed seconds."""
+        with pool.connection() as conn:
+            start = time.monotonic()
+            hook.set_autocommit(conn, self.autocommit)
+            with closing(conn.cursor()) as cur:
+                if self.parameters is not None:
+                    cur.execute(sql, self.parameters)
+                else:
+                    cur.execute(sql)
+                rows = cur.rowcount
+            if not self.autocommit:
+                conn.commit()
+        return rows, time.monotonic() - start
+
+    def _execute_batch(self, hook):
+        groups = {}
+        for i, statement in enumerate(self.sql):
+            if isinstance(statement, dict):
+                groups.setdefault(statement.get('group', 0), []).append((i, statement['sql']))
+            else:
+                groups.setdefault(0, []).append((i, statement))
+
+        results = []
+        with hook.get_conn_pool(self.max_parallel) as pool, ThreadPoolExecutor(self.max_parallel) as executor:
+            for group in sorted(groups):
+                self.log.info('Running group {0}: {1} statements'.format(group, len(groups[group])))
+                futures = {executor.submit(self._run_statement, hook, pool, sql): (i, sql)
+                           for i, sql in groups[group]}
+                errors = []
+                for future in as_completed(futures):
+                    i, sql = futures[future]
+                    try:
+                        rows, elapsed = future.result()
+                    except Exception as err:
+                        self.log.error('Statement {0} failed: {1}\n{2}'.format(i, str(err), sql))
+                        errors.append(i)
+                        continue
+
+                    self.log.info('Statement {0} (group {1}): {2} rows in {3:.3f} s'.format(i, group, rows, elapsed))
+                    results.append({"statement": i, "group": group, "rows": rows, "elapsed_time": round(elapsed, 3)})
+
+                if errors:
+                    raise AirflowException('Failed statements {0} in group {1}'.format(sorted(errors), group))
+
+        return sorted(results, key=lambda result: result['statement'])
+
+    def execute(self, context):
+        self.log.info('Executing: %s', self.sql)
+        hook = MsSqlHook(mssql_conn_id=self.mssql_conn_id,
+                         schema=self.database,
+                         profile_statistics=self.profile_statistics,
+                         plan_path=self.plan_path)
+
+        if self._is_batch():
+            return self._execute_batch(hook)
+
+        hook.run(self.sql, autocommit=self.autocommit, parameters=self.parameters)
+
+        if self.profile_statistics:
+            context['task_instance'].xcom_push(key='sql_statistics', value=hook.statistics)
+
 
 class MsSqlGetRecordsOperator(BaseOperator):
     """
@@ -30,9 +137,31 @@ class MsSqlGetRecordsOperator(BaseOperator):
     :type is_dict_result_set: bool
     :param is_single_row_result_set: set true if the expected result set is a single row else set false
     :type is_single_row_result_set: bool
+    :param profile_statistics: Run the sql with SET STATISTICS IO, TIME ON and log logical reads,
+        CPU and elapsed time. Statistics are pushed to XCom with key 'sql_statistics'.
+    :type profile_statistics: bool
+    :param plan_path: Directory to save the actual XML execution plan of the profiled sql, e.g. data_path.
+    :type plan_path: str
+    :param spill_threshold_bytes: Result sets larger than this approximate size are written to a columnar file
+        in spill_path and only a small reference is returned as XCom value.
+        Use common.utils.xcom_utils.load_result in downstream tasks to read it lazily. Default is never to spill.
+    :type spill_threshold_bytes: int
+    :param spill_path: Local directory (e.g. data_path) or s3://bucket/prefix for spilled result sets.
+    :type spill_path: str
+    :param spill_format: 'parquet' or 'arrow' (Arrow IPC file). Default is 'parquet'.
+    :type spill_format: str
+    :param aws_conn_id: AWS connection used when spill_path or cache_path is on S3
+    :type aws_conn_id: str
+    :param cache_ttl: Number of seconds to reuse the cached result set of the same rendered sql, parameters,
+        connection and result format. Default is no caching.
+    :type cache_ttl: int
+    :param cache_path: Local directory (e.g. data_path) or s3://bucket/prefix for cached result sets.
+    :type cache_path: str
+    :param cache_invalidate: Remove the cached result set and query the database. (templated)
+    :type cache_invalidate: bool
     """
 
-    template_fields = ('sql', 'parameters')
+    template_fields = ('sql', 'parameters', 'cache_invalidate')
     template_ext = ('.sql',)
     ui_color = '#a9d89c'
 
@@ -45,20 +174,56 @@ class MsSqlGetRecordsOperator(BaseOperator):
             database=None,
             is_dict_result_set=True,
             is_single_row_result_set=False,
+            profile_statistics=False,
+            plan_path=None,
+            spill_threshold_bytes=None,
+            spill_path=None,
+            spill_format='parquet',
+            aws_conn_id='aws_default',
+            cache_ttl=None,
+            cache_path=None,
+            cache_invalidate=False,
             *args, **kwargs):
         super(MsSqlGetRecordsOperator, self).__init__(*args, **kwargs)
+        if spill_threshold_bytes is not None and not spill_path:
+            raise AirflowException('spill_path is required with spill_threshold_bytes')
         self.mssql_conn_id = mssql_conn_id
         self.sql = sql
         self.parameters = parameters
         self.database = database
         self.is_dict_result_set = is_dict_result_set
         self.is_single_row_result_set = is_single_row_result_set
+        self.profile_statistics = profile_statistics
+        self.plan_path = plan_path
+        self.spill_threshold_bytes = spill_threshold_bytes
+        self.spill_path = spill_path
+        self.spill_format = spill_format
+        self.aws_conn_id = aws_conn_id
+        self.cache_ttl = cache_ttl
+        self.cache_path = cache_path
+        self.cache_invalidate = cache_invalidate
 
-    def execute(self, context):
-        self.log.info('Running: {0} with params: {1}'.format(self.sql, self.parameters))
-        hook = MsSqlHook(mssql_conn_id=self.mssql_conn_id,
-                                schema=self.database)
+    def _spill(self, result, context):
+        """Writes a large result set to a file and returns the reference to it, else returns the result set"""
+        if self.spill_threshold_bytes is None or self.is_single_row_result_set or not result:
+            return result
+
+        size = approximate_size(result)
+        if size <= self.spill_threshold_bytes:
+            return result
+
+        filename = '{0}_{1}_{2}{3}'.format(self.dag_id, self.task_id, context['ts_nodash'],
+                                           '.parquet' if self.spill_format == 'parquet' else '.arrow')
+        if self.spill_path.startswith('s3://'):
+            filepath = '{0}/{1}'.format(self.spill_path.rstrip('/'), filename)
+        else:
+            filepath = op.join(self.spill_path, filename)
+
+        self.log.info('Result set of {0} rows (~{1} bytes) exceeds spill threshold, writing to {2}'
+                      .format(len(result), size, filepath))
+        return spill_records(result, filepath, file_format=self.spill_format, aws_conn_id=self.aws_conn_id)
 
+    def _get_result(self, hook):
         if self.is_dict_result_set:
             if self.is_single_row_result_set:
                 result = hook.get_first_dict(sql=self.sql,
@@ -74,3 +239,34 @@ class MsSqlGetRecordsOperator(BaseOperator):
                 result = hook.get_records(sql=self.sql,
                                           parameters=self.parameters)
         return result
+
+    def execute(self, context):
+        self.log.info('Running: {0} with params: {1}'.format(self.sql, self.parameters))
+        hook = MsSqlHook(mssql_conn_id=self.mssql_conn_id,
+                         schema=self.database,
+                         profile_statistics=self.profile_statistics,
+                         plan_path=self.plan_path)
+
+        if self.cache_ttl is None:
+            result = self._get_result(hook)
+        else:
+            cache = QueryCache(self.cache_path, self.cache_ttl, aws_conn_id=self.aws_conn_id)
+            cache_key = QueryCache.make_key(self.sql, self.parameters, self.mssql_conn_id, self.database,
+                                            self.is_dict_result_set, self.is_single_row_result_set)
+            if self.cache_invalidate in (True, 'True', 'true'):
+                self.log.info('Invalidating cached result {0}'.format(cache_key))
+                cache.invalidate(cache_key)
+
+            hit, result = cache.get(cache_key)
+            if hit:
+                self.log.info('Cache hit: {0}'.format(cache_key))
+                Stats.incr('mssql_get_records.cache_hit')
+            else:
+                self.log.info('Cache miss: {0}'.format(cache_key))
+                Stats.incr('mssql_get_records.cache_miss')
+                result = self._get_result(hook)
+                cache.set(cache_key, result)
+
+        if self.profile_statistics:
+            context['task_instance'].xcom_push(key='sql_statistics', value=hook.statistics)
+        return self._spill(result, context)
@@ -1,6 +1,40 @@
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
 from airflow.hooks.mssql_hook import MsSqlHook
+from airflow.exceptions import AirflowException
+from common.utils.file_utils import open_output
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from decimal import Decimal, localcontext
+
+import csv
+import io
+import os
+import os.path as op
+import shutil
+
+COMPRESSION_EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def _range_bounds(low, high, partitions):
+    """
+    Returns the partitions + 1 literals splitting low to high into equal ranges, with the type of the column,
+    so that SQL Server compares them without converting the column: integers for integer columns,
+    decimals rounded to the scale of low and high for decimal columns and floats for float columns.
+    """
+    if isinstance(low, int) and not isinstance(low, bool):
+        bounds = [low + (high - low) * i // partitions for i in range(partitions)]
+    elif isinstance(low, Decimal):
+        exponent = Decimal(1).scaleb(min(low.as_tuple().exponent, high.as_tuple().exponent, 0))
+        with localcontext() as ctx:
+            ctx.prec = 76
+            bounds = [(low + (high - low) * i / partitions).quantize(exponent) for i in range(partitions)]
+    elif isinstance(low, float):
+        bounds = [low + (high - low) / partitions * i for i in range(partitions)]
+    else:
+        raise AirflowException('Range partitions need an integer, decimal or float partition_column, '
+                               'MIN and MAX are {0}'.format(type(low).__name__))
+    return ['{0:f}'.format(bound) if isinstance(bound, Decimal) else str(bound) for bound in bounds + [high]]
 
 
 class MsSqlToCSV(BaseOperator):
@@ -18,12 +52,38 @@ class MsSqlToCSV(BaseOperator):
     :param sep: default ','
             Field delimiter for the output file.
     :type sep: character
+    :param streaming: Write rows to the file as they are fetched from the cursor with constant memory,
+        instead of loading the whole result into a pandas data frame.
+        A summary with rows and bytes written is pushed to XCom with key 'export_summary'.
+    :type streaming: bool
+    :param compression: Streaming output compression: None, 'gzip' or 'zstd'.
+    :type compression: str
+    :param rows_chunk: Number of rows fetched from the cursor per write in streaming mode.
+    :type rows_chunk: int
+    :param encoding: Output file encoding in streaming mode.
+    :type encoding: str
+    :param partition_column: Column of source_sql used to split the export into partitions,
+        which are streamed concurrently on their own connections into destination_filepath directory
+        as part-00000.csv, part-00001.csv, ... source_sql must be valid as a derived table (no ORDER BY).
+        Rows with NULL partition_column are exported in the first partition.
+    :type partition_column: str
+    :param partitions: Number of partitions. Default is 1 (no partitioning).
+    :type partitions: int
+    :param partition_mode: 'modulo' to split by partition_column modulo partitions (integer column)
+        or 'range' to split the MIN to MAX range of partition_column into equal ranges
+        (integer, decimal or float column).
+    :type partition_mode: str
+    :param max_parallel: Maximum number of partitions exported concurrently. Default is partitions.
+    :type max_parallel: int
+    :param concat_filepath: Concatenate partitions in order into this file. Partition files after the first
+        are then written without header, so that they can be concatenated byte by byte, also when compressed.
+    :type concat_filepath: str
 
     Returns: rows_total
     :type int
     """
 
-    template_fields = ('source_sql', 'source_sql_params', 'destination_filepath')
+    template_fields = ('source_sql', 'source_sql_params', 'destination_filepath', 'concat_filepath')
     template_ext = ('.sql',)
     ui_color = '#d4f4d5'
 
@@ -35,6 +95,15 @@ class MsSqlToCSV(BaseOperator):
             source_sql,
             source_sql_params=None,
             sep=",",
+            streaming=False,
+            compression=None,
+            rows_chunk=10000,
+            encoding='utf-8',
+            partition_column=None,
+            partitions=1,
+            partition_mode='modulo',
+            max_parallel=None,
+            concat_filepath=None,
             *args, **kwargs):
         super(MsSqlToCSV, self).__init__(*args, **kwargs)
         if source_sql_params is None:
@@ -44,12 +113,131 @@ class MsSqlToCSV(BaseOperator):
         self.source_sql = source_sql
         self.source_sql_params = source_sql_params
         self.sep = sep
+        self.streaming = streaming
+        self.compression = compression
+        self.rows_chunk = rows_chunk
+        self.encoding = encoding
+        self.partition_column = partition_column
+        self.partitions = partitions
+        self.partition_mode = partition_mode
+        self.max_parallel = max_parallel or partitions
+        self.concat_filepath = concat_filepath
+        if self.partition_mode not in ('modulo', 'range'):
+            raise AirflowException('Invalid partition_mode {0}, expected modulo or range'.format(partition_mode))
+
+    def _export(self, conn, sql, filepath, write_header=True):
+        """
+        Streams the result of sql to a csv file chunk by chunk.
+        Returns the number of rows and uncompressed bytes written.
+        """
+        rows_total, bytes_total = 0, 0
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=self.sep, lineterminator='\n')
+
+        with closing(conn.cursor()) as cursor, open_output(filepath, self.compression) as f:
+            cursor.execute(sql, self.source_sql_params)
+            if write_header:
+                writer.writerow([column[0] for column in cursor.description])
+
+            rows = cursor.fetchmany(self.rows_chunk)
+            while True:
+                writer.writerows(rows)
+                data = buffer.getvalue().encode(self.encoding)
+                buffer.seek(0)
+                buffer.truncate()
+                f.write(data)
+                bytes_total = bytes_total + len(data)
+
+                if not rows:
+                    break
+                rows_total = rows_total + len(rows)
+                self.log.info("Total written to {0}: {1} rows".format(filepath, rows_total))
+                rows = cursor.fetchmany(self.rows_chunk)
+
+        return rows_total, bytes_total
+
+    def _execute_streaming(self, src_mssql_hook, context):
+        self.log.info("Streaming data to {0}.".format(self.destination_filepath))
+        with closing(src_mssql_hook.get_conn()) as conn:
+            rows_total, bytes_total = self._export(conn, self.source_sql, self.destination_filepath)
+
+        summary = {"filepath": self.destination_filepath,
+                   "rows_total": rows_total,
+                   "bytes_total": bytes_total,
+                   "bytes_written": op.getsize(self.destination_filepath)}
+        self.log.info("Export summary: {0}".format(summary))
+        context['task_instance'].xcom_push(key='export_summary', value=summary)
+        return rows_total
+
+    def _get_partition_filters(self, src_mssql_hook):
+        """Returns a WHERE condition on the partition column for each partition"""
+        column = 'partition_src.[{0}]'.format(self.partition_column)
+        if self.partition_mode == 'modulo':
+            # pymssql substitutes parameters with % formatting, so % has to be escaped when there are parameters
+            modulo = '%%' if self.source_sql_params else '%'
+            filters = ['ABS(CAST({0} AS BIGINT) {1} {2}) = {3}'.format(column, modulo, self.partitions, i)
+                       for i in range(self.partitions)]
+        else:
+            low, high = src_mssql_hook.get_first(
+                sql='SELECT MIN({0}), MAX({0}) FROM ({1}) AS partition_src'.format(column, self.source_sql),
+                parameters=self.source_sql_params or None)
+            if low is None:
+                return ['{0} IS NULL'.format(column)]
+            bounds = _range_bounds(low, high, self.partitions)
+            filters = ['{0} >= {1} AND {0} {2} {3}'.format(column, bounds[i],
+                                                           '<=' if i == self.partitions - 1 else '<', bounds[i + 1])
+                       for i in range(self.partitions)]
+
+        filters[0] = '({0} OR {1} IS NULL)'.format(filters[0], column)
+        return filters
+
+    def _export_partition(self, src_mssql_hook, partition, partition_filter):
+        filepath = op.join(self.destination_filepath, 'part-{0:05d}.csv{1}'.format(
+            partition, COMPRESSION_EXTENSIONS[self.compression]))
+        sql = 'SELECT * FROM ({0}) AS partition_src WHERE {1}'.format(self.source_sql, partition_filter)
+        write_header = partition == 0 or self.concat_filepath is None
+
+        self.log.info("Exporting partition {0} to {1}".format(partition, filepath))
+        with closing(src_mssql_hook.get_conn()) as conn:
+            rows_total, bytes_total = self._export(conn, sql, filepath, write_header=write_header)
+        return {"filepath": filepath,
+                "rows_total": rows_total,
+                "bytes_total": bytes_total,
+                "bytes_written": op.getsize(filepath)}
+
+    def _execute_partitioned(self, src_mssql_hook, context):
+        os.makedirs(self.destination_filepath, exist_ok=True)
+        filters = self._get_partition_filters(src_mssql_hook)
+
+        with ThreadPoolExecutor(self.max_parallel) as executor:
+            parts = list(executor.map(lambda args: self._export_partition(src_mssql_hook, *args), enumerate(filters)))
+
+        summary = {"partitions": parts,
+                   "rows_total": sum(part['rows_total'] for part in parts),
+                   "bytes_total": sum(part['bytes_total'] for part in parts)}
+
+        if self.concat_filepath:
+            self.log.info("Concatenating {0} partitions to {1}".format(len(parts), self.concat_filepath))
+            with open(self.concat_filepath, 'wb') as dest:
+                for part in parts:
+                    with open(part['filepath'], 'rb') as src:
+                        shutil.copyfileobj(src, dest)
+            summary['filepath'] = self.concat_filepath
+
+        self.log.info("Export summary: {0}".format(summary))
+        context['task_instance'].xcom_push(key='export_summary', value=summary)
+        return summary['rows_total']
 
     def execute(self, context):
         self.log.info("Querying data from source: {0}".format(
             self.mssql_source_conn_id))
 
         src_mssql_hook = MsSqlHook(mssql_conn_id=self.mssql_source_conn_id)
+        if self.partition_column and self.partitions > 1:
+            return self._execute_partitioned(src_mssql_hook, context)
+        if self.streaming:
+            return self._execute_streaming(src_mssql_hook, context)
+
         df = src_mssql_hook.get_pandas_df(sql=self.source_sql,
                                           parameters=self.source_sql_params)
         rows_total = df.shape[0]
@@ -59,4 +247,4 @@ class MsSqlToCSV(BaseOperator):
 
         self.log.info("Total inserted to file: {0} rows".format(rows_total))
 
-        return rows_total
\ No newline at end of file
+        return rows_total
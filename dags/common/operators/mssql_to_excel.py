@@ -1,11 +1,19 @@
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
 from airflow.hooks.mssql_hook import MsSqlHook
+from airflow.exceptions import AirflowException
+from common.hooks.mssql_hook import MsSqlConnectionPool
+from common.utils.xlsx_utils import StreamingSheetWriter, STREAMING_WORKBOOK_OPTIONS, append_sheet
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from openpyxl import load_workbook
 from os import path
 
 import pandas as pd
 import pandas.io.formats.excel
+import queue
+import threading
+import xlsxwriter
 
 
 class MsSqlToExcel(BaseOperator):
@@ -28,6 +36,21 @@ class MsSqlToExcel(BaseOperator):
         overwrite - creates a new file on top of existing
         append_tab - adds a spreadsheet in an existing document.
     :type write_mode: str
+    :param streaming: Write rows straight from the cursor with xlsxwriter constant_memory mode
+        instead of building a pandas data frame. When a sheet reaches Excel limit of 1,048,576 rows,
+        the rows continue in a new sheet 'sheet_name (2)', ... with the same header.
+        With write_mode 'append_tab' on an existing file the sheet is added to the xlsx zip container
+        without loading the workbook: only the workbook, relationships and content types parts are rewritten
+        and the existing sheets are copied unchanged. Such sheets have no header format and dates are written
+        as ISO strings, because the workbook styles are not modified.
+    :type streaming: bool
+    :param rows_chunk: Number of rows fetched from the cursor at a time in streaming mode.
+    :type rows_chunk: int
+    :param header_format: xlsxwriter format properties of the header row in streaming mode, e.g. {"bold": True}
+    :type header_format: dict
+
+    Returns: rows_total
+    :type int
     """
 
     template_fields = ('source_sql', 'source_sql_params', 'destination_filepath', 'sheet_name')
@@ -44,6 +67,9 @@ class MsSqlToExcel(BaseOperator):
             sheet_name=None,
             excel_engine='xlsxwriter',
             write_mode='overwrite',
+            streaming=False,
+            rows_chunk=10000,
+            header_format=None,
             *args, **kwargs):
         super(MsSqlToExcel, self).__init__(*args, **kwargs)
         if source_sql_params is None:
@@ -55,12 +81,73 @@ class MsSqlToExcel(BaseOperator):
         self.sheet_name = sheet_name
         self.excel_engine = excel_engine
         self.write_mode = write_mode
+        self.streaming = streaming
+        self.rows_chunk = rows_chunk
+        self.header_format = header_format
+
+    def _write_sheet(self, conn, workbook):
+        """Streams the query result into a sheet of an xlsxwriter workbook, returns the sheet writer"""
+        with closing(conn.cursor()) as cursor:
+            cursor.execute(self.source_sql, self.source_sql_params)
+            sheet_writer = StreamingSheetWriter(workbook,
+                                                self.sheet_name or 'Sheet1',
+                                                [column[0] for column in cursor.description],
+                                                header_format=self.header_format)
+
+            rows = cursor.fetchmany(self.rows_chunk)
+            while rows:
+                sheet_writer.write_rows(rows)
+                self.log.info("Total written to {0}: {1} rows".format(self.destination_filepath,
+                                                                      sheet_writer.rows_total))
+                rows = cursor.fetchmany(self.rows_chunk)
+            sheet_writer.close()
+        return sheet_writer
+
+    def _execute_streaming(self, src_mssql_hook):
+        self.log.info("Streaming data to {0}.".format(self.destination_filepath))
+        workbook = xlsxwriter.Workbook(self.destination_filepath, STREAMING_WORKBOOK_OPTIONS)
+        try:
+            with closing(src_mssql_hook.get_conn()) as conn:
+                sheet_writer = self._write_sheet(conn, workbook)
+        finally:
+            workbook.close()
+
+        self.log.info("Total inserted to file: {0} rows in sheets {1}".format(sheet_writer.rows_total,
+                                                                              sheet_writer.sheet_names))
+        return sheet_writer.rows_total
+
+    def _iter_rows(self, cursor):
+        rows = cursor.fetchmany(self.rows_chunk)
+        rows_total = 0
+        while rows:
+            for row in rows:
+                yield row
+            rows_total = rows_total + len(rows)
+            self.log.info("Total written to {0}: {1} rows".format(self.destination_filepath, rows_total))
+            rows = cursor.fetchmany(self.rows_chunk)
+
+    def _execute_append_streaming(self, src_mssql_hook):
+        self.log.info("Appending sheet to {0}.".format(self.destination_filepath))
+        with closing(src_mssql_hook.get_conn()) as conn, closing(conn.cursor()) as cursor:
+            cursor.execute(self.source_sql, self.source_sql_params)
+            sheet_names, rows_total = append_sheet(self.destination_filepath,
+                                                   self.sheet_name or 'Sheet1',
+                                                   self._iter_rows(cursor),
+                                                   header=[column[0] for column in cursor.description])
+
+        self.log.info("Total inserted to file: {0} rows in sheets {1}".format(rows_total, sheet_names))
+        return rows_total
 
     def execute(self, context):
         self.log.info("Querying data from source: {0}".format(
             self.mssql_source_conn_id))
 
         src_mssql_hook = MsSqlHook(mssql_conn_id=self.mssql_source_conn_id)
+        if self.streaming:
+            if self.write_mode == 'append_tab' and path.isfile(self.destination_filepath):
+                return self._execute_append_streaming(src_mssql_hook)
+            return self._execute_streaming(src_mssql_hook)
+
         df = src_mssql_hook.get_pandas_df(sql=self.source_sql,
                                           parameters=self.source_sql_params)
         rows_total = df.shape[0]
@@ -78,3 +165,138 @@ class MsSqlToExcel(BaseOperator):
         writer.save()
 
         self.log.info("Total inserted to file: {0} rows".format(rows_total))
+        return rows_total
+
+
+class MsSqlToExcelReport(BaseOperator):
+    """
+    Writes the results of several MsSql queries to sheets of one Excel file.
+    Queries run concurrently on pooled connections and their rows are streamed through bounded queues
+    into xlsxwriter constant_memory sheets, in the order of the sheets mapping. The workbook is written once.
+    :param destination_filepath: destination file path.
+    :type destination_filepath: str
+    :param mssql_source_conn_id: source MsSql connection.
+    :type mssql_source_conn_id: str
+    :param sheets: Mapping of sheet name to SQL query or .sql file. (templated)
+        Example: sheets=OrderedDict([("Summary", "summary.sql"), ("Details", "SELECT * FROM dbo.Details")])
+    :type sheets: dict
+    :param source_sql_params: Parameters to use in all sql queries. (templated)
+    :type source_sql_params: dict
+    :param max_parallel: Maximum number of queries running concurrently. Default is the number of sheets.
+    :type max_parallel: int
+    :param rows_chunk: Number of rows fetched from the cursor at a time.
+    :type rows_chunk: int
+    :param queue_size: Maximum number of fetched chunks held in memory per running query.
+    :type queue_size: int
+    :param header_format: xlsxwriter format properties of the header rows, e.g. {"bold": True}
+    :type header_format: dict
+
+    Returns: rows_total
+    :type int
+    """
+
+    template_fields = ('sheets', 'source_sql_params', 'destination_filepath')
+    template_ext = ('.sql',)
+    ui_color = '#d4f4d5'
+
+    @apply_defaults
+    def __init__(
+            self,
+            destination_filepath,
+            mssql_source_conn_id,
+            sheets,
+            source_sql_params=None,
+            max_parallel=None,
+            rows_chunk=10000,
+            queue_size=10,
+            header_format=None,
+            *args, **kwargs):
+        super(MsSqlToExcelReport, self).__init__(*args, **kwargs)
+        if source_sql_params is None:
+            source_sql_params = {}
+        if not sheets:
+            raise AirflowException('sheets must have at least one sheet name and query')
+        self.destination_filepath = destination_filepath
+        self.mssql_source_conn_id = mssql_source_conn_id
+        self.sheets = sheets
+        self.source_sql_params = source_sql_params
+        self.max_parallel = max(1, max_parallel or len(sheets))
+        self.rows_chunk = rows_chunk
+        self.queue_size = queue_size
+        self.header_format = header_format
+
+    @staticmethod
+    def _put(rows_queue, item, stop):
+        """Puts an item to a bounded queue, giving up when the report is stopped"""
+        while not stop.is_set():
+            try:
+                rows_queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _fetch(self, pool, sheet_name, sql, rows_queue, stop):
+        """Runs a query on a pooled connection and puts ('header', ...), ('rows', ...) and ('done', None) items"""
+        try:
+            with pool.connection() as conn, closing(conn.cursor()) as cursor:
+                self.log.info("Querying data for sheet {0}".format(sheet_name))
+                cursor.execute(sql, self.source_sql_params)
+                if not self._put(rows_queue, ('header', [column[0] for column in cursor.description]), stop):
+                    return
+                rows = cursor.fetchmany(self.rows_chunk)
+                while rows:
+                    if not self._put(rows_queue, ('rows', rows), stop):
+                        return
+                    rows = cursor.fetchmany(self.rows_chunk)
+            self._put(rows_queue, ('done', None), stop)
+        except Exception as err:
+            self._put(rows_queue, ('error', err), stop)
+
+    def _write_sheet(self, workbook, sheet_name, rows_queue):
+        kind, value = rows_queue.get()
+        if kind == 'error':
+            raise AirflowException('Query for sheet {0} failed: {1}'.format(sheet_name, str(value)))
+
+        sheet_writer = StreamingSheetWriter(workbook, sheet_name, value, header_format=self.header_format)
+        kind, value = rows_queue.get()
+        while kind == 'rows':
+            sheet_writer.write_rows(value)
+            self.log.info("Total written to sheet {0}: {1} rows".format(sheet_name, sheet_writer.rows_total))
+            kind, value = rows_queue.get()
+        if kind == 'error':
+            raise AirflowException('Query for sheet {0} failed: {1}'.format(sheet_name, str(value)))
+        sheet_writer.close()
+        return sheet_writer
+
+    def execute(self, context):
+        self.log.info("Querying data from source: {0}".format(self.mssql_source_conn_id))
+        src_mssql_hook = MsSqlHook(mssql_conn_id=self.mssql_source_conn_id)
+
+        queues = [(sheet_name, queue.Queue(self.queue_size)) for sheet_name in self.sheets]
+        stop = threading.Event()
+        summary = {"filepath": self.destination_filepath, "sheets": {}, "rows_total": 0}
+
+        workbook = xlsxwriter.Workbook(self.destination_filepath, STREAMING_WORKBOOK_OPTIONS)
+        try:
+            with MsSqlConnectionPool(src_mssql_hook.get_conn, self.max_parallel) as pool, \
+                    ThreadPoolExecutor(self.max_parallel) as executor:
+                try:
+                    # queries are submitted and sheets are written in the same order,
+                    # so the sheet being written always has its query running
+                    for sheet_name, rows_queue in queues:
+                        executor.submit(self._fetch, pool, sheet_name, self.sheets[sheet_name], rows_queue, stop)
+
+                    for sheet_name, rows_queue in queues:
+                        sheet_writer = self._write_sheet(workbook, sheet_name, rows_queue)
+                        summary['sheets'][sheet_name] = {"rows_total": sheet_writer.rows_total,
+                                                         "sheet_names": sheet_writer.sheet_names}
+                        summary['rows_total'] = summary['rows_total'] + sheet_writer.rows_total
+                finally:
+                    stop.set()
+        finally:
+            workbook.close()
+
+        self.log.info("Export summary: {0}".format(summary))
+        context['task_instance'].xcom_push(key='export_summary', value=summary)
+        return summary['rows_total']
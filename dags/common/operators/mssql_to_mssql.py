@@ -2,6 +2,7 @@ from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
 
 from common.hooks._mssql_hook import MsSqlHook
+from common.utils.transfer_stats import TransferStats
 import ctds
 
 
@@ -25,6 +26,11 @@ class MsSqlToMsSql(BaseOperator):
     :type dest_preoperator_params: str
     :param rows_chunk: number of rows per chunk to commit.
     :type rows_chunk: int
+    :param profile_src_sql: Run src_sql with SET STATISTICS IO, TIME ON and log logical reads,
+        CPU and elapsed time. Statistics are pushed to XCom with key 'sql_statistics'.
+    :type profile_src_sql: bool
+    :param plan_path: Directory to save the actual XML execution plan of profiled src_sql, e.g. data_path.
+    :type plan_path: str
     """
 
     template_fields = ('src_sql', 'src_sql_params')
@@ -42,6 +48,8 @@ class MsSqlToMsSql(BaseOperator):
             dest_preoperator=None,
             dest_preoperator_params=None,
             rows_chunk=5000,
+            profile_src_sql=False,
+            plan_path=None,
             *args, **kwargs):
         super(MsSqlToMsSql, self).__init__(*args, **kwargs)
         if src_sql_params is None:
@@ -54,29 +62,41 @@ class MsSqlToMsSql(BaseOperator):
         self.dest_preoperator = dest_preoperator
         self.dest_preoperator_params = dest_preoperator_params
         self.rows_chunk = rows_chunk
+        self.profile_src_sql = profile_src_sql
+        self.plan_path = plan_path
 
-    def _execute(self, src_hook, dest_hook):
+    def _execute(self, src_hook, dest_hook, stats):
         with src_hook.get_conn() as src_conn, src_conn.cursor() as cursor:
             self.log.info("Querying data from source: {0}".format(
                 self.src_mssql_conn_id))
-            cursor.execute(self.src_sql, self.src_sql_params)
+            src_hook.enable_statistics(src_conn, cursor)
+            with stats.timer('fetch'):
+                cursor.execute(self.src_sql, self.src_sql_params)
             target_fields = list(map(lambda field: field[0], cursor.description))
 
             rows_total = 0
-            rows = cursor.fetchmany(self.rows_chunk)
+            with stats.timer('fetch'):
+                rows = cursor.fetchmany(self.rows_chunk)
             while len(rows) > 0:
                 rows_total = rows_total + len(rows)
-                dest_hook.bulk_insert_rows(self.dest_table, rows,
-                                           target_fields=target_fields,
-                                           commit_every=self.rows_chunk)
-                rows = cursor.fetchmany(self.rows_chunk)
+                with stats.timer('insert'):
+                    dest_hook.bulk_insert_rows(self.dest_table, rows,
+                                               target_fields=target_fields,
+                                               commit_every=self.rows_chunk)
+                stats.add_chunk(rows)
+                with stats.timer('fetch'):
+                    rows = cursor.fetchmany(self.rows_chunk)
                 self.log.info("Total inserted: {0} rows".format(rows_total))
 
+            src_hook.collect_statistics(cursor, self.src_sql)
             self.log.info("Finished data transfer.")
 
     def execute(self, context):
-        src_hook = MsSqlHook(mssql_conn_id=self.src_mssql_conn_id)
+        src_hook = MsSqlHook(mssql_conn_id=self.src_mssql_conn_id,
+                             profile_statistics=self.profile_src_sql,
+                             plan_path=self.plan_path)
         dest_hook = MsSqlHook(mssql_conn_id=self.dest_mssql_conn_id)
+        stats = TransferStats('mssql_transfer.{0}.{1}'.format(self.dag_id, self.task_id), log=self.log)
 
         if self.dest_preoperator:
             self.log.info("Running MSSQL destination preoperator")
@@ -84,7 +104,10 @@ class MsSqlToMsSql(BaseOperator):
                           parameters=self.dest_preoperator_params,
                           autocommit=True)
 
-        self._execute(src_hook, dest_hook)
+        self._execute(src_hook, dest_hook, stats)
+        context['task_instance'].xcom_push(key='transfer_stats', value=stats.summary())
+        if self.profile_src_sql:
+            context['task_instance'].xcom_push(key='sql_statistics', value=src_hook.statistics)
 
 
 class MsSqlToMsSqlWithLookup(BaseOperator):
@@ -114,6 +137,11 @@ class MsSqlToMsSqlWithLookup(BaseOperator):
     :type dest_no_match_table: str
     :param rows_chunk: number of rows per chunk to commit.
     :type rows_chunk: int
+    :param profile_src_sql: Run src_sql with SET STATISTICS IO, TIME ON and log logical reads,
+        CPU and elapsed time. Statistics are pushed to XCom with key 'sql_statistics'.
+    :type profile_src_sql: bool
+    :param plan_path: Directory to save the actual XML execution plan of profiled src_sql, e.g. data_path.
+    :type plan_path: str
     """
 
     template_fields = ('src_sql', 'src_sql_params',
@@ -141,6 +169,8 @@ class MsSqlToMsSqlWithLookup(BaseOperator):
             dest_no_match_preoperator=None,
             dest_no_match_preoperator_params=None,
             rows_chunk=5000,
+            profile_src_sql=False,
+            plan_path=None,
             *args, **kwargs):
         super(MsSqlToMsSqlWithLookup, self).__init__(*args, **kwargs)
         if src_sql_params is None:
@@ -160,14 +190,18 @@ class MsSqlToMsSqlWithLookup(BaseOperator):
         self.dest_no_match_preoperator = dest_no_match_preoperator
         self.dest_no_match_preoperator_params = dest_no_match_preoperator_params
         self.rows_chunk = rows_chunk
+        self.profile_src_sql = profile_src_sql
+        self.plan_path = plan_path
 
-    def _execute(self, src_hook, lookup_hook, dest_hook, dest_no_match_hook):
+    def _execute(self, src_hook, lookup_hook, dest_hook, dest_no_match_hook, stats):
         with src_hook.get_conn() as src_conn:
             cursor = src_conn.cursor()
+            src_hook.enable_statistics(src_conn, cursor)
             self.log.info("Querying data from source: {0}".format(self.src_mssql_conn_id))
-            cursor.execute(self.src_sql, self.src_sql_params)
-            target_fields = list(map(lambda field: field[0], cursor.description))
-            rows = cursor.fetchmany(self.rows_chunk)
+            with stats.timer('fetch'):
+                cursor.execute(self.src_sql, self.src_sql_params)
+                target_fields = list(map(lambda field: field[0], cursor.description))
+                rows = cursor.fetchmany(self.rows_chunk)
 
             with lookup_hook.get_conn() as lkp_conn:
                 rows_total, rows_total_no_match = 0, 0
@@ -177,34 +211,39 @@ class MsSqlToMsSqlWithLookup(BaseOperator):
                 while len(rows) > 0:
                     rows_match, rows_no_match = [], []
 
-                    for i, row in enumerate(rows):
-                        lkp_sql_params = {k: rows[i][target_fields.index(v)]
-                                          for k, v in self.lookup_sql_params.items()}
-                        lkp_cursor.execute(self.lookup_sql, lkp_sql_params)
-                        lkp_target_fields = list(map(lambda field: field[0], lkp_cursor.description))
-                        merged_target_fields = target_fields + lkp_target_fields
-                        lkp_row = lkp_cursor.fetchone()
-
-                        if lkp_row is not None:
-                            rows_total = rows_total + 1
-                            rows_match.append(rows[i]+lkp_row)
-                        else:
-                            rows_total_no_match = rows_total_no_match + 1
-                            rows_no_match.append(rows[i])
-
-                    dest_hook.bulk_insert_rows(self.dest_table,
-                                               rows_match,
-                                               target_fields=merged_target_fields,
-                                               commit_every=self.rows_chunk)
-
-                    if dest_no_match_hook is not None:
-                        dest_no_match_hook.bulk_insert_rows(self.dest_no_match_table,
-                                                            rows_no_match,
-                                                            target_fields=target_fields,
-                                                            commit_every=self.rows_chunk)
-
-                    rows = cursor.fetchmany(self.rows_chunk)
-
+                    with stats.timer('lookup'):
+                        for i, row in enumerate(rows):
+                            lkp_sql_params = {k: rows[i][target_fields.index(v)]
+                                              for k, v in self.lookup_sql_params.items()}
+                            lkp_cursor.execute(self.lookup_sql, lkp_sql_params)
+                            lkp_target_fields = list(map(lambda field: field[0], lkp_cursor.description))
+                            merged_target_fields = target_fields + lkp_target_fields
+                            lkp_row = lkp_cursor.fetchone()
+
+                            if lkp_row is not None:
+                                rows_total = rows_total + 1
+                                rows_match.append(rows[i]+lkp_row)
+                            else:
+                                rows_total_no_match = rows_total_no_match + 1
+                                rows_no_match.append(rows[i])
+
+                    with stats.timer('insert'):
+                        dest_hook.bulk_insert_rows(self.dest_table,
+                                                   rows_match,
+                                                   target_fields=merged_target_fields,
+                                                   commit_every=self.rows_chunk)
+
+                        if dest_no_match_hook is not None:
+                            dest_no_match_hook.bulk_insert_rows(self.dest_no_match_table,
+                                                                rows_no_match,
+                                                                target_fields=target_fields,
+                                                                commit_every=self.rows_chunk)
+                    stats.add_chunk(rows)
+
+                    with stats.timer('fetch'):
+                        rows = cursor.fetchmany(self.rows_chunk)
+
+                src_hook.collect_statistics(cursor, self.src_sql)
                 self.log.info("Total inserted: {0} rows".format(rows_total))
                 self.log.info("Total inserted for no match: {0} rows".format(rows_total_no_match))
 
@@ -213,7 +252,9 @@ class MsSqlToMsSqlWithLookup(BaseOperator):
         return {"rows_total": rows_total, "rows_total_no_match": rows_total_no_match}
 
     def execute(self, context):
-        src_hook = MsSqlHook(mssql_conn_id=self.src_mssql_conn_id)
+        src_hook = MsSqlHook(mssql_conn_id=self.src_mssql_conn_id,
+                             profile_statistics=self.profile_src_sql,
+                             plan_path=self.plan_path)
         lookup_hook = MsSqlHook(mssql_conn_id=self.lookup_mssql_conn_id)
         dest_hook = MsSqlHook(mssql_conn_id=self.dest_mssql_conn_id)
         dest_no_match_hook = None
@@ -233,7 +274,12 @@ class MsSqlToMsSqlWithLookup(BaseOperator):
                           parameters=self.dest_preoperator_params,
                           autocommit=True)
 
-        return self._execute(src_hook, lookup_hook, dest_hook, dest_no_match_hook)
+        stats = TransferStats('mssql_transfer.{0}.{1}'.format(self.dag_id, self.task_id), log=self.log)
+        result = self._execute(src_hook, lookup_hook, dest_hook, dest_no_match_hook, stats)
+        context['task_instance'].xcom_push(key='transfer_stats', value=stats.summary())
+        if self.profile_src_sql:
+            context['task_instance'].xcom_push(key='sql_statistics', value=src_hook.statistics)
+        return result
 
 
 class MsSqlToMsSqlUsingCTDS(BaseOperator):
@@ -278,6 +324,11 @@ class MsSqlToMsSqlUsingCTDS(BaseOperator):
     :param dest_character_encoding: pass 'utf-16le' for nvarchar and 'latin-1' for varchar columns,
         mixed columns are currently not supported. Pass empty value '' if no encoding is required.
     :type dest_character_encoding: str
+    :param profile_src_sql: Run src_sql with SET STATISTICS IO, TIME ON and log logical reads,
+        CPU and elapsed time. Statistics are pushed to XCom with key 'sql_statistics'.
+    :type profile_src_sql: bool
+    :param plan_path: Directory to save the actual XML execution plan of profiled src_sql, e.g. data_path.
+    :type plan_path: str
     """
 
     template_fields = ('src_sql', 'src_sql_params',
@@ -308,6 +359,8 @@ class MsSqlToMsSqlUsingCTDS(BaseOperator):
             tablock=True,
             bulk_insert_dict_rows=True,
             dest_character_encoding='utf-16le',
+            profile_src_sql=False,
+            plan_path=None,
             *args, **kwargs):
         super(MsSqlToMsSqlUsingCTDS, self).__init__(*args, **kwargs)
         if src_sql_params is None:
@@ -330,6 +383,8 @@ class MsSqlToMsSqlUsingCTDS(BaseOperator):
         self.tablock = tablock
         self.bulk_insert_dict_rows = bulk_insert_dict_rows
         self.dest_character_encoding = dest_character_encoding
+        self.profile_src_sql = profile_src_sql
+        self.plan_path = plan_path
 
     def _encode_result(self, rows, target_fields=None):
         result = [(ctds.SqlVarChar(col.encode(self.dest_character_encoding))
@@ -343,12 +398,14 @@ class MsSqlToMsSqlUsingCTDS(BaseOperator):
 
         return result
 
-    def _execute(self, src_hook, lookup_hook, dest_hook, dest_no_match_hook):
+    def _execute(self, src_hook, lookup_hook, dest_hook, dest_no_match_hook, stats):
         with src_hook.get_ctds_conn() as src_conn, src_conn.cursor() as src_cursor:
             self.log.info("Querying data from source: {0}".format(self.src_mssql_conn_id))
-            src_cursor.execute(self.src_sql, self.src_sql_params)
-            src_columns = [column.name for column in src_cursor.description]
-            rows = src_cursor.fetchmany(self.rows_chunk)
+            src_hook.enable_statistics(src_conn, src_cursor)
+            with stats.timer('fetch'):
+                src_cursor.execute(self.src_sql, self.src_sql_params)
+                src_columns = [column.name for column in src_cursor.description]
+                rows = src_cursor.fetchmany(self.rows_chunk)
 
             with dest_hook.get_ctds_conn() as dest_conn:
                 rows_total, rows_total_match, rows_total_no_match = 0, 0, 0
@@ -360,7 +417,8 @@ class MsSqlToMsSqlUsingCTDS(BaseOperator):
                     self.log.info("Total source rows: {0} rows".format(rows_total))
 
                     if lookup_hook is not None:
-                        with lookup_hook.get_ctds_conn() as lkp_conn, lkp_conn.cursor() as lkp_cursor:
+                        with stats.timer('lookup'), \
+                                lookup_hook.get_ctds_conn() as lkp_conn, lkp_conn.cursor() as lkp_cursor:
                             for row in rows:
                                 lkp_sql_params = {v: row[src_columns.index(v)]
                                                   for v in self.lookup_sql_params}
@@ -377,21 +435,24 @@ class MsSqlToMsSqlUsingCTDS(BaseOperator):
                         rows_match = rows
 
                     if self.dest_character_encoding:
-                        rows_match = self._encode_result(rows_match, target_fields)
-
-                    row_count = dest_conn.bulk_insert(
-                        table=self.dest_table,
-                        rows=rows_match,
-                        batch_size=self.rows_chunk,
-                        tablock=self.tablock)
+                        with stats.timer('encode'):
+                            rows_match = self._encode_result(rows_match, target_fields)
+
+                    with stats.timer('insert'):
+                        row_count = dest_conn.bulk_insert(
+                            table=self.dest_table,
+                            rows=rows_match,
+                            batch_size=self.rows_chunk,
+                            tablock=self.tablock)
                     rows_total_match = rows_total_match + row_count
                     self.log.info("Total inserted: {0} rows".format(rows_total_match))
 
                     if dest_no_match_hook is not None:
                         if self.dest_character_encoding:
-                            rows_no_match = self._encode_result(rows_no_match, src_columns)
+                            with stats.timer('encode'):
+                                rows_no_match = self._encode_result(rows_no_match, src_columns)
 
-                        with dest_no_match_hook.get_ctds_conn() as dest_conn_no_match:
+                        with stats.timer('insert'), dest_no_match_hook.get_ctds_conn() as dest_conn_no_match:
                             row_count_no_match = dest_conn_no_match.bulk_insert(
                                 table=self.dest_no_match_table,
                                 rows=rows_no_match,
@@ -401,7 +462,11 @@ class MsSqlToMsSqlUsingCTDS(BaseOperator):
                             rows_total_no_match = rows_total_no_match + row_count_no_match
                             self.log.info("Total inserted for no match: {0} rows".format(rows_total_no_match))
 
-                    rows = src_cursor.fetchmany(self.rows_chunk)
+                    stats.add_chunk(rows)
+                    with stats.timer('fetch'):
+                        rows = src_cursor.fetchmany(self.rows_chunk)
+
+            src_hook.collect_statistics(src_cursor, self.src_sql)
 
         self.log.info("Finished data transfer.")
         return {"rows_total": rows_total,
@@ -409,7 +474,9 @@ class MsSqlToMsSqlUsingCTDS(BaseOperator):
                 "rows_total_no_match": rows_total_no_match}
 
     def execute(self, context):
-        src_hook = MsSqlHook(mssql_conn_id=self.src_mssql_conn_id)
+        src_hook = MsSqlHook(mssql_conn_id=self.src_mssql_conn_id,
+                             profile_statistics=self.profile_src_sql,
+                             plan_path=self.plan_path)
         dest_hook = MsSqlHook(mssql_conn_id=self.dest_mssql_conn_id)
         dest_no_match_hook = None
         lookup_hook = None
@@ -432,4 +499,9 @@ class MsSqlToMsSqlUsingCTDS(BaseOperator):
                           parameters=self.dest_preoperator_params,
                           autocommit=True)
 
-        return self._execute(src_hook, lookup_hook, dest_hook, dest_no_match_hook)
+        stats = TransferStats('mssql_transfer.{0}.{1}'.format(self.dag_id, self.task_id), log=self.log)
+        result = self._execute(src_hook, lookup_hook, dest_hook, dest_no_match_hook, stats)
+        context['task_instance'].xcom_push(key='transfer_stats', value=stats.summary())
+        if self.profile_src_sql:
+            context['task_instance'].xcom_push(key='sql_statistics', value=src_hook.statistics)
+        return result
@@ -0,0 +1,192 @@
+from airflow.exceptions import AirflowException
+from airflow.models import BaseOperator
+from airflow.utils.decorators import apply_defaults
+from airflow.hooks.mssql_hook import MsSqlHook
+from common.hooks.s3_hook import S3Hook
+from contextlib import closing
+from datetime import date, datetime, time
+from decimal import Decimal
+
+import os
+import os.path as op
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pymssql
+import tempfile
+
+
+# row groups held back at most to find a non NULL value of each column to map its type from
+TYPE_SAMPLE_ROW_GROUPS = 10
+
+
+def _column_type(type_code, values, precision=None, scale=None):
+    """
+    Maps a cursor.description type code to an Arrow type.
+    Decimals take the precision and scale of the description when the driver reports them.
+    pymssql only reports type families, so numbers, dates and decimals are refined
+    from the Python types of the first non NULL values, and decimals take the largest scale of the values.
+    """
+    sample = next((v for v in values if v is not None), None)
+
+    if type_code == pymssql.STRING:
+        return pa.string()
+    if type_code == pymssql.BINARY:
+        return pa.binary()
+    if type_code == pymssql.DATETIME:
+        if isinstance(sample, datetime) or sample is None:
+            return pa.timestamp('us')
+        if isinstance(sample, date):
+            return pa.date32()
+        if isinstance(sample, time):
+            return pa.time64('us')
+    if type_code == pymssql.DECIMAL and precision and scale is not None:
+        return pa.decimal128(min(precision, 38), scale)
+    if type_code == pymssql.DECIMAL or isinstance(sample, Decimal):
+        scale = max([-v.as_tuple().exponent for v in values if isinstance(v, Decimal)] or [4])
+        return pa.decimal128(38, max(scale, 0))
+    if isinstance(sample, bool):
+        return pa.bool_()
+    if isinstance(sample, int):
+        return pa.int64()
+    if isinstance(sample, float) or type_code == pymssql.NUMBER:
+        return pa.float64()
+    return pa.string()
+
+
+class MsSqlToParquet(BaseOperator):
+    """
+    Writes data from MsSql to a typed Parquet file, streaming cursor batches into row groups.
+    :param destination_filepath: destination file path or s3://bucket/key.
+    :type destination_filepath: str
+    :param mssql_source_conn_id: source MsSql connection.
+    :type mssql_source_conn_id: str
+    :param source_sql: SQL query to execute against the source MsSQL
+        database. (templated)
+    :type source_sql: str
+    :param source_sql_params: Parameters to use in sql query. (templated)
+    :type source_sql_params: dict
+    :param row_group_size: Number of rows per Parquet row group, also the number of rows held in memory.
+        While a column has only NULL values, up to TYPE_SAMPLE_ROW_GROUPS row groups are held to map its type.
+    :type row_group_size: int
+    :param compression: Parquet compression codec: 'snappy', 'gzip', 'zstd', 'brotli' or 'none'.
+    :type compression: str
+    :param schema: Arrow types overriding the types mapped from the cursor description, by column name.
+        Declare the types of columns which are NULL in the first rows, or whose values do not fit the type
+        mapped from the first rows, e.g. decimals with a larger scale.
+        Example: schema={"Amount": pa.decimal128(18, 2), "AccountNumber": pa.string()}
+    :type schema: dict
+    :param aws_conn_id: AWS connection used when destination_filepath is on S3.
+    :type aws_conn_id: str
+
+    Returns: rows_total
+    :type int
+    """
+
+    template_fields = ('source_sql', 'source_sql_params', 'destination_filepath')
+    template_ext = ('.sql',)
+    ui_color = '#d4f4d5'
+
+    @apply_defaults
+    def __init__(
+            self,
+            destination_filepath,
+            mssql_source_conn_id,
+            source_sql,
+            source_sql_params=None,
+            row_group_size=100000,
+            compression='snappy',
+            schema=None,
+            aws_conn_id='aws_default',
+            *args, **kwargs):
+        super(MsSqlToParquet, self).__init__(*args, **kwargs)
+        if source_sql_params is None:
+            source_sql_params = {}
+        self.destination_filepath = destination_filepath
+        self.mssql_source_conn_id = mssql_source_conn_id
+        self.source_sql = source_sql
+        self.source_sql_params = source_sql_params
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.schema = schema or {}
+        self.aws_conn_id = aws_conn_id
+
+    def _get_schema(self, description, rows):
+        columns = list(zip(*rows)) if rows else [[] for _ in description]
+        fields = [pa.field(column[0], self.schema.get(column[0]) or
+                           _column_type(column[1], values, precision=column[4], scale=column[5]))
+                  for column, values in zip(description, columns)]
+        schema = pa.schema(fields)
+        self.log.info("Parquet schema: {0}".format(schema))
+        return schema
+
+    def _fetch_sample(self, cursor, description):
+        """Fetches rows until each column has a non NULL value or a declared type, for a few row groups at most"""
+        rows = []
+        for _ in range(TYPE_SAMPLE_ROW_GROUPS):
+            batch = cursor.fetchmany(self.row_group_size)
+            rows.extend(batch)
+            if len(batch) < self.row_group_size or \
+                    all(column[0] in self.schema or any(row[i] is not None for row in rows)
+                        for i, column in enumerate(description)):
+                break
+        return rows
+
+    def _write_rows(self, writer, schema, rows):
+        columns = list(zip(*rows)) if rows else [[] for _ in schema]
+        arrays = []
+        for values, field in zip(columns, schema):
+            try:
+                arrays.append(pa.array(values, type=field.type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as err:
+                raise AirflowException("Values of column {0} do not fit the type {1} mapped from the first rows, "
+                                       "declare its type in schema: {2}".format(field.name, field.type, str(err)))
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema), row_group_size=self.row_group_size)
+
+    def _export(self, conn, filepath):
+        rows_total = 0
+        with closing(conn.cursor()) as cursor:
+            cursor.execute(self.source_sql, self.source_sql_params)
+            description = cursor.description
+            rows = self._fetch_sample(cursor, description)
+            schema = self._get_schema(description, rows)
+            writer = pq.ParquetWriter(filepath, schema, compression=self.compression)
+            try:
+                while True:
+                    self._write_rows(writer, schema, rows)
+                    rows_total = rows_total + len(rows)
+                    self.log.info("Total written to {0}: {1} rows".format(filepath, rows_total))
+                    rows = cursor.fetchmany(self.row_group_size)
+                    if not rows:
+                        break
+            finally:
+                writer.close()
+
+        return rows_total
+
+    def execute(self, context):
+        self.log.info("Querying data from source: {0}".format(self.mssql_source_conn_id))
+        src_mssql_hook = MsSqlHook(mssql_conn_id=self.mssql_source_conn_id)
+
+        is_s3 = self.destination_filepath.startswith('s3://')
+        filepath = self.destination_filepath
+        if is_s3:
+            fd, filepath = tempfile.mkstemp(suffix='.parquet')
+            os.close(fd)
+
+        try:
+            with closing(src_mssql_hook.get_conn()) as conn:
+                rows_total = self._export(conn, filepath)
+
+            summary = {"filepath": self.destination_filepath,
+                       "rows_total": rows_total,
+                       "bytes_written": op.getsize(filepath)}
+            if is_s3:
+                self.log.info("Uploading {0} to {1}".format(filepath, self.destination_filepath))
+                S3Hook(aws_conn_id=self.aws_conn_id).store_file(self.destination_filepath, filepath)
+        finally:
+            if is_s3 and op.exists(filepath):
+                os.remove(filepath)
+
+        self.log.info("Export summary: {0}".format(summary))
+        context['task_instance'].xcom_push(key='export_summary', value=summary)
+        return rows_total
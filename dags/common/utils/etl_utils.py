@@ -1,30 +1,416 @@
-def apply_transformations(df, transformations):
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from functools import partial
+
+import math
+import numpy as np
+import pandas as pd
+
+INT_TYPES = ('tinyint', 'smallint', 'int', 'bigint')
+DECIMAL_TYPES = ('decimal', 'numeric', 'money', 'smallmoney')
+FLOAT_TYPES = ('float', 'real')
+DATETIME_TYPES = ('datetime', 'datetime2', 'smalldatetime')
+STRING_TYPES = ('char', 'varchar', 'nchar', 'nvarchar')
+DATE_FORMATS = ('%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f')
+REJECT_REASON_COLUMN = 'RejectReason'
+
+
+class ConversionError(ValueError):
+    """Raised by schema converters for values which can not be converted, reason is the message without the value"""
+
+    def __init__(self, reason, value):
+        super(ConversionError, self).__init__('{0} value {1!r}'.format(reason, value))
+        self.reason = reason
+
+
+def vectorized(transformation):
+    """
+    Marks a transformation as vectorized. It is called once with the whole data frame instead of once per row
+    and returns a Series, an array or a scalar, or a boolean mask for FILTER transformations.
+    Consecutive vectorized FILTER transformations are evaluated on the same rows and their masks are combined,
+    so they must not depend on each other.
+        Example: transformations={
+            "AccountNumber": vectorized(lambda df: df['AccountNumber'].str.strip()),
+            "FILTER:CheckEmpty": vectorized(lambda df: df['AccountNumber'] != "")}
+    """
+    transformation.vectorized = True
+    return transformation
+
+
+def is_vectorized(transformation):
+    return getattr(transformation, 'vectorized', False)
+
+
+def prepare_transformations(transformations):
+    """
+    Resolves a dictionary of transformations once into a list of steps, where consecutive vectorized FILTER
+    transformations are combined into one step and consecutive RENAME transformations into one mapping.
+    Row-wise FILTER transformations are steps of their own, so each runs on the rows kept by the previous ones.
+    The steps can be passed to apply_transformations instead of the dictionary for every chunk of a load,
+    the renames are still applied to the columns of every chunk.
+    :param transformations: A dictionary of transformations, see apply_transformations.
+    :type transformations: dict
+    :return: A list of ('filter', [transformation, ...]), ('rename', {column: new_column})
+        and ('assign', column, transformation) steps
+    """
+    steps = []
+    for column, transformation in transformations.items():
+        if ':' in column:
+            (operation, col) = column.split(':')
+            if operation == 'FILTER':
+                if is_vectorized(transformation) and steps and steps[-1][0] == 'filter' \
+                        and is_vectorized(steps[-1][1][-1]):
+                    steps[-1][1].append(transformation)
+                else:
+                    steps.append(('filter', [transformation]))
+            elif operation == 'RENAME':
+                if steps and steps[-1][0] == 'rename':
+                    steps[-1][1][col] = transformation
+                else:
+                    steps.append(('rename', {col: transformation}))
+        else:
+            steps.append(('assign', column, transformation))
+    return steps
+
+
+def transform(df, transformations):
+    """
+    Apply transformations to pandas data frame and return the transformed data frame.
+    The masks of consecutive vectorized FILTER transformations are combined into one boolean index,
+    every filter step is applied before the next transformation runs.
+    :param df: Pandas data frame on which to apply transformations
+    :type df: Pandas data frame
+    :param transformations: A dictionary of transformations or steps returned by prepare_transformations.
+    :type transformations: dict or list
+    :return: Pandas data frame
+    """
+    if isinstance(transformations, dict):
+        transformations = prepare_transformations(transformations)
+
+    for step in transformations:
+        if step[0] == 'rename':
+            df.columns = [step[1].get(c, c) for c in df.columns]
+        elif step[0] == 'filter':
+            if df.empty:
+                continue
+            mask = None
+            for transformation in step[1]:
+                if is_vectorized(transformation):
+                    result = np.asarray(transformation(df), dtype=bool)
+                else:
+                    result = df.apply(transformation, axis=1).values.astype(bool)
+                mask = result if mask is None else mask & result
+            df = df[mask]
+        else:
+            column, transformation = step[1], step[2]
+            if is_vectorized(transformation):
+                df[column] = transformation(df)
+            elif callable(transformation):
+                df[column] = df.apply(transformation, axis=1, result_type='reduce') if not df.empty else None
+            else:
+                df[column] = transformation
+    return df
+
+
+def to_tuples(df, columns):
+    """
+    Returns the rows of a data frame as tuples of the values of columns in the given order,
+    built from whole column lists instead of a dictionary per row.
+    Columns missing in the data frame are None.
+    """
+    values = [df[column].tolist() if column in df.columns else [None] * df.shape[0] for column in columns]
+    return zip(*values)
+
+
+def apply_transformations(df, transformations, columns=None, converters=None):
     """
     Apply transformations to pandas data frame
     :param df: Pandas data frame on which to apply transformations
     :type df: Pandas data frame
-    :param transformations: A dictionary of transformations.
+    :param transformations: A dictionary of transformations or steps returned by prepare_transformations.
+        Callables are called per row, unless they are marked with the vectorized decorator.
         Example: transformations={
             "RENAME:Billingcycle": "BillingCycle",
             "ID": 1234,
-            "AccountNumber": lambda row: row['AccountNumber'].strip(),
+            "AccountNumber": vectorized(lambda df: df['AccountNumber'].str.strip()),
             "CustomerName": lambda row: "{} {}".format(row["FirstName"].strip(), row["LastName"].strip()[:100]),
             "Address": lambda row: ctds.SqlVarChar(row["Address"].encode("utf-16le")),
             "FILTER:CheckEmpty": lambda row: row['AccountNumber'].strip() != ""}
-    :type transformations: dict
-    :return: A generator object that returns rows as a dictionary
+    :type transformations: dict or list
+    :param columns: Return rows as tuples of the values of these columns in order, e.g. the destination
+        table columns. Columns missing in the data frame are None and other columns are left out.
+    :type columns: list
+    :param converters: A dictionary of converters by column name, see schema_converters. The columns are
+        converted after the transformations, so transformations see the values as they are read and FILTER
+        transformations can drop rows with values which can not be converted, e.g. trailer rows.
+    :type converters: dict
+    :return: A generator object that returns rows as a dictionary, or as a tuple when columns are given
     """
-    for column, transformation in transformations.items():
-        if ':' in column:
-            (operation, col) = column.split(':')
-            if operation == 'FILTER':
-                df = df[df.apply(transformation, axis=1)]
-            elif operation == 'RENAME':
-                df.rename(columns={col: transformation}, inplace=True)
-        elif callable(transformation):
-            df[column] = df.apply(transformation, axis=1, result_type='reduce')
+    df = transform(df, transformations)
+    if converters:
+        df = convert_types(df, converters)
+    rows = df.to_dict('records') if columns is None else to_tuples(df, columns)
+    for row in rows:
+        yield row
+
+
+def normalize_schema(schema):
+    """
+    Returns a schema as a list of column dictionaries with name, type, max_length, precision, scale and nullable,
+    like MsSqlHook.get_table_schema.
+    :param schema: Columns returned by MsSqlHook.get_table_schema, or a dictionary of SQL type names,
+        converter callables or column dictionaries by column name.
+        Example: schema={"AccountNumber": {"type": "varchar", "max_length": 20, "nullable": False},
+                         "Amount": "decimal", "OpenDate": "date", "Code": lambda value: value.upper()}
+    :type schema: list or dict
+    """
+    if not isinstance(schema, dict):
+        return list(schema)
+    columns = []
+    for name, column in schema.items():
+        column = dict(column) if isinstance(column, dict) else {"type": column}
+        columns.append({"name": name, "type": None, "max_length": None, "precision": None, "scale": None,
+                        "nullable": True, **column})
+    return columns
+
+
+def _is_null(value):
+    return value is None or value == '' or (isinstance(value, float) and math.isnan(value))
+
+
+def _to_int(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return int(value.strip())
+    if isinstance(value, int):
+        return int(value)
+    raise ValueError
+
+
+def _to_decimal(value):
+    try:
+        result = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError
+    if not result.is_finite():
+        raise ValueError
+    return result
+
+
+def _to_float(value):
+    return float(value.strip() if isinstance(value, str) else value)
+
+
+def _to_bit(value):
+    text = str(value).strip().lower()
+    if text in ('1', 'true'):
+        return True
+    if text in ('0', 'false'):
+        return False
+    raise ValueError
+
+
+def _to_datetime(value, date_formats):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    text = str(value).strip()
+    for date_format in date_formats:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            pass
+    raise ValueError
+
+
+def _to_date(value, date_formats):
+    return _to_datetime(value, date_formats).date()
+
+
+def column_converter(column, date_formats=DATE_FORMATS):
+    """
+    Returns a function which converts a value read from a file (usually a string) to the native Python type
+    of a schema column: int, Decimal, float, bool, date or datetime. Empty values are converted to None.
+    Raises ValueError for values which can not be converted. Returns None for string and other columns
+    which are inserted as they are read, or the column type itself when it is a callable.
+    :param column: Column dictionary, see normalize_schema
+    :type column: dict
+    :param date_formats: strptime formats tried in order to parse date and datetime values
+    :type date_formats: sequence
+    """
+    column_type = column['type']
+    if callable(column_type):
+        return column_type
+
+    column_type = (column_type or '').lower()
+    if column_type in INT_TYPES:
+        convert = _to_int
+    elif column_type in DECIMAL_TYPES:
+        convert = _to_decimal
+    elif column_type in FLOAT_TYPES:
+        convert = _to_float
+    elif column_type == 'bit':
+        convert = _to_bit
+    elif column_type in DATETIME_TYPES:
+        convert = partial(_to_datetime, date_formats=date_formats)
+    elif column_type == 'date':
+        convert = partial(_to_date, date_formats=date_formats)
+    else:
+        return None
+
+    def converter(value):
+        if _is_null(value):
+            return None
+        try:
+            return convert(value)
+        except (ValueError, TypeError, OverflowError):
+            raise ConversionError('{0}: invalid {1}'.format(column['name'], column_type), value)
+    return converter
+
+
+def schema_converters(schema, date_formats=DATE_FORMATS):
+    """
+    Returns converters to native Python types by column name for the typed columns of a schema.
+    :param schema: Schema, see normalize_schema
+    :type schema: list or dict
+    :param date_formats: strptime formats tried in order to parse date and datetime values
+    :type date_formats: sequence
+    :return: A dictionary of converters by column name, for convert_types
+    """
+    converters = {}
+    for column in normalize_schema(schema):
+        converter = column_converter(column, date_formats)
+        if converter is not None:
+            converters[column['name']] = converter
+    return converters
+
+
+def resolve_schema(schema, dest_hook, table, date_formats=None, validate=False):
+    """
+    Resolves the schema option of a load into the schema columns and the converters to native Python types.
+    :param schema: 'table' to take the column types from the destination table, or a declared schema,
+        see normalize_schema. None converts no columns.
+    :type schema: str or dict
+    :param dest_hook: Destination MsSqlHook, used for the table schema
+    :type dest_hook: MsSqlHook
+    :param table: Destination table name
+    :type table: str
+    :param date_formats: strptime formats tried in order to parse date and datetime values, default DATE_FORMATS
+    :type date_formats: sequence
+    :param validate: Return the destination table schema without converters when schema is None,
+        to validate rows against the table.
+    :type validate: bool
+    :return: A list of column dictionaries or None, and a dictionary of converters by column name
+    """
+    if isinstance(schema, dict):
+        columns = normalize_schema(schema)
+    elif schema == 'table' or validate:
+        columns = dest_hook.get_table_schema(table)
+    else:
+        return None, {}
+    converters = schema_converters(columns, date_formats or DATE_FORMATS) if schema else {}
+    return columns, converters
+
+
+def convert_types(df, converters, rejects=None):
+    """
+    Converts the columns of a data frame which have a converter into native Python values.
+    The columns are kept as object columns, so that integers with None are not turned into floats with NaN
+    and the values are inserted with their SQL types.
+    :param df: Pandas data frame
+    :type df: Pandas data frame
+    :param converters: A dictionary of converters by column name, see schema_converters
+    :type converters: dict
+    :param rejects: A dictionary to collect the reject reason by row index of values which can not be converted,
+        which are set to None. Conversion errors are raised if not given.
+    :type rejects: dict
+    :return: Pandas data frame
+    """
+    for column, converter in converters.items():
+        if column not in df.columns:
+            continue
+        if rejects is None:
+            values = [converter(value) for value in df[column].tolist()]
         else:
-            df[column] = transformation
+            values = []
+            for index, value in zip(df.index, df[column].tolist()):
+                try:
+                    values.append(converter(value))
+                except ValueError as err:
+                    rejects.setdefault(index, getattr(err, 'reason', '{0}: {1}'.format(column, err)))
+                    values.append(None)
+        df[column] = pd.Series(values, index=df.index, dtype=object)
+    return df
+
+
+def validate_rows(df, schema):
+    """
+    Returns the reject reasons by row index of rows which do not fit the columns of a schema:
+    NULL in a NOT NULL column or a string longer than a char, varchar, nchar or nvarchar column.
+    Columns of the schema which are not in the data frame are not checked.
+    :param df: Pandas data frame
+    :type df: Pandas data frame
+    :param schema: Schema, see normalize_schema
+    :type schema: list or dict
+    :return: dict
+    """
+    reasons = {}
+    for column in normalize_schema(schema):
+        name = column['name']
+        if name not in df.columns:
+            continue
+        values = df[name]
+        if not column['nullable']:
+            for index in values.index[values.isnull().values]:
+                reasons.setdefault(index, '{0}: NULL in NOT NULL column'.format(name))
+
+        max_length = column['max_length']
+        if max_length and max_length > 0 and str(column['type']).lower() in STRING_TYPES:
+            too_long = [isinstance(value, str) and len(value) > max_length for value in values.tolist()]
+            for index in values.index[too_long]:
+                reasons.setdefault(index, '{0}: longer than {1}'.format(name, max_length))
+    return reasons
+
+
+def reject_rows(source, reasons):
+    """Returns the rows of source with index in reasons, in source order, with the reason in REJECT_REASON_COLUMN"""
+    rejects = source[source.index.isin(list(reasons))].copy()
+    rejects[REJECT_REASON_COLUMN] = [reasons[index] for index in rejects.index]
+    return rejects
+
+
+def apply_transformations_with_rejects(df, transformations, schema=None, converters=None, columns=None):
+    """
+    Applies transformations, converts types and validates a data frame against a destination schema like
+    apply_transformations with converters and validate_rows, but separates the rows which can not be loaded
+    instead of failing. Rows are converted and validated after transformations, so rows dropped by
+    FILTER transformations are not rejected.
+    :param df: Pandas data frame
+    :type df: Pandas data frame
+    :param transformations: A dictionary of transformations or steps returned by prepare_transformations.
+    :type transformations: dict or list
+    :param schema: Schema to validate the transformed rows against, see normalize_schema
+    :type schema: list or dict
+    :param converters: A dictionary of converters by column name, see schema_converters
+    :type converters: dict
+    :param columns: Return rows as tuples of the values of these columns in order, see apply_transformations
+    :type columns: list
+    :return: The valid rows as dictionaries or tuples, the source rows of the valid rows in the same order
+        and the rejected source rows with the reason in REJECT_REASON_COLUMN
+    :type tuple
+    """
+    source = df.copy()
+    rejects = {}
+    df = convert_types(transform(df, transformations), converters or {}, rejects)
+    if rejects:
+        df = df.drop(index=list(rejects))
+    if schema is not None:
+        invalid = validate_rows(df, schema)
+        if invalid:
+            rejects.update(invalid)
+            df = df.drop(index=list(invalid))
 
-    for record in df.to_dict('records'):
-        yield record
+    records = list(df.to_dict('records') if columns is None else to_tuples(df, columns))
+    return records, source.loc[df.index], reject_rows(source, rejects)
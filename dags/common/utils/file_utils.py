@@ -0,0 +1,180 @@
+from contextlib import contextmanager
+
+import gzip
+import mmap
+import os
+import subprocess
+import tempfile
+import zipfile
+
+COMPRESSIONS = (None, 'gzip', 'zstd')
+INPUT_EXTENSIONS = ('.gz', '.zip', '.gpg', '.pgp')
+
+
+@contextmanager
+def open_output(filepath, compression=None):
+    """
+    Opens a binary file for writing with optional streaming compression.
+    :param filepath: Output file path
+    :type filepath: str
+    :param compression: None, 'gzip' or 'zstd'. zstd requires the zstandard package.
+    :type compression: str
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError('Invalid compression {0}, expected one of {1}'.format(compression, COMPRESSIONS))
+
+    if compression == 'gzip':
+        with gzip.open(filepath, 'wb') as f:
+            yield f
+    elif compression == 'zstd':
+        import zstandard
+        with open(filepath, 'wb') as f, zstandard.ZstdCompressor().stream_writer(f) as compressor:
+            yield compressor
+    else:
+        with open(filepath, 'wb') as f:
+            yield f
+
+
+def input_format(filepath):
+    """Returns the compression or encryption extension of an input file, or None for a plain file"""
+    extension = os.path.splitext(filepath)[1].lower()
+    return extension if extension in INPUT_EXTENSIONS else None
+
+
+def import_gpg_key(key_file, gpg_options=None, log=None):
+    """
+    Imports a gpg key file into the keyring and returns the gnupg.GPG instance.
+    :param key_file: Path of the key file
+    :type key_file: str
+    :param gpg_options: Additional gpg command line options, e.g. ['--homedir', '/path']
+    :type gpg_options: list
+    :param log: Logger for the key import results
+    :type log: logging.Logger
+    """
+    import gnupg
+    gpg = gnupg.GPG(options=gpg_options)
+    with open(key_file, mode='rb') as f:
+        import_result = gpg.import_keys(f.read())
+    if log is not None:
+        log.info("Key import results: {0}".format(import_result.results))
+    return gpg
+
+
+def gpg_input_options(conn, log=None):
+    """
+    Imports the gpg key of a connection like the one of CryptographyOperator, with the key_file and options
+    in extra and the key passphrase as password, and returns the decryption options for open_input.
+    :param conn: Airflow connection
+    :type conn: airflow.models.Connection
+    :param log: Logger for the key import results
+    :type log: logging.Logger
+    """
+    conn_options = conn.extra_dejson
+    import_gpg_key(conn_options.get('key_file'), conn_options.get('options'), log)
+    return {"passphrase": conn.password, "gpg_options": conn_options.get('options')}
+
+
+@contextmanager
+def _gpg_decrypt(filepath, passphrase=None, gpg_options=None):
+    """
+    Streams the plaintext of a gpg encrypted file from a gpg process.
+    The exit status of gpg, which also reports a failed integrity check, is checked when the
+    stream was read to the end, so a failed decryption raises after the plaintext was consumed.
+    """
+    args = ['gpg', '--batch', '--yes', '--quiet', '--decrypt'] + list(gpg_options or [])
+    if passphrase is not None:
+        args += ['--pinentry-mode', 'loopback', '--passphrase-fd', '0']
+    args.append(filepath)
+
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr)
+        finished = False
+        try:
+            if passphrase is not None:
+                process.stdin.write(passphrase.encode('utf-8') + b'\n')
+            process.stdin.close()
+            yield process.stdout
+            finished = not process.stdout.read(1)
+        finally:
+            # the reader stopped early or failed, the rest of the plaintext is not needed
+            if not finished:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+
+        if finished and process.returncode != 0:
+            stderr.seek(0)
+            raise IOError('Failed to decrypt file {0}: {1}'.format(
+                filepath, stderr.read().decode('utf-8', 'replace').strip()))
+
+
+@contextmanager
+def open_input(filepath, passphrase=None, gpg_options=None):
+    """
+    Opens an input file for binary reading, decompressing or decrypting it as a stream
+    by extension without writing the content to disk:
+    '.gz' gzip, '.zip' zip archive with a single file and '.gpg' or '.pgp' gpg encryption,
+    where the decrypted content can be gzip compressed again, e.g. 'data.csv.gz.gpg'.
+    Other files are opened as they are.
+    :param filepath: Input file path
+    :type filepath: str
+    :param passphrase: Passphrase of the gpg secret key
+    :type passphrase: str
+    :param gpg_options: Additional gpg command line options, e.g. ['--homedir', '/path']
+    :type gpg_options: list
+    """
+    extension = input_format(filepath)
+    if extension == '.gz':
+        with gzip.open(filepath, 'rb') as f:
+            yield f
+    elif extension == '.zip':
+        with zipfile.ZipFile(filepath) as archive:
+            members = [info for info in archive.infolist() if not info.filename.endswith('/')]
+            if len(members) != 1:
+                raise ValueError('Expected a single file in zip archive {0}, found {1}'.format(
+                    filepath, [info.filename for info in members]))
+            with archive.open(members[0]) as f:
+                yield f
+    elif extension in ('.gpg', '.pgp'):
+        with _gpg_decrypt(filepath, passphrase, gpg_options) as f:
+            if input_format(filepath[:-len(extension)]) == '.gz':
+                with gzip.GzipFile(fileobj=f, mode='rb') as decompressed:
+                    yield decompressed
+            else:
+                yield f
+    else:
+        with open(filepath, 'rb') as f:
+            yield f
+
+
+def split_lines(filepath, chunk_bytes, skip_lines=0):
+    """
+    Splits a file into byte ranges of about chunk_bytes which end after a line break, using a memory map.
+    Line breaks inside quoted fields are not recognised.
+    :param filepath: File path
+    :type filepath: str
+    :param chunk_bytes: Approximate size of the ranges
+    :type chunk_bytes: int
+    :param skip_lines: Number of lines at the start of the file which are left out of the ranges
+    :type skip_lines: int
+    :return: List of (start, end) byte offsets
+    """
+    with open(filepath, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return []
+
+        ranges = []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            for _ in range(skip_lines):
+                start = mm.find(b'\n', start) + 1
+                if not start:
+                    return []
+
+            while start < size:
+                end = mm.find(b'\n', min(start + chunk_bytes, size) - 1)
+                end = size if end == -1 else end + 1
+                ranges.append((start, end))
+                start = end
+    return ranges
@@ -0,0 +1,58 @@
+import re
+
+TABLE_IO_PATTERN = re.compile(r"Table '(?P<table>[^']+)'\.\s*(?P<counters>[^.]*)")
+COUNTER_PATTERN = re.compile(r"(?P<name>[a-z][a-z\- ]*?)\s+(?P<value>\d+)", re.IGNORECASE)
+TIME_PATTERN = re.compile(r"SQL Server (?P<phase>parse and compile time|Execution Times):?\s*"
+                          r"CPU time = (?P<cpu>\d+) ms,\s*elapsed time = (?P<elapsed>\d+) ms", re.IGNORECASE)
+SHOWPLAN_COLUMN = 'Microsoft SQL Server 2005 XML Showplan'
+
+
+def parse_statistics(messages):
+    """
+    Parses SQL Server informational messages produced by SET STATISTICS IO, TIME ON
+    for one executed batch.
+    :param messages: Server messages in the order they were received
+    :type messages: list of str
+    :return: Per table IO counters and totals of logical reads, physical reads, CPU and elapsed time
+        Example: {"tables": [{"table": "Orders", "scan_count": 1, "logical_reads": 12, ...}],
+                  "logical_reads": 12, "physical_reads": 0, "read_ahead_reads": 0,
+                  "cpu_time_ms": 16, "elapsed_time_ms": 20,
+                  "compile_cpu_time_ms": 0, "compile_elapsed_time_ms": 1}
+    :type dict
+    """
+    result = {"tables": [],
+              "logical_reads": 0,
+              "physical_reads": 0,
+              "read_ahead_reads": 0,
+              "cpu_time_ms": 0,
+              "elapsed_time_ms": 0,
+              "compile_cpu_time_ms": 0,
+              "compile_elapsed_time_ms": 0}
+
+    for message in messages:
+        if isinstance(message, bytes):
+            message = message.decode('utf-8', 'replace')
+
+        for match in TABLE_IO_PATTERN.finditer(message):
+            table = {"table": match.group('table')}
+            for counter in COUNTER_PATTERN.finditer(match.group('counters')):
+                name = counter.group('name').strip().lower().replace(' ', '_').replace('-', '_')
+                table[name] = int(counter.group('value'))
+            result['tables'].append(table)
+            for key in ('logical_reads', 'physical_reads', 'read_ahead_reads'):
+                result[key] = result[key] + table.get(key, 0)
+
+        for match in TIME_PATTERN.finditer(message):
+            prefix = '' if match.group('phase').lower() == 'execution times' else 'compile_'
+            result[prefix + 'cpu_time_ms'] += int(match.group('cpu'))
+            result[prefix + 'elapsed_time_ms'] += int(match.group('elapsed'))
+
+    return result
+
+
+def format_statistics(statistics):
+    """Returns a one line summary of parsed statement statistics for logging."""
+    return "logical reads: {0}, physical reads: {1}, CPU time: {2} ms, elapsed time: {3} ms, tables: {4}".format(
+        statistics['logical_reads'], statistics['physical_reads'],
+        statistics['cpu_time_ms'], statistics['elapsed_time_ms'],
+        ', '.join('{0} ({1})'.format(t['table'], t.get('logical_reads', 0)) for t in statistics['tables']))
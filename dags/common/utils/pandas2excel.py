@@ -1,12 +1,27 @@
-import sys
+import itertools
+import logging
+from copy import copy
+from collections import OrderedDict
+from datetime import date, datetime
+
+import numpy as np
 import pandas as pd
-from openpyxl.styles import Border, Side, PatternFill, Font, GradientFill, Alignment
+import xlsxwriter
+from openpyxl.styles import Border, Side, PatternFill, Font, GradientFill, Alignment, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import column_index_from_string, range_boundaries
+
+log = logging.getLogger(__name__)
 
 
 class Writer(object):
     def __init__(self, out_file):
         self.out_file = out_file
         self.writer = pd.ExcelWriter(out_file, engine='openpyxl')
+        self.indexes = {}
+        self.widths = {}
+        self.width_regions = {}
+        self.named_styles = {}
 
     # format string output
     def __str__(self):
@@ -18,6 +33,29 @@ class Writer(object):
         print('Creating sheet:', sheet_name)
         worksheet = self.writer.book.create_sheet(sheet_name)
         self.writer.sheets[sheet_name] = worksheet
+        self.refresh_index(sheet_name)
+
+    # drop lookup indexes of a sheet, they are rebuilt on next use
+    def refresh_index(self, sheet_name):
+        self.indexes = {key: index for key, index in self.indexes.items() if key[0] != sheet_name}
+
+    # index of search column label -> row numbers (axis 1) or search row header -> column numbers (axis 2)
+    def get_index(self, sheet_name, axis, search_index):
+        key = (sheet_name, axis, search_index)
+        if key not in self.indexes:
+            worksheet = self.writer.sheets[sheet_name]
+            cells = worksheet[search_index] if axis == 1 else worksheet[search_index + 1]
+            index = {}
+            for cell in cells:
+                if cell.value is not None:
+                    index.setdefault(cell.value, []).append(cell.row if axis == 1 else cell.col_idx)
+            self.indexes[key] = index
+        return self.indexes[key]
+
+    # cells of a row (axis 1) or a column (axis 2), 1-indexed
+    def get_cells(self, sheet_name, axis, i):
+        worksheet = self.writer.sheets[sheet_name]
+        return worksheet[i] if axis == 1 else worksheet[col_letter(i)]
 
     # write pandas to sheet, row and column are 0-indexed
     def insert_df(self, df, sheet_name, start_row=0, start_col=0, index=True, auto_format=True, header=True, header_axis='both', is_full_border=False):
@@ -26,146 +64,148 @@ class Writer(object):
             self.create_sheet(sheet_name)
         df.to_excel(self.writer, sheet_name, startrow=start_row, startcol=start_col, index=index, header=header)
         worksheet = self.writer.sheets[sheet_name]
+        self.refresh_index(sheet_name)
+        self.track_widths(df, sheet_name, start_row, start_col, index, header)
         if auto_format:
-            header_index = str(start_row+1)
-            table_end = str(start_row + df.shape[0] + (1 if header else 0))
-            start_index = start_col+1
-            if index:
-                start_index += 1
-            end_index = start_index+df.shape[1]-1
-            header_font = Font(color='FFFFFF', bold=True)
-            header_fill = PatternFill('solid', fgColor='444444')
+            if header:
+                check_header_axis(header_axis)
+
+            layout = TableLayout(df, start_row, start_col, index, header, header_axis, is_full_border)
+            for row in worksheet.iter_rows(min_row=layout.header_index, max_row=layout.table_end,
+                                           min_col=layout.first_index, max_col=layout.end_index):
+                for cell in row:
+                    parts = layout.style_parts(cell.row, cell.col_idx)
+                    if not parts:
+                        continue
+                    name = self.table_style(parts)
+                    if layout.is_pandas_header(cell.row, cell.col_idx):
+                        self.merge_cell_style(cell, name, parts)
+                    else:
+                        self.apply_cell_style(cell, name)
+
+    # register a named style once per workbook, returns its name
+    def register_style(self, name, font=None, fill=None, border=None, alignment=None, number_format=None):
+        if name not in self.named_styles:
+            style = NamedStyle(name=name)
+            if font:
+                style.font = font
+            if fill:
+                style.fill = fill
+            if border:
+                style.border = border
+            if alignment:
+                style.alignment = alignment
+            if number_format:
+                style.number_format = number_format
+            self.writer.book.add_named_style(style)
+            self.named_styles[name] = style
+        return name
+
+    # named style of auto formatted table cells, e.g. ['header', 'align_right', 'top', 'left']
+    def table_style(self, parts):
+        name = 'pandas2excel ' + ' '.join(parts)
+        if name not in self.named_styles:
             thin = Side(border_style="thin", color="000000")
-            border = Border(top=thin, left=thin, right=thin, bottom=thin)
+            font, fill, alignment = copy(DEFAULT_FONT), None, None
+            if 'header' in parts:
+                font = Font(color='FFFFFF', bold=True)
+                fill = PatternFill('solid', fgColor='444444')
+            if 'align_left' in parts or 'align_right' in parts:
+                alignment = Alignment(horizontal='left' if 'align_left' in parts else 'right')
+            if 'full' in parts:
+                border = Border(top=thin, left=thin, right=thin, bottom=thin)
+            else:
+                border = Border(**{edge: thin for edge in ('top', 'bottom', 'left', 'right') if edge in parts})
+            self.register_style(name, font=font, fill=fill, border=border, alignment=alignment)
+        return name
 
-            # Set border around table
-            to_apply = col_letter(start_index)+header_index+':'+col_letter(end_index)+table_end
-            style_range(worksheet, to_apply, border=border, is_full_border=is_full_border)
+    # apply named style to a cell, keeping number format written by pandas
+    @staticmethod
+    def apply_cell_style(cell, name):
+        cell_number_format = cell.number_format
+        cell.style = name
+        if cell_number_format != 'General':
+            cell.number_format = cell_number_format
 
-            if header:
-                if header_axis not in ['both', 1, 2]:
-                    print('Invalid axis, specify 1 for row, 2 for column')
-                    sys.exit()
-
-                if header_axis in ['both', 1]:
-                    # Set header style
-                    to_apply = col_letter(start_index)+header_index+':'+col_letter(end_index)+header_index
-                    style_range(worksheet, to_apply, font=header_font, fill=header_fill)
-
-                    # right align all but first column
-                    to_apply = col_letter(start_index)+header_index+':'+col_letter(end_index)+table_end
-                    if not index:
-                        to_apply = col_letter(start_index+1)+to_apply[1:]
-                    style_range(worksheet, to_apply, alignment=Alignment(horizontal='right')) # right align all but first header
-
-                if header_axis in ['both', 2]:
-                    # Set first column to match header
-                    if index:
-                        to_apply = col_letter(start_index-1)+header_index+':'+col_letter(start_index-1)+table_end
-                    else:
-                        to_apply = col_letter(start_index)+header_index+':'+col_letter(start_index)+table_end
-                    style_range(worksheet, to_apply, font=header_font, fill=header_fill, alignment=Alignment(horizontal='left'))
+    # merge the parts of a named style onto a cell styled by pandas, keeping the pandas header borders
+    def merge_cell_style(self, cell, name, parts):
+        style = self.named_styles[name]
+        if 'header' in parts:
+            cell.font = style.font
+            cell.fill = style.fill
+        if 'align_left' in parts or 'align_right' in parts:
+            cell.alignment = style.alignment
+        cell.border = style.border if 'full' in parts else cell.border + style.border
+
+    # apply named style to a range (e.g. A1:F20) or to rows and columns, 1-indexed
+    def apply_style(self, sheet_name, name, cell_range=None, min_row=None, max_row=None, min_col=None, max_col=None):
+        worksheet = self.writer.sheets[sheet_name]
+        if cell_range:
+            min_col, min_row, max_col, max_row = range_boundaries(cell_range)
+        for row in worksheet.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col):
+            for cell in row:
+                self.apply_cell_style(cell, name)
 
     # format values, axis 1 is row and axis 2 is column
     def format_values(self, sheet_name, axis, format_dictionary, search_index=None):
-        workbook = self.writer.book
-        worksheet = self.writer.sheets[sheet_name]
-        if axis == 1:
-            if not search_index:
-                search_index = 'A'
-            for f in format_dictionary.keys():
-                row_index = None
-                for i, cell in enumerate(worksheet[search_index+':'+search_index]):
-                    if cell.value == f:
-                        row_index = cell.row
-                        for cell in list(worksheet.rows)[row_index-1]:
-                            cell.number_format = number_format(format_dictionary[f])
-        elif axis == 2:
-            if not search_index:
-                search_index = 1
-            search_index -= 1 # 0 indexed
-            for f in format_dictionary.keys():
-                col_index = None
-                # find corresponding column given column name
-                for i, cell in enumerate(list(worksheet.rows)[search_index]):
-                    if cell.value == f:
-                        col_index = cell.column
-                        for cell in worksheet[col_index+':'+col_index]:
-                            cell.number_format = number_format(format_dictionary[f])
-        else:
-            print('Invalid axis, specify 1 for row and 2 for column')
-            sys.exit()
+        index = self.get_index(sheet_name, axis, search_axis_index(axis, search_index))
+        for f in format_dictionary.keys():
+            value_format = number_format(format_dictionary[f])
+            for i in index.get(f, []):
+                for cell in self.get_cells(sheet_name, axis, i):
+                    cell.number_format = value_format
 
     # paint table, axis 1 is row and axis 2 is column
     def paint_table(self, sheet_name, axis, style_dictionary, search_index=None):
-        workbook = self.writer.book
-        worksheet = self.writer.sheets[sheet_name]
-        if axis == 1:
-            if not search_index:
-                search_index = 'A'
-            for f in style_dictionary.keys():
-                row_index = None
-                for i, cell in enumerate(worksheet[search_index+':'+search_index]):
-                    if cell.value == f:
-                        row_index = cell.row
-                if row_index:
-                    for cell in list(worksheet.rows)[row_index-1]:
-                        if cell.value == None:
-                            continue
-                        cell.fill = fill_styles(style_dictionary[f])
-                        cell.font = Font(color='000000', bold=cell.font.bold)
-                        if cell.font.bold:
-                            if '2' in style_dictionary[f]:
-                                cell.alignment = Alignment(indent=2)
-                            if '3' in style_dictionary[f]:
-                                cell.alignment = Alignment(indent=4)
-        elif axis == 2:
-            if not search_index:
-                search_index = 1
-            search_index -= 1 # 0 indexed
-            for f in style_dictionary.keys():
-                col_index = None
-                # find correspond column
-                for i, cell in enumerate(list(worksheet.rows)[search_index]):
-                    if cell.value == f:
-                        col_index = cell.column
-                if col_index:
-                    for cell in worksheet[col_index+':'+col_index]:
-                        if cell.value:
-                            cell.fill = fill_styles(style_dictionary[f])
-                            cell.font = Font(color='000000', bold=cell.font.bold)
-        else:
-            print('Invalid axis, specify 1 for row and 2 for column')
-            sys.exit()
+        index = self.get_index(sheet_name, axis, search_axis_index(axis, search_index))
+        for f in style_dictionary.keys():
+            if f not in index:
+                continue
+            fill = fill_styles(style_dictionary[f])
+            # last matching row or column is painted
+            for cell in self.get_cells(sheet_name, axis, index[f][-1]):
+                if cell.value is None or (axis == 2 and not cell.value):
+                    continue
+                cell.fill = fill
+                cell.font = Font(color='000000', bold=cell.font.bold)
+                if axis == 1 and cell.font.bold:
+                    if '2' in style_dictionary[f]:
+                        cell.alignment = Alignment(indent=2)
+                    if '3' in style_dictionary[f]:
+                        cell.alignment = Alignment(indent=4)
+
+    # track column widths of a data frame written by insert_df, row and column are 0-indexed
+    def track_widths(self, df, sheet_name, start_row, start_col, index, header):
+        widths = self.widths.setdefault(sheet_name, {})
+        for column, width in table_widths(df, start_col, index, header).items():
+            widths[column] = max([widths[column], width] if column in widths else [width],
+                                 key=lambda candidate: candidate[0])
+
+        header_rows = df.columns.nlevels if header else 0
+        index_levels = df.index.nlevels if index else 0
+        self.width_regions.setdefault(sheet_name, []).append(
+            (start_row + 1, start_row + header_rows + df.shape[0], start_col + 1, start_col + index_levels + df.shape[1]))
 
     # resize all columns automatically based on string length
     def resize_columns(self, sheet_name):
         workbook = self.writer.book
         worksheet = self.writer.sheets[sheet_name]
-        for i, col in enumerate(worksheet.columns):
-            longest = 0
-            longest_type = None
-            for cell in col:
-                value_type = type(cell.value)
-                if value_type == str:
-                    string_length = len(str(cell.value))
-                elif value_type in [int, float]:
-                    string_length = len(str(round(cell.value, 2)))+1
-                elif value_type == pd.Timestamp:
-                    string_length = 10
-                else:
-                    string_length = 8
-                if string_length > longest:
-                    longest = string_length
-                    longest_type = value_type
-            if longest_type in [int, float]:
-                longest = int(1.5*longest)
-            elif longest_type == str:
-                if longest <= 15:
-                    longest = int(1.25*longest)
-                elif longest > 25:
-                    longest = 25
-            worksheet.column_dimensions[col_letter(i+1)].width = longest
+        widths = self.widths.get(sheet_name, {})
+        regions = self.width_regions.get(sheet_name, [])
+        for i in range(1, worksheet.max_column + 1):
+            candidates = [widths[i]] if i in widths else []
+            # measure cells written outside insert_df one by one
+            covered = sorted((r[0], r[1]) for r in regions if r[2] <= i <= r[3])
+            row = 1
+            for first, last in covered + [(worksheet.max_row + 1, worksheet.max_row + 1)]:
+                if row < first:
+                    for cells in worksheet.iter_rows(min_row=row, max_row=first - 1, min_col=i, max_col=i):
+                        candidates.append(cell_width(cells[0].value))
+                row = max(row, last + 1)
+            if not candidates:
+                continue
+            longest, longest_type = max(candidates, key=lambda candidate: candidate[0])
+            worksheet.column_dimensions[col_letter(i)].width = scaled_width(longest, longest_type)
 
     # resize columns from all sheets
     def resize_all(self):
@@ -194,6 +234,349 @@ class Writer(object):
         self.writer.save()
 
 
+class TableLayout(object):
+    """
+    Cell layout of a data frame written by insert_df and the auto format style parts of its cells.
+    Rows and columns are 1-indexed. Cell values are only listed for frames without MultiIndex,
+    which StreamingWriter rejects.
+    """
+
+    def __init__(self, df, start_row, start_col, index, header, header_axis='both', is_full_border=False,
+                 auto_format=True):
+        self.df = df
+        self.index = index
+        self.header = header
+        self.auto_format = auto_format
+        self.is_full_border = is_full_border
+        self.index_levels = df.index.nlevels if index else 0
+        self.header_index = start_row+1
+        self.data_index = self.header_index + (1 if header else 0)
+        self.table_end = start_row + df.shape[0] + (1 if header else 0)
+        self.first_index = start_col+1
+        self.start_index = self.first_index + (1 if index else 0)
+        self.end_index = self.start_index+df.shape[1]-1
+        self.last_index = self.first_index + self.index_levels + df.shape[1] - 1
+        # right align all but first column
+        self.right_index = self.start_index if index else self.start_index+1
+        self.header_rows = header and header_axis in ['both', 1]
+        self.header_cols = header and header_axis in ['both', 2]
+
+    def contains(self, r, c):
+        return self.header_index <= r <= self.table_end and self.first_index <= c <= self.last_index
+
+    # auto format style parts of a cell, e.g. ['header', 'align_right', 'top', 'left']
+    def style_parts(self, r, c):
+        parts = []
+        if not self.auto_format or not self.contains(r, c):
+            return parts
+        # first column matches header
+        if self.header_cols and c == self.first_index:
+            parts += ['header', 'align_left']
+        elif self.header_rows:
+            if r == self.header_index and c >= self.start_index:
+                parts.append('header')
+            if c >= self.right_index:
+                parts.append('align_right')
+        # border around table
+        if self.start_index <= c <= self.end_index:
+            if self.is_full_border:
+                parts.append('full')
+            else:
+                parts += [edge for edge, on in (('top', r == self.header_index), ('bottom', r == self.table_end),
+                                                ('left', c == self.start_index), ('right', c == self.end_index)) if on]
+        return parts
+
+    # pandas writes header and index cells with its own header style
+    def is_pandas_header(self, r, c):
+        return self.contains(r, c) and ((self.header and r == self.header_index) or
+                                        c < self.first_index + self.index_levels)
+
+    # cell values of the header row, empty for no header
+    def header_values(self):
+        if not self.header:
+            return []
+        names = list(self.df.index.names) if self.index else []
+        return [cell_value(v) for v in names + list(self.df.columns)]
+
+    # (row, cell values) of all rows in order
+    def iter_rows(self):
+        if self.header:
+            yield self.header_index, self.header_values()
+        for r, values in enumerate(self.df.itertuples(index=self.index, name=None), self.data_index):
+            yield r, [cell_value(v) for v in values]
+
+    # (row, value) of the cells of column c
+    def column_values(self, c):
+        i = c - self.first_index
+        if not 0 <= i <= self.last_index - self.first_index:
+            return []
+        if i < self.index_levels:
+            name, values = self.df.index.names[i], self.df.index.get_level_values(i)
+        else:
+            name, values = self.df.columns[i - self.index_levels], self.df.iloc[:, i - self.index_levels]
+        cells = [(self.header_index, cell_value(name))] if self.header else []
+        return cells + [(r, cell_value(v)) for r, v in zip(range(self.data_index, self.table_end + 1), values)]
+
+    # (column, value) of the cells of row r
+    def row_values(self, r):
+        if self.header and r == self.header_index:
+            values = self.header_values()
+        elif self.data_index <= r <= self.table_end:
+            k = r - self.data_index
+            index_values = [self.df.index[k]] if self.index else []
+            values = [cell_value(v) for v in index_values + list(self.df.iloc[k])]
+        else:
+            return []
+        return list(zip(range(self.first_index, self.last_index + 1), values))
+
+
+class StreamingWriter(object):
+    """
+    Writer backed by an xlsxwriter constant_memory workbook, with the same interface as Writer.
+    insert_df, format_values, paint_table, resize_columns, set_widths and remove_gridlines are recorded
+    and the workbook is rendered row by row on save, with cell formats shared between cells.
+    """
+
+    def __init__(self, out_file):
+        self.out_file = out_file
+        self.sheets = OrderedDict()
+        self.indexes = {}
+        self.sequence = itertools.count()
+
+    # format string output
+    def __str__(self):
+        str = ' Pandas to Excel Streaming Writer, out_file: ' + self.out_file
+        return str
+
+    # create sheet
+    def create_sheet(self, sheet_name):
+        log.info('Creating sheet: %s', sheet_name)
+        self.sheets[sheet_name] = {'tables': [], 'row_rules': {}, 'col_rules': {}, 'widths': {}, 'gridlines': True}
+        self.refresh_index(sheet_name)
+
+    # drop lookup indexes of a sheet, they are rebuilt on next use
+    def refresh_index(self, sheet_name):
+        self.indexes = {key: index for key, index in self.indexes.items() if key[0] != sheet_name}
+
+    # record pandas to sheet, row and column are 0-indexed
+    def insert_df(self, df, sheet_name, start_row=0, start_col=0, index=True, auto_format=True, header=True, header_axis='both', is_full_border=False):
+        if sheet_name not in self.sheets:
+            log.info('Sheet %s does not exist, creating', sheet_name)
+            self.create_sheet(sheet_name)
+        if auto_format and header:
+            check_header_axis(header_axis)
+        if isinstance(df.columns, pd.MultiIndex) or (index and isinstance(df.index, pd.MultiIndex)):
+            raise ValueError('StreamingWriter does not write MultiIndex columns or index, '
+                             'use Writer to get the merged header cells of pandas')
+        self.sheets[sheet_name]['tables'].append(
+            TableLayout(df, start_row, start_col, index, header, header_axis, is_full_border, auto_format))
+        self.refresh_index(sheet_name)
+
+    # index of search column label -> row numbers (axis 1) or search row header -> column numbers (axis 2)
+    def get_index(self, sheet_name, axis, search_index):
+        key = (sheet_name, axis, search_index)
+        if key not in self.indexes:
+            cells = {}
+            # later tables overwrite cells of earlier tables
+            for table in self.sheets[sheet_name]['tables']:
+                if axis == 1:
+                    cells.update(table.column_values(column_index_from_string(search_index)))
+                else:
+                    cells.update(table.row_values(search_index + 1))
+            index = {}
+            for i in sorted(cells):
+                if cells[i] is not None:
+                    index.setdefault(cells[i], []).append(i)
+            self.indexes[key] = index
+        return self.indexes[key]
+
+    # record rule for a row (axis 1) or a column (axis 2)
+    def add_rule(self, sheet_name, axis, i, kind, style):
+        rules = self.sheets[sheet_name]['row_rules' if axis == 1 else 'col_rules']
+        rules.setdefault(i, []).append((next(self.sequence), axis, kind, style))
+
+    # format values, axis 1 is row and axis 2 is column
+    def format_values(self, sheet_name, axis, format_dictionary, search_index=None):
+        index = self.get_index(sheet_name, axis, search_axis_index(axis, search_index))
+        for f in format_dictionary.keys():
+            for i in index.get(f, []):
+                self.add_rule(sheet_name, axis, i, 'number_format', format_dictionary[f])
+
+    # paint table, axis 1 is row and axis 2 is column
+    def paint_table(self, sheet_name, axis, style_dictionary, search_index=None):
+        index = self.get_index(sheet_name, axis, search_axis_index(axis, search_index))
+        for f in style_dictionary.keys():
+            # last matching row or column is painted
+            if f in index:
+                self.add_rule(sheet_name, axis, index[f][-1], 'paint', style_dictionary[f])
+
+    # resize all columns automatically based on string length
+    def resize_columns(self, sheet_name):
+        sheet = self.sheets[sheet_name]
+        widths = {}
+        for table in sheet['tables']:
+            for column, width in table_widths(table.df, table.first_index - 1, table.index, table.header).items():
+                widths[column] = max([widths[column], width] if column in widths else [width],
+                                     key=lambda candidate: candidate[0])
+        if not sheet['tables']:
+            return
+        # empty cells above, between and beside tables are measured as in Writer.resize_columns
+        max_row = max(table.table_end for table in sheet['tables'])
+        max_column = max(table.last_index for table in sheet['tables'])
+        for i in range(1, max_column + 1):
+            rows = set()
+            for table in sheet['tables']:
+                if table.first_index <= i <= table.last_index:
+                    rows.update(range(table.header_index, table.table_end + 1))
+            candidates = [widths[i]] if i in widths else []
+            if len(rows) < max_row:
+                candidates.append(cell_width(None))
+            longest, longest_type = max(candidates, key=lambda candidate: candidate[0])
+            sheet['widths'][i] = scaled_width(longest, longest_type)
+
+    # resize columns from all sheets
+    def resize_all(self):
+        for sheet in self.sheets:
+            self.resize_columns(sheet)
+
+    # remove gridlines
+    def remove_gridlines(self, sheet_name):
+        self.sheets[sheet_name]['gridlines'] = False
+
+    # remove gridlines from all sheets
+    def remove_all_gridlines(self):
+        for sheet in self.sheets:
+            self.remove_gridlines(sheet)
+
+    # set widths manually
+    def set_widths(self, sheet_name, widths):
+        for w in widths.keys():
+            self.sheets[sheet_name]['widths'][column_index_from_string(w)] = widths[w]
+
+    # xlsxwriter format properties of a cell
+    @staticmethod
+    def cell_properties(table, r, c, value, rules):
+        parts = table.style_parts(r, c)
+        properties = {}
+        # table parts are merged onto the pandas header style, as Writer.merge_cell_style does
+        if table.is_pandas_header(r, c):
+            properties.update(PANDAS_HEADER_FORMAT)
+            # an align part replaces the whole pandas alignment
+            if 'align_left' in parts or 'align_right' in parts:
+                properties.pop('valign')
+        properties.update(table_format(parts))
+
+        if isinstance(value, datetime):
+            properties['num_format'] = 'yyyy-mm-dd hh:mm:ss'
+        elif isinstance(value, date):
+            properties['num_format'] = 'yyyy-mm-dd'
+
+        for _, axis, kind, style in sorted(rules):
+            if kind == 'number_format':
+                properties['num_format'] = number_format(style)
+            elif value is not None and (axis == 1 or value):
+                properties.update(pattern=1, bg_color='#' + FILL_COLORS[style], font_color='#000000')
+                if axis == 1 and properties.get('bold'):
+                    # the indent replaces the whole alignment, as in Writer.paint_table
+                    if '2' in style:
+                        properties.pop('align', None)
+                        properties.pop('valign', None)
+                        properties['indent'] = 2
+                    if '3' in style:
+                        properties.pop('align', None)
+                        properties.pop('valign', None)
+                        properties['indent'] = 4
+        return properties
+
+    # render a sheet row by row
+    def write_sheet(self, workbook, sheet_name, formats):
+        sheet = self.sheets[sheet_name]
+        worksheet = workbook.add_worksheet(sheet_name)
+        if not sheet['gridlines']:
+            worksheet.hide_gridlines(2)
+        for column, width in sheet['widths'].items():
+            worksheet.set_column(column - 1, column - 1, width)
+
+        # tables are merged row by row, later tables overwrite cells of earlier tables
+        tables = [(table, table.iter_rows()) for table in sheet['tables']]
+        pending = [(next(rows, None), i) for i, (table, rows) in enumerate(tables)]
+        while True:
+            current = [row for row, _ in pending if row is not None]
+            if not current:
+                break
+            r = min(row[0] for row in current)
+            cells = {}
+            for k, (row, i) in enumerate(pending):
+                if row is not None and row[0] == r:
+                    table, rows = tables[i]
+                    for c, value in enumerate(row[1], table.first_index):
+                        cells[c] = (table, value)
+                    pending[k] = (next(rows, None), i)
+
+            for c in sorted(cells):
+                table, value = cells[c]
+                rules = sheet['row_rules'].get(r, []) + sheet['col_rules'].get(c, [])
+                properties = self.cell_properties(table, r, c, value, rules)
+                key = tuple(sorted(properties.items()))
+                if key not in formats:
+                    formats[key] = workbook.add_format(properties) if properties else None
+                if value is None:
+                    if formats[key] is not None:
+                        worksheet.write_blank(r - 1, c - 1, None, formats[key])
+                else:
+                    worksheet.write(r - 1, c - 1, value, formats[key])
+
+    def save(self):
+        workbook = xlsxwriter.Workbook(self.out_file, {'constant_memory': True, 'strings_to_urls': False})
+        formats = {}
+        for sheet_name in self.sheets:
+            self.write_sheet(workbook, sheet_name, formats)
+        workbook.close()
+
+
+def cell_value(value):
+    """Returns the value written to a cell for a data frame value, NaN and NaT are empty cells"""
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        value = value.item()
+    if value is None or (isinstance(value, (float, type(pd.NaT))) and pd.isnull(value)):
+        return None
+    return value
+
+
+def table_format(parts):
+    """Returns xlsxwriter format properties of auto formatted table cell style parts"""
+    properties = {}
+    if 'header' in parts:
+        properties.update(font_color='#FFFFFF', bold=True, pattern=1, bg_color='#444444')
+    if 'align_left' in parts:
+        properties['align'] = 'left'
+    elif 'align_right' in parts:
+        properties['align'] = 'right'
+    for edge in ('top', 'bottom', 'left', 'right'):
+        if 'full' in parts or edge in parts:
+            properties[edge] = 1
+            properties[edge + '_color'] = '#000000'
+    return properties
+
+
+def check_header_axis(header_axis):
+    """Raises ValueError unless header_axis of an auto formatted table is 'both', 1 (row) or 2 (column)"""
+    if header_axis not in ['both', 1, 2]:
+        raise ValueError("Invalid header_axis {0}, specify 'both', 1 for row or 2 for column".format(header_axis))
+
+
+def search_axis_index(axis, search_index=None):
+    """
+    Returns the search index of format_values and paint_table: the column letter searched for row labels (axis 1,
+    default 'A') or the 0-indexed row searched for column headers (axis 2, from a 1-indexed row, default 1)
+    """
+    if axis == 1:
+        return search_index or 'A'
+    if axis == 2:
+        return (search_index or 1) - 1
+    raise ValueError('Invalid axis {0}, specify 1 for row and 2 for column'.format(axis))
+
+
 def col_letter(i):
     string = ""
     while i > 0:
@@ -202,6 +585,78 @@ def col_letter(i):
     return string
 
 
+def cell_width(value):
+    """Returns string length and type of a cell value used to size its column"""
+    value_type = type(value)
+    if value_type == str:
+        return len(value), str
+    if value_type in [int, float]:
+        return len(str(round(value, 2)))+1, float
+    if value_type == pd.Timestamp:
+        return 10, pd.Timestamp
+    return 8, None
+
+
+def column_widths(values):
+    """Returns candidate (length, type) widths of a series as cell_width measures its cells"""
+    candidates = []
+    present = values.dropna()
+    if len(present) < len(values):
+        candidates.append((8, None))
+    if present.empty:
+        return candidates
+
+    if pd.api.types.is_bool_dtype(present):
+        candidates.append((8, None))
+    elif pd.api.types.is_numeric_dtype(present):
+        candidates.append((int(present.round(2).astype(str).str.len().max())+1, float))
+    elif pd.api.types.is_datetime64_any_dtype(present):
+        # cells hold datetime values, not pd.Timestamp, when the column is measured cell by cell
+        candidates.append((8, None))
+    else:
+        # str.len is NaN for values which are not strings, str accessor fails when there are no strings
+        try:
+            lengths = present.str.len()
+        except AttributeError:
+            lengths = pd.Series([None] * len(present), dtype=float)
+        if lengths.notna().any():
+            candidates.append((int(lengths.max()), str))
+        if lengths.isna().any():
+            candidates.append((8, None))
+    return candidates
+
+
+def table_widths(df, start_col, index, header):
+    """Returns candidate (length, type) width by 1-indexed column of a data frame written at start_col"""
+    columns = []
+    if index:
+        for level, name in enumerate(df.index.names):
+            columns.append((name, df.index.get_level_values(level).to_series()))
+    for i in range(df.shape[1]):
+        columns.append((df.columns[i], df.iloc[:, i]))
+
+    widths = {}
+    for i, (name, values) in enumerate(columns):
+        candidates = column_widths(values)
+        if header:
+            name = name if isinstance(name, tuple) else (name,)
+            candidates.insert(0, max((cell_width(n) for n in name), key=lambda candidate: candidate[0]))
+        widths[start_col + i + 1] = max(candidates, key=lambda candidate: candidate[0])
+    return widths
+
+
+def scaled_width(longest, longest_type):
+    """Returns column width for the longest value length and its type"""
+    if longest_type == float:
+        longest = int(1.5*longest)
+    elif longest_type == str:
+        if longest <= 15:
+            longest = int(1.25*longest)
+        elif longest > 25:
+            longest = 25
+    return longest
+
+
 def style_range(ws, cell_range, border=Border(), fill=None, font=None, alignment=None, number_format=None, is_full_border=False):
     """
     Apply styles to a range of cells as if they were a single cell.
@@ -213,23 +668,30 @@ def style_range(ws, cell_range, border=Border(), fill=None, font=None, alignment
     :param font: An openpyxl Font object
     """
 
-    top = Border(top=border.top)
-    left = Border(left=border.left)
-    right = Border(right=border.right)
-    bottom = Border(bottom=border.bottom)
+    edges = {'top': Border(top=border.top),
+             'left': Border(left=border.left),
+             'right': Border(right=border.right),
+             'bottom': Border(bottom=border.bottom)}
+    # combined borders are shared between cells with the same border and edge
+    combined = {}
+
+    def add_edge(cell, edge):
+        current = cell.border
+        key = (edge, current.left, current.right, current.top, current.bottom)
+        if key not in combined:
+            combined[key] = current + edges[edge]
+        cell.border = combined[key]
 
     rows = ws[cell_range]
 
     for cell in rows[0]:
-        cell.border = cell.border + top
+        add_edge(cell, 'top')
     for cell in rows[-1]:
-        cell.border = cell.border + bottom
+        add_edge(cell, 'bottom')
 
     for row in rows:
-        l = row[0]
-        r = row[-1]
-        l.border = l.border + left
-        r.border = r.border + right
+        add_edge(row[0], 'left')
+        add_edge(row[-1], 'right')
         for c in row:
             if is_full_border:
                 c.border = border
@@ -257,26 +719,31 @@ def number_format(style):
     return formats[style]
 
 
+FILL_COLORS = {
+    'Red': 'a82f2f',
+    'Red2': 'E6B4B4',
+    'Red3': 'F0DCDC',
+    'Orange': 'E1640A',
+    'Orange2': 'FABE8C',
+    'Orange3': 'FAE6DC',
+    'Yellow': 'c9c900',
+    'Yellow2': 'F0F0AA',
+    'Yellow3': 'ffffd6',
+    'Green': '2ca25f',
+    'Green2': '99d8c9',
+    'Green3': 'e5f5f9',
+    'Blue': '2b8cbe',
+    'Blue2': 'a6bddb',
+    'Blue3': 'eff3ff',
+    'Purple': '756bb1',
+    'Purple2': 'bcbddc',
+    'Purple3': 'efedf5',
+    'DarkBlue': '203764'
+}
+
+# pandas header style of header and index cells
+PANDAS_HEADER_FORMAT = {'bold': True, 'top': 1, 'bottom': 1, 'left': 1, 'right': 1, 'align': 'center', 'valign': 'top'}
+
+
 def fill_styles(style):
-    styles = {
-    'Red': PatternFill('solid', fgColor='a82f2f'),
-    'Red2': PatternFill('solid', fgColor='E6B4B4'),
-    'Red3': PatternFill('solid', fgColor='F0DCDC'),
-    'Orange': PatternFill('solid', fgColor='E1640A'),
-    'Orange2': PatternFill('solid', fgColor='FABE8C'),
-    'Orange3': PatternFill('solid', fgColor='FAE6DC'),
-    'Yellow': PatternFill('solid', fgColor='c9c900'),
-    'Yellow2': PatternFill('solid', fgColor='F0F0AA'),
-    'Yellow3': PatternFill('solid', fgColor='ffffd6'),
-    'Green': PatternFill('solid', fgColor='2ca25f'),
-    'Green2': PatternFill('solid', fgColor='99d8c9'),
-    'Green3': PatternFill('solid', fgColor='e5f5f9'),
-    'Blue': PatternFill('solid', fgColor='2b8cbe'),
-    'Blue2': PatternFill('solid', fgColor='a6bddb'),
-    'Blue3': PatternFill('solid', fgColor='eff3ff'),
-    'Purple': PatternFill('solid', fgColor='756bb1'),
-    'Purple2': PatternFill('solid', fgColor='bcbddc'),
-    'Purple3': PatternFill('solid', fgColor='efedf5'),
-    'DarkBlue': PatternFill('solid', fgColor='203764')
-    }
-    return styles[style]
+    return PatternFill('solid', fgColor=FILL_COLORS[style])
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import logging
+import os
+import os.path as op
+import pickle
+import time
+
+
+class QueryCache(object):
+    """
+    Result cache for lookup queries stored as pickle files on local disk or S3, with time to live.
+
+    :param location: Local directory or s3://bucket/prefix to store cached results
+    :type location: str
+    :param ttl: Number of seconds a cached result is valid
+    :type ttl: int
+    :param aws_conn_id: AWS connection used when location is on S3
+    :type aws_conn_id: str
+    """
+
+    def __init__(self, location, ttl, aws_conn_id='aws_default'):
+        self.location = location.rstrip('/')
+        self.ttl = ttl
+        self.aws_conn_id = aws_conn_id
+        self.is_s3 = location.startswith('s3://')
+        self._s3_hook = None
+
+    @staticmethod
+    def make_key(sql, parameters=None, conn_id=None, *extra):
+        """Returns sha256 hash of the rendered sql, parameters, connection id and any extra values"""
+        payload = json.dumps([sql, parameters, conn_id] + list(extra), sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return '{0}/{1}.pkl'.format(self.location, key) if self.is_s3 else op.join(self.location, key + '.pkl')
+
+    @property
+    def s3_hook(self):
+        if self._s3_hook is None:
+            from common.hooks.s3_hook import S3Hook
+            self._s3_hook = S3Hook(aws_conn_id=self.aws_conn_id)
+        return self._s3_hook
+
+    @staticmethod
+    def _s3_path_split(path):
+        from common.hooks.s3_hook import _s3_path_split
+        return _s3_path_split(path)
+
+    def _read(self, path):
+        if self.is_s3:
+            bucket, key = self._s3_path_split(path)
+            if not self.s3_hook.check_for_key(key, bucket_name=bucket):
+                return None
+            return self.s3_hook.get_key(key, bucket_name=bucket).get()['Body'].read()
+
+        if not op.isfile(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def get(self, key):
+        """
+        Returns a tuple (hit, value). Expired entries are reported as a miss.
+        """
+        data = self._read(self._path(key))
+        if data is None:
+            return False, None
+
+        entry = pickle.loads(data)
+        if time.time() - entry['created'] > self.ttl:
+            logging.info('Cached result {0} expired'.format(key))
+            return False, None
+        return True, entry['value']
+
+    def set(self, key, value):
+        data = pickle.dumps({'created': time.time(), 'value': value}, protocol=pickle.HIGHEST_PROTOCOL)
+        path = self._path(key)
+        if self.is_s3:
+            bucket, s3_key = self._s3_path_split(path)
+            self.s3_hook.load_bytes(data, key=s3_key, bucket_name=bucket, replace=True)
+        else:
+            os.makedirs(self.location, exist_ok=True)
+            tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    def invalidate(self, key):
+        """Removes a cached result"""
+        path = self._path(key)
+        if self.is_s3:
+            bucket, s3_key = self._s3_path_split(path)
+            self.s3_hook.delete_objects(bucket, [s3_key])
+        elif op.isfile(path):
+            os.remove(path)
@@ -0,0 +1,133 @@
+from airflow.exceptions import AirflowException
+from collections import Counter
+from common.hooks.mssql_hook import bulk_insert_isolating
+from common.utils.etl_utils import REJECT_REASON_COLUMN, reject_rows
+
+import logging
+import os
+import threading
+
+
+class RejectFile(object):
+    """
+    Collects rejected rows of a load in a CSV file, with the reject reason in the last column,
+    and counts them by reason. The file is created with the first rejected rows, an existing file is removed.
+    Rows can be written from multiple threads.
+
+    :param filepath: Reject file path
+    :type filepath: str
+    :param sep: Field delimiter of the reject file
+    :type sep: str
+    :param max_rejects: Maximum number of rejected rows as a count, or as a fraction of the source rows
+        when a float below 1. Default None is no limit.
+    :type max_rejects: int or float
+    :param encoding: Reject file encoding
+    :type encoding: str
+    :param log: Logger used for reject log lines
+    :type log: logging.Logger
+    """
+
+    def __init__(self, filepath, sep=',', max_rejects=None, encoding='utf-8', log=None):
+        self.filepath = filepath
+        self.sep = sep
+        self.max_rejects = max_rejects
+        self.encoding = encoding
+        self.log = log or logging.getLogger(__name__)
+        self.rows = 0
+        self.source_rows = 0
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+    def write(self, rejects):
+        """
+        Appends rejected rows to the file.
+        :param rejects: Rejected source rows with the reason in REJECT_REASON_COLUMN
+        :type rejects: Pandas data frame
+        """
+        if rejects.empty:
+            return
+        with self._lock:
+            with open(self.filepath, 'a', encoding=self.encoding, newline='') as f:
+                rejects.to_csv(f, sep=self.sep, index=False, header=not self.rows)
+            self.rows += rejects.shape[0]
+            self.counts.update(rejects[REJECT_REASON_COLUMN].tolist())
+
+    def add_source_rows(self, rows):
+        """Counts rows read from the source, for max_rejects as a fraction"""
+        with self._lock:
+            self.source_rows += rows
+
+    def reject(self, rejects, source_rows=0):
+        """
+        Writes rejected rows of a chunk and counts the source rows of the chunk,
+        raises AirflowException when more rows are rejected than a max_rejects count.
+        :param rejects: Rejected source rows with the reason in REJECT_REASON_COLUMN
+        :type rejects: Pandas data frame
+        :param source_rows: Number of rows read from the source in the chunk
+        :type source_rows: int
+        """
+        self.add_source_rows(source_rows)
+        if rejects.empty:
+            return
+        self.write(rejects)
+        self.log.warning("Rejected {0} rows, total {1} rows".format(rejects.shape[0], self.rows))
+        if self.exceeded():
+            raise AirflowException("Rejected {0} rows, more than max_rejects {1}: {2}".format(
+                self.rows, self.max_rejects, dict(self.counts)))
+
+    def exceeded(self, final=False):
+        """
+        Returns True when more rows were rejected than max_rejects.
+        A fraction is only checked when final, after all source rows are read.
+        """
+        if self.max_rejects is None:
+            return False
+        if isinstance(self.max_rejects, float) and self.max_rejects < 1:
+            return final and self.rows > self.max_rejects * self.source_rows
+        return self.rows > self.max_rejects
+
+    def check(self):
+        """Raises AirflowException when more rows were rejected than max_rejects, after all source rows are read"""
+        if self.exceeded(final=True):
+            raise AirflowException("Rejected {0} of {1} rows, more than max_rejects {2}: {3}".format(
+                self.rows, self.source_rows, self.max_rejects, dict(self.counts)))
+
+    def summary(self):
+        """Returns the number of rejected rows, counts by reason and the file path as a dictionary for XCom"""
+        return {"filepath": self.filepath if self.rows else None,
+                "rows": self.rows,
+                "source_rows": self.source_rows,
+                "reasons": dict(self.counts.most_common())}
+
+
+def bulk_insert_rejecting(conn, table, records, source=None, reject_file=None, tablock=True, batch_size=None):
+    """
+    Bulk inserts records of a chunk. With a reject file the rows which fail on the server are isolated
+    with bulk_insert_isolating and their source rows are rejected with the first line of the error as reason.
+    :param conn: cTDS connection with autocommit
+    :type conn: ctds.Connection
+    :param table: Name of the target table
+    :type table: str
+    :param records: Rows as dictionaries or tuples
+    :type records: list
+    :param source: Source rows of the records in the same order, required with a reject file
+    :type source: Pandas data frame
+    :param reject_file: Reject file, or None to insert without isolating failing rows
+    :type reject_file: RejectFile
+    :param tablock: Table lock hint for fast inserts
+    :type tablock: bool
+    :param batch_size: Rows per batch without a reject file, with a reject file the chunk is one batch
+    :type batch_size: int
+    :return: Number of rows inserted
+    """
+    if reject_file is None:
+        return conn.bulk_insert(table=table, rows=records, batch_size=batch_size, tablock=tablock)
+
+    rows_saved, failed = bulk_insert_isolating(conn, table, records, tablock)
+    if failed:
+        reasons = {source.index[position]: 'Insert failed: {0}'.format(str(err).strip().splitlines()[0])
+                   for position, err in failed}
+        reject_file.reject(reject_rows(source, reasons))
+    return rows_saved
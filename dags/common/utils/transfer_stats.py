@@ -0,0 +1,120 @@
+from airflow.stats import Stats
+from contextlib import contextmanager
+from itertools import islice
+
+import logging
+import time
+
+TRANSFER_STAGES = ('fetch', 'transform', 'encode', 'insert')
+
+
+def approximate_size(rows, sample_size=100):
+    """
+    Approximates the payload size in bytes of a chunk of rows.
+    Only the first sample_size rows are measured and the result is extrapolated to the whole chunk.
+    :param rows: Rows as tuples or dictionaries
+    :type rows: list
+    :param sample_size: Number of rows to measure. Pass None to measure all rows.
+    :type sample_size: int
+    :return: Approximate size in bytes
+    :type int
+    """
+    rows_count = len(rows)
+    if not rows_count:
+        return 0
+
+    sample = rows if sample_size is None else list(islice(rows, sample_size))
+    size = 0
+    for row in sample:
+        for value in (row.values() if isinstance(row, dict) else row):
+            # cTDS wrappers such as SqlVarChar keep the encoded payload in value
+            value = getattr(value, 'value', value)
+            if isinstance(value, (str, bytes, bytearray)):
+                size += len(value)
+            elif value is None:
+                size += 1
+            else:
+                size += 8
+    return size * rows_count // len(sample)
+
+
+class TransferStats(object):
+    """
+    Collects per-chunk transfer metrics (stage timings, rows and approximate bytes),
+    emits them through Airflow Stats (statsd) and summarizes them for XCom.
+
+    :param metric_prefix: Prefix of statsd metric names, e.g. 'mssql_transfer.dag_id.task_id'
+    :type metric_prefix: str
+    :param log: Logger used for per-chunk log lines
+    :type log: logging.Logger
+    """
+
+    def __init__(self, metric_prefix, log=None):
+        self.metric_prefix = metric_prefix
+        self.log = log or logging.getLogger(__name__)
+        self.chunks = 0
+        self.rows = 0
+        self.bytes = 0
+        self.timings = dict.fromkeys(TRANSFER_STAGES, 0.0)
+        self._chunk_timings = dict.fromkeys(TRANSFER_STAGES, 0.0)
+        self._started = time.monotonic()
+
+    @contextmanager
+    def timer(self, stage):
+        """Charges the time spent in the with block to a stage of the current chunk."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._chunk_timings[stage] = self._chunk_timings.get(stage, 0.0) + time.monotonic() - start
+
+    def iterate(self, iterable, stage='fetch'):
+        """Yields items from iterable, charging the time spent producing each item to a stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.timer(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def add_chunk(self, rows, rows_count=None):
+        """
+        Closes the current chunk: records its rows and approximate bytes,
+        emits the chunk metrics and resets the chunk timings.
+        :param rows: Rows of the chunk, used to approximate its size
+        :type rows: list
+        :param rows_count: Number of rows written, defaults to len(rows)
+        :type rows_count: int
+        """
+        rows_count = len(rows) if rows_count is None else rows_count
+        size = approximate_size(rows)
+        self.chunks += 1
+        self.rows += rows_count
+        self.bytes += size
+
+        for stage, seconds in self._chunk_timings.items():
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+            Stats.timing('{0}.{1}_time'.format(self.metric_prefix, stage), seconds * 1000)
+        Stats.incr('{0}.rows'.format(self.metric_prefix), rows_count)
+        Stats.incr('{0}.bytes'.format(self.metric_prefix), size)
+
+        self.log.info("Chunk {0}: {1} rows, ~{2} bytes, timings (s): {3}".format(
+            self.chunks, rows_count, size,
+            ', '.join('{0}={1:.3f}'.format(k, v) for k, v in self._chunk_timings.items())))
+        self._chunk_timings = dict.fromkeys(self._chunk_timings, 0.0)
+
+    def summary(self):
+        """Returns the transfer totals and throughput as a dictionary suitable for XCom."""
+        elapsed = time.monotonic() - self._started
+        summary = {"chunks": self.chunks,
+                   "rows": self.rows,
+                   "bytes": self.bytes,
+                   "elapsed_time": round(elapsed, 3),
+                   "rows_per_sec": round(self.rows / elapsed, 1) if elapsed else None,
+                   "bytes_per_sec": round(self.bytes / elapsed, 1) if elapsed else None}
+        summary.update({'{0}_time'.format(k): round(v, 3) for k, v in self.timings.items()})
+
+        Stats.timing('{0}.elapsed_time'.format(self.metric_prefix), elapsed * 1000)
+        return summary
@@ -0,0 +1,149 @@
+import os
+import os.path as op
+import tempfile
+from contextlib import contextmanager
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SPILLED_RESULT_KEY = '__spilled_result__'
+SPILL_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def _records_to_table(records, is_dict):
+    if is_dict:
+        columns = list(records[0].keys()) if records else []
+        return pa.Table.from_pydict({col: [record.get(col) for record in records] for col in columns})
+    width = len(records[0]) if records else 0
+    return pa.Table.from_pydict({'column_{0}'.format(i): [record[i] for record in records] for i in range(width)})
+
+
+def spill_records(records, filepath, file_format='parquet', aws_conn_id='aws_default', row_group_size=50000):
+    """
+    Writes a result set to a columnar file and returns a small reference to it to be used as XCom value.
+    :param records: Result set as a list of dictionaries or a list of tuples
+    :type records: list
+    :param filepath: Local file path or s3://bucket/key
+    :type filepath: str
+    :param file_format: 'parquet' or 'arrow' (Arrow IPC file)
+    :type file_format: str
+    :param aws_conn_id: Connection used when filepath is on S3
+    :type aws_conn_id: str
+    :param row_group_size: Number of rows per parquet row group / arrow record batch,
+        which is the unit read by the lazy loader.
+    :type row_group_size: int
+    :return: Reference to the spilled result, e.g.
+        {"__spilled_result__": True, "path": "s3://bucket/key.parquet", "format": "parquet",
+         "rows": 100000, "is_dict": True, "aws_conn_id": "aws_default"}
+    :type dict
+    """
+    if file_format not in SPILL_FORMATS:
+        raise ValueError('Invalid spill format {0}, expected one of {1}'.format(file_format, list(SPILL_FORMATS)))
+
+    is_dict = bool(records) and isinstance(records[0], dict)
+    table = _records_to_table(records, is_dict)
+    is_s3 = filepath.startswith('s3://')
+    local_filepath = _temporary_filepath(SPILL_FORMATS[file_format]) if is_s3 else filepath
+
+    try:
+        if file_format == 'parquet':
+            pq.write_table(table, local_filepath, row_group_size=row_group_size, compression='snappy')
+        else:
+            with pa.OSFile(local_filepath, 'wb') as sink:
+                writer = pa.ipc.new_file(sink, table.schema)
+                for batch in table.to_batches(max_chunksize=row_group_size):
+                    writer.write_batch(batch)
+                writer.close()
+
+        if is_s3:
+            from common.hooks.s3_hook import S3Hook
+            S3Hook(aws_conn_id=aws_conn_id).store_file(filepath, local_filepath)
+    finally:
+        if is_s3 and op.exists(local_filepath):
+            os.remove(local_filepath)
+
+    return {SPILLED_RESULT_KEY: True,
+            "path": filepath,
+            "format": file_format,
+            "rows": table.num_rows,
+            "is_dict": is_dict,
+            "aws_conn_id": aws_conn_id}
+
+
+def _temporary_filepath(suffix):
+    fd, filepath = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    return filepath
+
+
+def is_spilled_result(value):
+    return isinstance(value, dict) and value.get(SPILLED_RESULT_KEY, False)
+
+
+def load_result(value):
+    """
+    Returns a lazy SpilledResult for an XCom value produced by spill_records,
+    any other XCom value is returned unchanged.
+    Example: records = load_result(task_instance.xcom_pull('get_institutions'))
+    """
+    return SpilledResult(value) if is_spilled_result(value) else value
+
+
+class SpilledResult(object):
+    """
+    Lazily reads a result set spilled by spill_records. Nothing is read until the result is iterated,
+    and iteration reads one parquet row group or arrow record batch at a time.
+    S3 files are downloaded to a temporary file each time the result is read, the file is removed after reading.
+    """
+
+    def __init__(self, reference):
+        self.reference = reference
+
+    def __len__(self):
+        return self.reference['rows']
+
+    def __iter__(self):
+        for batch in self.iter_batches():
+            columns = [column.to_pylist() for column in batch.columns]
+            if self.reference['is_dict']:
+                names = batch.schema.names
+                for values in zip(*columns):
+                    yield dict(zip(names, values))
+            else:
+                for values in zip(*columns):
+                    yield values
+
+    @contextmanager
+    def _local_filepath(self):
+        path = self.reference['path']
+        if not path.startswith('s3://'):
+            yield path
+            return
+
+        from common.hooks.s3_hook import S3Hook
+        local_filepath = _temporary_filepath(SPILL_FORMATS[self.reference['format']])
+        try:
+            S3Hook(aws_conn_id=self.reference['aws_conn_id']).retrieve_file(path, local_filepath)
+            yield local_filepath
+        finally:
+            os.remove(local_filepath)
+
+    def iter_batches(self):
+        """Yields pyarrow record batches of the spilled result"""
+        with self._local_filepath() as filepath:
+            if self.reference['format'] == 'parquet':
+                parquet_file = pq.ParquetFile(filepath)
+                for i in range(parquet_file.num_row_groups):
+                    for batch in parquet_file.read_row_group(i).to_batches():
+                        yield batch
+            else:
+                reader = pa.ipc.open_file(pa.memory_map(filepath, 'r'))
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i)
+
+    def to_pandas(self):
+        """Reads the whole spilled result into a pandas data frame"""
+        with self._local_filepath() as filepath:
+            if self.reference['format'] == 'parquet':
+                return pq.read_table(filepath).to_pandas()
+            return pa.ipc.open_file(pa.memory_map(filepath, 'r')).read_all().to_pandas()
@@ -0,0 +1,284 @@
+from collections import deque
+from datetime import date, datetime, time
+from decimal import Decimal
+from xml.sax.saxutils import escape, unescape
+
+import itertools
+import logging
+import math
+import os
+import re
+import shutil
+import zipfile
+
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_SHEET_NAME_LENGTH = 31
+
+STREAMING_WORKBOOK_OPTIONS = {'constant_memory': True,
+                              'strings_to_urls': False,
+                              'default_date_format': 'yyyy-mm-dd hh:mm:ss'}
+
+
+def rollover_sheet_name(sheet_name, number):
+    """Returns the name of the n-th sheet of a rolled over sheet, e.g. 'Data', 'Data (2)', 'Data (3)'"""
+    if number == 1:
+        return sheet_name[:EXCEL_MAX_SHEET_NAME_LENGTH]
+    suffix = ' ({0})'.format(number)
+    return sheet_name[:EXCEL_MAX_SHEET_NAME_LENGTH - len(suffix)] + suffix
+
+
+def cell_values(row):
+    """Returns the values of a row of openpyxl cells as a tuple, integral floats as int like pandas.read_excel"""
+    return tuple(int(cell.value) if isinstance(cell.value, float) and cell.value.is_integer() else cell.value
+                 for cell in row)
+
+
+def iter_sheet_rows(worksheet, skiprows=0, skipfooter=0):
+    """
+    Yields the values of the non blank rows of an openpyxl worksheet as tuples, after the first
+    skiprows rows and without the last skipfooter non blank rows, like pandas.read_excel.
+    Rows of a worksheet opened with read_only=True are streamed from the file,
+    only skipfooter rows are held back.
+    :param worksheet: openpyxl worksheet
+    :type worksheet: openpyxl.worksheet.Worksheet
+    :param skiprows: Number of rows to skip at the start of the sheet
+    :type skiprows: int
+    :param skipfooter: Number of rows to skip at the end of the sheet
+    :type skipfooter: int
+    """
+    footer = deque()
+    for row in itertools.islice(worksheet.iter_rows(), skiprows, None):
+        values = cell_values(row)
+        if all(value is None for value in values):
+            continue
+        if skipfooter:
+            footer.append(values)
+            if len(footer) <= skipfooter:
+                continue
+            values = footer.popleft()
+        yield values
+
+
+def header_names(values):
+    """
+    Returns column names for header row values like pandas.read_excel:
+    'Unnamed: <i>' for empty cells and '.1', '.2', ... suffixes for duplicate names.
+    """
+    names, counts = [], {}
+    for i, value in enumerate(values):
+        name = 'Unnamed: {0}'.format(i) if value is None or value == '' else str(value)
+        if name in counts:
+            counts[name] += 1
+            name = '{0}.{1}'.format(name, counts[name])
+        else:
+            counts[name] = 0
+        names.append(name)
+    return names
+
+
+class StreamingSheetWriter(object):
+    """
+    Writes rows in order to an xlsxwriter workbook opened with constant_memory option
+    (see STREAMING_WORKBOOK_OPTIONS), starting a new sheet with the same header
+    when Excel row limit is reached.
+
+    :param workbook: xlsxwriter Workbook
+    :type workbook: xlsxwriter.Workbook
+    :param sheet_name: Name of the first sheet. Following sheets are named 'sheet_name (2)', ...
+    :type sheet_name: str
+    :param header: Column names written as the first row of every sheet
+    :type header: list
+    :param header_format: xlsxwriter format properties for the header row, e.g. {"bold": True}
+    :type header_format: dict
+    :param max_rows: Maximum rows per sheet including header
+    :type max_rows: int
+    """
+
+    def __init__(self, workbook, sheet_name, header, header_format=None, max_rows=EXCEL_MAX_ROWS):
+        self.workbook = workbook
+        self.sheet_name = sheet_name
+        self.header = list(header)
+        self.header_format = workbook.add_format(header_format) if header_format else None
+        self.max_rows = max_rows
+        self.sheet_names = []
+        self.rows_total = 0
+        self._worksheet = None
+        self._row = 0
+
+    def _add_sheet(self):
+        name = rollover_sheet_name(self.sheet_name, len(self.sheet_names) + 1)
+        if self.sheet_names:
+            logging.warning('Sheet {0} reached {1} rows, continuing in sheet {2}'.format(
+                self.sheet_names[-1], self.max_rows, name))
+        self._worksheet = self.workbook.add_worksheet(name)
+        self.sheet_names.append(name)
+        self._worksheet.write_row(0, 0, self.header, self.header_format)
+        self._row = 1
+
+    def write_rows(self, rows):
+        """Writes rows (sequences of values) after the previously written rows"""
+        if self._worksheet is None:
+            self._add_sheet()
+
+        for row in rows:
+            if self._row >= self.max_rows:
+                self._add_sheet()
+            self._worksheet.write_row(self._row, 0, row)
+            self._row += 1
+        self.rows_total += len(rows)
+
+    def close(self):
+        """Makes sure the sheet exists with the header also when no rows were written"""
+        if self._worksheet is None:
+            self._add_sheet()
+
+
+WORKSHEET_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'
+WORKSHEET_RELATIONSHIP_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet'
+RELATIONSHIPS_NAMESPACE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+CONTENT_TYPES_PART = '[Content_Types].xml'
+WORKBOOK_PART = 'xl/workbook.xml'
+WORKBOOK_RELS_PART = 'xl/_rels/workbook.xml.rels'
+
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def column_letter(i):
+    """Returns the Excel column letter of a 0-indexed column"""
+    string = ''
+    i += 1
+    while i > 0:
+        i, remainder = divmod(i - 1, 26)
+        string = chr(65 + remainder) + string
+    return string
+
+
+def _cell_xml(ref, value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '<c r="{0}" t="b"><v>{1}</v></c>'.format(ref, int(value))
+    if isinstance(value, (int, float, Decimal)):
+        if isinstance(value, float) and not math.isfinite(value):
+            return ''
+        return '<c r="{0}"><v>{1}</v></c>'.format(ref, value)
+    if isinstance(value, (date, time)):
+        value = value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()
+    text = escape(INVALID_XML_CHARS.sub('', str(value)))
+    space = ' xml:space="preserve"' if text != text.strip() else ''
+    return '<c r="{0}" t="inlineStr"><is><t{1}>{2}</t></is></c>'.format(ref, space, text)
+
+
+def _write_sheet_xml(f, header, rows, max_rows):
+    """
+    Writes worksheet xml with inline strings to a binary file object.
+    Dates are written as ISO strings because the styles part of the workbook is not modified.
+    Returns the number of data rows written, stops after max_rows rows including header.
+    """
+    f.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+    letters = []
+    row_number = 0
+    for values in itertools.chain([header] if header else [], rows):
+        if len(letters) < len(values):
+            letters.extend(column_letter(i) for i in range(len(letters), len(values)))
+        row_number += 1
+        cells = ''.join(_cell_xml('{0}{1}'.format(letters[i], row_number), v) for i, v in enumerate(values))
+        f.write('<row r="{0}">{1}</row>'.format(row_number, cells).encode('utf-8'))
+        if row_number >= max_rows:
+            break
+    f.write(b'</sheetData></worksheet>')
+    return row_number - (1 if header else 0)
+
+
+def append_sheet(filepath, sheet_name, rows, header=None, max_rows=EXCEL_MAX_ROWS):
+    """
+    Appends a worksheet to an existing xlsx file without loading the workbook.
+    Only the content types, workbook and workbook relationships parts are rewritten,
+    all other parts including existing sheets are copied unchanged to the new zip container.
+    Rows are streamed into the new sheet; when max_rows is reached the rows continue in
+    new sheets 'sheet_name (2)', ... with the same header.
+
+    :param filepath: Path of the existing xlsx file
+    :type filepath: str
+    :param sheet_name: Name of the new sheet
+    :type sheet_name: str
+    :param rows: Iterable of rows (sequences of values)
+    :type rows: iterable
+    :param header: Column names written as the first row
+    :type header: list
+    :param max_rows: Maximum rows per sheet including header
+    :type max_rows: int
+    :return: Names of the added sheets and number of rows written
+    :type tuple
+    """
+    with zipfile.ZipFile(filepath) as zin:
+        content_types = zin.read(CONTENT_TYPES_PART).decode('utf-8')
+        workbook = zin.read(WORKBOOK_PART).decode('utf-8')
+        workbook_rels = zin.read(WORKBOOK_RELS_PART).decode('utf-8')
+
+        existing_names = set(unescape(name, {'&quot;': '"'})
+                             for name in re.findall(r'<(?:\w+:)?sheet\s[^>]*?name="([^"]*)"', workbook))
+        sheet_number = max([int(n) for n in re.findall(r'xl/worksheets/sheet(\d+)\.xml', ' '.join(zin.namelist()))]
+                           or [0])
+        sheet_id = max([int(n) for n in re.findall(r'sheetId="(\d+)"', workbook)] or [0])
+        rel_id = max([int(n) for n in re.findall(r'Id="rId(\d+)"', workbook_rels)] or [0])
+        rel_prefix = re.search(r'xmlns:(\w+)="{0}"'.format(re.escape(RELATIONSHIPS_NAMESPACE)), workbook).group(1)
+        sheets_close_tag = re.search(r'</(?:\w+:)?sheets>', workbook).group(0)
+        sheet_tag = sheets_close_tag.replace('</', '<').replace('sheets>', 'sheet')
+
+        tmp_filepath = '{0}.{1}.tmp'.format(filepath, os.getpid())
+        added_sheets, rows_total = [], 0
+        rows = iter(rows)
+        try:
+            with zipfile.ZipFile(tmp_filepath, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zout:
+                for info in zin.infolist():
+                    if info.filename in (CONTENT_TYPES_PART, WORKBOOK_PART, WORKBOOK_RELS_PART):
+                        continue
+                    copy_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                    copy_info.compress_type = info.compress_type
+                    copy_info.external_attr = info.external_attr
+                    with zin.open(info) as src, zout.open(copy_info, 'w', force_zip64=True) as dest:
+                        shutil.copyfileobj(src, dest)
+
+                sheet_entries, rel_entries, type_entries = [], [], []
+                while True:
+                    name = rollover_sheet_name(sheet_name, len(added_sheets) + 1)
+                    if name in existing_names:
+                        raise ValueError('Sheet {0} already exists in {1}'.format(name, filepath))
+
+                    sheet_number, sheet_id, rel_id = sheet_number + 1, sheet_id + 1, rel_id + 1
+                    part = 'worksheets/sheet{0}.xml'.format(sheet_number)
+                    with zout.open('xl/' + part, 'w', force_zip64=True) as f:
+                        written = _write_sheet_xml(f, header, rows, max_rows)
+                    added_sheets.append(name)
+                    rows_total += written
+
+                    sheet_entries.append('{0} name="{1}" sheetId="{2}" {3}:id="rId{4}"/>'.format(
+                        sheet_tag, escape(name, {'"': '&quot;'}), sheet_id, rel_prefix, rel_id))
+                    rel_entries.append('<Relationship Id="rId{0}" Type="{1}" Target="{2}"/>'.format(
+                        rel_id, WORKSHEET_RELATIONSHIP_TYPE, part))
+                    type_entries.append('<Override PartName="/xl/{0}" ContentType="{1}"/>'.format(
+                        part, WORKSHEET_CONTENT_TYPE))
+                    if written < max_rows - (1 if header else 0):
+                        break
+                    next_row = next(rows, None)
+                    if next_row is None:
+                        break
+                    rows = itertools.chain([next_row], rows)
+                    if len(added_sheets) == 1:
+                        logging.warning('Sheet {0} reached {1} rows, continuing in next sheet'.format(name, max_rows))
+
+                zout.writestr(WORKBOOK_PART, workbook.replace(
+                    sheets_close_tag, ''.join(sheet_entries) + sheets_close_tag, 1))
+                zout.writestr(WORKBOOK_RELS_PART, workbook_rels.replace(
+                    '</Relationships>', ''.join(rel_entries) + '</Relationships>', 1))
+                zout.writestr(CONTENT_TYPES_PART, content_types.replace(
+                    '</Types>', ''.join(type_entries) + '</Types>', 1))
+        except BaseException:
+            if os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+            raise
+
+    os.replace(tmp_filepath, filepath)
+    return added_sheets, rows_total
@@ -0,0 +1,29 @@
+import ctds
+
+
+class FakeConnection(object):
+    """
+    Inserts rows like cTDS bulk_insert and records the calls as (table, number of rows, batch_size, tablock).
+    With check_name, a batch fails as a whole when a row has a NULL Name, its second value,
+    or a Name longer than name_length. error is raised by every call.
+    """
+
+    def __init__(self, check_name=False, name_length=None, error=None):
+        self.check_name = check_name
+        self.name_length = name_length
+        self.error = error
+        self.rows = []
+        self.calls = []
+
+    def bulk_insert(self, table, rows, batch_size=None, tablock=False):
+        self.calls.append((table, len(rows), batch_size, tablock))
+        if self.error is not None:
+            raise self.error
+        for row in rows if self.check_name else []:
+            if row[1] is None:
+                raise ctds.IntegrityError('Cannot insert the value NULL into column Name\n'
+                                          'The statement has been terminated.')
+            if self.name_length is not None and len(row[1]) > self.name_length:
+                raise ctds.DataError('String or binary data would be truncated')
+        self.rows.extend(rows)
+        return len(rows)
@@ -0,0 +1,69 @@
+import unittest
+from unittest.mock import Mock
+import ctds
+from common.hooks import mssql_hook
+from fakes import FakeConnection
+
+
+class TestMsSqlHook(unittest.TestCase):
+    def setUp(self):
+        self.rows = [(1, 'Adam'), (2, None), (3, 'Cristal'), (4, 'Dan'), (5, 'Eve')]
+
+    def test_bulk_insert_isolating(self):
+        conn = FakeConnection(check_name=True, name_length=5)
+        rows_saved, failed = mssql_hook.bulk_insert_isolating(conn, 'Customers', self.rows)
+
+        self.assertEqual(rows_saved, 3)
+        self.assertEqual(conn.rows, [(1, 'Adam'), (4, 'Dan'), (5, 'Eve')])
+        self.assertEqual([(position, type(err)) for position, err in failed],
+                         [(1, ctds.IntegrityError), (2, ctds.DataError)])
+
+    def test_bulk_insert_isolating_clean_batch(self):
+        conn = FakeConnection(check_name=True, name_length=5)
+        rows = [(1, 'Adam'), (4, 'Dan')]
+
+        self.assertEqual(mssql_hook.bulk_insert_isolating(conn, 'Customers', rows), (2, []))
+        self.assertEqual(len(conn.calls), 1)
+
+    def test_bulk_insert_isolating_single_row(self):
+        conn = FakeConnection(check_name=True, name_length=5)
+        rows_saved, failed = mssql_hook.bulk_insert_isolating(conn, 'Customers', [(2, None)])
+
+        self.assertEqual(rows_saved, 0)
+        self.assertEqual(failed[0][0], 0)
+
+    def test_bulk_insert_isolating_table_error(self):
+        conn = FakeConnection(error=ctds.ProgrammingError("Invalid object name 'Customers'"))
+
+        with self.assertRaises(ctds.ProgrammingError):
+            mssql_hook.bulk_insert_isolating(conn, 'Customers', self.rows)
+        self.assertEqual(len(conn.calls), 1)
+
+    def test_bulk_insert_isolating_batch_error(self):
+        conn = FakeConnection(error=ctds.DataError('Invalid column length from the bcp client'))
+
+        with self.assertRaises(ctds.DataError):
+            mssql_hook.bulk_insert_isolating(conn, 'Customers', self.rows)
+
+    def test_get_table_columns(self):
+        hook = Mock(get_records=Mock(return_value=[('Id',), ('Name',)]))
+        self.assertEqual(mssql_hook.MsSqlHook.get_table_columns(hook, 'dbo.Customers'), ['Id', 'Name'])
+        sql = hook.get_records.call_args[1]['sql']
+        self.assertIn('FROM sys.columns', sql)
+        self.assertIn('is_computed = 0', sql)
+        self.assertEqual(hook.get_records.call_args[1]['parameters'], {'table': 'dbo.Customers'})
+
+    def test_get_table_columns_temporary_table(self):
+        hook = Mock(get_records=Mock(return_value=[('Id',)]))
+        self.assertEqual(mssql_hook.MsSqlHook.get_table_columns(hook, '#Customers'), ['Id'])
+        self.assertIn('FROM tempdb.sys.columns', hook.get_records.call_args[1]['sql'])
+        self.assertEqual(hook.get_records.call_args[1]['parameters'], {'table': 'tempdb..#Customers'})
+
+    def test_get_table_columns_missing_table(self):
+        hook = Mock(get_records=Mock(return_value=[]))
+        with self.assertRaises(mssql_hook.AirflowException):
+            mssql_hook.MsSqlHook.get_table_columns(hook, 'dbo.Missing')
+
+
+if __name__ == '__main__':
+    unittest.main()
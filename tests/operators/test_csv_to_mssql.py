@@ -0,0 +1,98 @@
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from contextlib import contextmanager
+from unittest.mock import Mock, patch
+from airflow.exceptions import AirflowException
+from common.hooks import mssql_hook
+from common.utils import etl_utils
+from common.utils.etl_utils import vectorized
+from common.utils.transfer_stats import TransferStats
+from fakes import FakeConnection
+
+
+class TestCSVToMsSql(unittest.TestCase):
+    def setUp(self):
+        # the operator imports modules relative to dags/common as deployed, they are the same modules
+        modules = patch.dict(sys.modules, {'hooks.mssql_hook': mssql_hook, 'utils.etl_utils': etl_utils})
+        modules.start()
+        self.addCleanup(modules.stop)
+        self.csv_to_mssql = importlib.import_module('common.operators.csv_to_mssql')
+
+        self.directory = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.directory, 'accounts.csv')
+        with open(self.filepath, 'w', encoding='utf-8') as f:
+            f.write('Report of accounts\nId,Name,Amount\n1,Adam,1.5\n2,,2.25\n3,"Eve, Jr",\n4,Dan,10\n')
+        self.conn = FakeConnection()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @contextmanager
+    def get_dest_conn(self):
+        yield self.conn
+
+    def operator(self, src_filepath=None, **kwargs):
+        return self.csv_to_mssql.CSVToMsSql(task_id='load_csv',
+                                            src_filepath=self.filepath if src_filepath is None else src_filepath,
+                                            dest_mssql_conn_id='mssql_default', dest_table='dbo.Accounts', **kwargs)
+
+    def execute_arrow(self, columns=None, **kwargs):
+        operator = self.operator(engine='pyarrow', skiprows=1, block_size=40, **kwargs)
+        stats = TransferStats('mssql_transfer.test.load_csv')
+        return operator._execute_arrow(stats, self.filepath, self.get_dest_conn, columns)
+
+    def test_execute_arrow(self):
+        self.assertEqual(self.execute_arrow(), 4)
+        self.assertEqual(self.conn.rows, [{'Id': '1', 'Name': 'Adam', 'Amount': '1.5'},
+                                          {'Id': '2', 'Name': '', 'Amount': '2.25'},
+                                          {'Id': '3', 'Name': 'Eve, Jr', 'Amount': ''},
+                                          {'Id': '4', 'Name': 'Dan', 'Amount': '10'}])
+
+    def test_execute_arrow_tuples(self):
+        self.assertEqual(self.execute_arrow(columns=['Name', 'Id', 'Note'], dtype={'Id': int, 'Amount': str}), 4)
+        self.assertEqual(self.conn.rows, [('Adam', 1, None), ('', 2, None), ('Eve, Jr', 3, None), ('Dan', 4, None)])
+
+    def test_execute_arrow_transformations(self):
+        transformations = {"FILTER:Named": lambda row: row['Name'] != '',
+                           "Name": vectorized(lambda df: df['Name'].str.upper()),
+                           "Source": "accounts.csv"}
+        self.assertEqual(self.execute_arrow(transformations=transformations), 3)
+        self.assertEqual([(row['Id'], row['Name'], row['Source']) for row in self.conn.rows],
+                         [('1', 'ADAM', 'accounts.csv'), ('3', 'EVE, JR', 'accounts.csv'),
+                          ('4', 'DAN', 'accounts.csv')])
+
+    def test_get_files(self):
+        other_filepath = os.path.join(self.directory, 'accounts[1].csv')
+        shutil.copy(self.filepath, other_filepath)
+        pattern = os.path.join(self.directory, '*.csv')
+
+        def get_files(src_filepath, files=None):
+            operator = self.operator(src_filepath, file_list_xcom_location=None if files is None else 'list_files')
+            task_instance = Mock()
+            task_instance.xcom_pull.return_value = files
+            return operator._get_files({'task_instance': task_instance})
+
+        self.assertIsNone(get_files(self.filepath))
+        self.assertIsNone(get_files(other_filepath))
+        self.assertEqual(get_files(pattern), [self.filepath, other_filepath])
+        self.assertEqual(get_files([self.filepath]), [self.filepath])
+        self.assertEqual(get_files(pattern, files=self.filepath), [self.filepath])
+        for src_filepath in (os.path.join(self.directory, '*.txt'), []):
+            with self.subTest(src_filepath=src_filepath):
+                with self.assertRaises(AirflowException):
+                    get_files(src_filepath)
+        with self.assertRaises(AirflowException):
+            get_files(pattern, files=[])
+
+    def test_arrow_column_types(self):
+        operator = self.operator(engine='pyarrow', dtype={'Id': 'int64', 'Name': object})
+        self.assertEqual({name: str(t) for name, t in operator._arrow_column_types(['Id', 'Name']).items()},
+                         {'Id': 'int64', 'Name': 'string'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import importlib
+import io
+import sys
+import unittest
+from datetime import datetime
+from unittest.mock import Mock, patch
+from airflow import DAG
+from airflow.exceptions import AirflowException
+from openpyxl import Workbook
+import pandas as pd
+
+
+def workbook_input(sheets):
+    """Returns an in-memory xlsx file with a sheet of rows by sheet name"""
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for sheet_name, rows in sheets.items():
+        worksheet = workbook.create_sheet(sheet_name)
+        for row in rows:
+            worksheet.append(row)
+    io_input = io.BytesIO()
+    workbook.save(io_input)
+    io_input.seek(0)
+    return io_input
+
+
+def load_sheet(operator, dest_hook, stats, io_input, sheet_name, dest_table, reject_file=None):
+    """Replaces ExcelToMsSql._execute, a sheet named Fail fails to load"""
+    if sheet_name == 'Fail':
+        raise AirflowException('Invalid column Amount')
+    return len(sheet_name)
+
+
+class TestExcelToMsSql(unittest.TestCase):
+    def setUp(self):
+        # the operator imports the destination hook as deployed next to the dags, it is replaced in these tests
+        modules = patch.dict(sys.modules, {'hooks._mssql_hook': Mock()})
+        modules.start()
+        self.addCleanup(modules.stop)
+        self.excel_to_mssql = importlib.import_module('common.operators.excel_to_mssql')
+
+        self.dag = DAG('test_excel_to_mssql', start_date=datetime(2020, 1, 1))
+        self.io_input = workbook_input({'Accounts': [('Id',), (1,)], 'Cards': [('Id',), (2,)],
+                                        'Fail': [('Id',), (3,)]})
+
+    def operator(self, **kwargs):
+        return self.excel_to_mssql.ExcelToMsSql(task_id='load_excel', dag=self.dag, src_filepath='accounts.xlsx',
+                                                dest_mssql_conn_id='mssql_default', **kwargs)
+
+    def test_get_sheets(self):
+        self.assertIsNone(self.operator(dest_table='Accounts', sheet_name='Accounts')._get_sheets(self.io_input))
+        self.assertIsNone(self.operator(dest_table='Accounts', sheet_name=1)._get_sheets(self.io_input))
+        self.assertEqual(self.operator(dest_table='Accounts', sheet_name=None)._get_sheets(self.io_input),
+                         ['Accounts', 'Cards', 'Fail'])
+        self.assertEqual(self.operator(dest_table={'Cards': 'dbo.Cards', 'Other': 'dbo.Other'},
+                                       sheet_name=None)._get_sheets(self.io_input), ['Cards'])
+        self.assertEqual(self.operator(dest_table='Accounts', sheet_name=[2, 'Accounts', 1])._get_sheets(self.io_input),
+                         ['Fail', 'Accounts', 'Cards'])
+
+    def test_get_sheets_out_of_range(self):
+        with self.assertRaises(AirflowException):
+            self.operator(dest_table='Accounts', sheet_name=[0, 3])._get_sheets(self.io_input)
+
+    def test_get_dest_table(self):
+        operator = self.operator(dest_table={'Accounts': 'dbo.Accounts'})
+        self.assertEqual(operator._get_dest_table('Accounts'), 'dbo.Accounts')
+        with self.assertRaises(AirflowException):
+            operator._get_dest_table('Cards')
+        self.assertEqual(self.operator(dest_table='dbo.Accounts')._get_dest_table('Cards'), 'dbo.Accounts')
+
+    def test_execute_sheets(self):
+        operator = self.operator(dest_table={'Accounts': 'dbo.Accounts', 'Fail': 'dbo.Fail'}, sheet_name=None,
+                                 raise_on_error=False, max_workers=2)
+        task_instance = Mock()
+        with patch.object(self.excel_to_mssql.ExcelToMsSql, '_execute', autospec=True, side_effect=load_sheet):
+            summary = operator._execute_sheets(['Accounts', 'Cards', 'Fail'], self.io_input,
+                                               {'task_instance': task_instance})
+
+        self.assertEqual(summary['rows_total'], 8)
+        self.assertEqual(summary['errors'], ['Cards', 'Fail'])
+        self.assertEqual(summary['sheets'], [
+            {'sheet_name': 'Accounts', 'dest_table': 'dbo.Accounts', 'rows_total': 8, 'error': None},
+            {'sheet_name': 'Cards', 'dest_table': None, 'rows_total': 0,
+             'error': 'No destination table for sheet Cards in dest_table'},
+            {'sheet_name': 'Fail', 'dest_table': 'dbo.Fail', 'rows_total': 0, 'error': 'Invalid column Amount'}])
+        self.assertEqual(task_instance.xcom_push.call_args[1]['key'], 'transfer_stats')
+        self.assertEqual(sorted(task_instance.xcom_push.call_args[1]['value']), ['Accounts', 'Cards', 'Fail'])
+
+    def test_execute_sheets_raise_on_error(self):
+        operator = self.operator(dest_table='dbo.Accounts', sheet_name=None)
+        with patch.object(self.excel_to_mssql.ExcelToMsSql, '_execute', autospec=True, side_effect=load_sheet), \
+                self.assertRaises(AirflowException):
+            operator._execute_sheets(['Accounts', 'Fail'], self.io_input, {'task_instance': Mock()})
+
+    def assert_streaming_matches_read_excel(self, io_input, **kwargs):
+        operator = self.operator(dest_table='dbo.Accounts', sheet_name='Accounts', **kwargs)
+        streamed = pd.concat(list(operator._read_chunks(io_input, 'Accounts')), ignore_index=True)
+        io_input.seek(0)
+        expected = pd.read_excel(io=io_input, sheet_name='Accounts', header=None if operator.names else 0,
+                                 names=operator.names, dtype=operator.dtype, skiprows=operator.skiprows,
+                                 skipfooter=operator.skipfooter, keep_default_na=False, na_values='').fillna('')
+        pd.testing.assert_frame_equal(streamed, expected)
+
+    def test_read_chunks_match_read_excel(self):
+        names = ['Id', 'Amount', 'Opened', 'Name', 'Note']
+        io_input = workbook_input({'Accounts': [
+            ('Accounts report',), (), names,
+            (1, 1.5, datetime(2020, 1, 2), 'Adam', 'x'),
+            (2, 2.0, datetime(2020, 2, 3, 10, 30), None, None),
+            (3, None, None, 'Eve'),
+            (4,),
+            (5, 1234567.125, datetime(2021, 1, 1), 'Dan', 7),
+            ('Total', 15)]})
+        options = [dict(skiprows=2, skipfooter=1, rows_chunk=2),
+                   dict(skiprows=3, skipfooter=1, names=names, rows_chunk=2),
+                   dict(skiprows=2, skipfooter=1, dtype={'Id': int, 'Amount': float}),
+                   dict(skiprows=2, skipfooter=1, dtype=None),
+                   dict(skiprows=2, skipfooter=1, dtype=object)]
+        for kwargs in options:
+            with self.subTest(**kwargs):
+                io_input.seek(0)
+                self.assert_streaming_matches_read_excel(io_input, **kwargs)
+
+
+if __name__ == '__main__':
+    unittest.main()
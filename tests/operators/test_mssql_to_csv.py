@@ -0,0 +1,51 @@
+import unittest
+from datetime import date
+from decimal import Decimal
+from unittest.mock import Mock
+from airflow.exceptions import AirflowException
+from common.operators.mssql_to_csv import MsSqlToCSV
+
+
+class TestMsSqlToCSV(unittest.TestCase):
+    def partition_filters(self, low, high, partitions=3, partition_mode='range'):
+        operator = MsSqlToCSV(task_id='export_csv', destination_filepath='accounts',
+                              mssql_source_conn_id='mssql_default', source_sql='SELECT * FROM dbo.Accounts',
+                              partition_column='Id', partitions=partitions, partition_mode=partition_mode)
+        hook = Mock()
+        hook.get_first.return_value = (low, high)
+        return operator._get_partition_filters(hook)
+
+    def test_range_filters_integer(self):
+        self.assertEqual(self.partition_filters(1, 10), [
+            '(partition_src.[Id] >= 1 AND partition_src.[Id] < 4 OR partition_src.[Id] IS NULL)',
+            'partition_src.[Id] >= 4 AND partition_src.[Id] < 7',
+            'partition_src.[Id] >= 7 AND partition_src.[Id] <= 10'])
+
+    def test_range_filters_large_integer(self):
+        filters = self.partition_filters(1200000000000000001, 1200000000000000010)
+        self.assertEqual(filters[1],
+                         'partition_src.[Id] >= 1200000000000000004 AND partition_src.[Id] < 1200000000000000007')
+
+    def test_range_filters_decimal(self):
+        self.assertEqual(self.partition_filters(Decimal('0.00'), Decimal('10.00')), [
+            '(partition_src.[Id] >= 0.00 AND partition_src.[Id] < 3.33 OR partition_src.[Id] IS NULL)',
+            'partition_src.[Id] >= 3.33 AND partition_src.[Id] < 6.67',
+            'partition_src.[Id] >= 6.67 AND partition_src.[Id] <= 10.00'])
+
+    def test_range_filters_empty(self):
+        self.assertEqual(self.partition_filters(None, None), ['partition_src.[Id] IS NULL'])
+
+    def test_range_filters_not_numeric(self):
+        with self.assertRaises(AirflowException):
+            self.partition_filters(date(2020, 1, 1), date(2020, 12, 31))
+        with self.assertRaises(AirflowException):
+            self.partition_filters('a', 'z')
+
+    def test_modulo_filters(self):
+        self.assertEqual(self.partition_filters(None, None, partitions=2, partition_mode='modulo'), [
+            '(ABS(CAST(partition_src.[Id] AS BIGINT) % 2) = 0 OR partition_src.[Id] IS NULL)',
+            'ABS(CAST(partition_src.[Id] AS BIGINT) % 2) = 1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, time
+from decimal import Decimal
+from airflow.exceptions import AirflowException
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pymssql
+from common.operators.mssql_to_parquet import MsSqlToParquet, _column_type
+
+
+class FakeCursor(object):
+    """Returns rows in batches of fetchmany like a DB-API cursor"""
+
+    def __init__(self, description, rows):
+        self.description = description
+        self.rows = list(rows)
+
+    def execute(self, sql, parameters=None):
+        pass
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection(object):
+    def __init__(self, description, rows):
+        self.description = description
+        self.rows = rows
+
+    def cursor(self):
+        return FakeCursor(self.description, self.rows)
+
+
+def column(name, type_code, precision=None, scale=None):
+    return name, type_code, None, None, precision, scale, None
+
+
+class TestMsSqlToParquet(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.directory, 'accounts.parquet')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def operator(self, **kwargs):
+        return MsSqlToParquet(task_id='export_parquet', destination_filepath=self.filepath,
+                              mssql_source_conn_id='mssql_default', source_sql='SELECT 1', row_group_size=2, **kwargs)
+
+    def test_column_type(self):
+        self.assertEqual(_column_type(pymssql.STRING, [None, 'a']), pa.string())
+        self.assertEqual(_column_type(pymssql.BINARY, [b'a']), pa.binary())
+        self.assertEqual(_column_type(pymssql.DATETIME, [None]), pa.timestamp('us'))
+        self.assertEqual(_column_type(pymssql.DATETIME, [date(2020, 1, 2)]), pa.date32())
+        self.assertEqual(_column_type(pymssql.DATETIME, [time(10, 30)]), pa.time64('us'))
+        self.assertEqual(_column_type(pymssql.NUMBER, [None, 1]), pa.int64())
+        self.assertEqual(_column_type(pymssql.NUMBER, [True]), pa.bool_())
+        self.assertEqual(_column_type(pymssql.NUMBER, [1.5]), pa.float64())
+        self.assertEqual(_column_type(pymssql.NUMBER, [None]), pa.float64())
+        self.assertEqual(_column_type(pymssql.DECIMAL, [Decimal('1.50'), Decimal('2.125')]), pa.decimal128(38, 3))
+        self.assertEqual(_column_type(pymssql.DECIMAL, [None]), pa.decimal128(38, 4))
+        self.assertEqual(_column_type(pymssql.DECIMAL, [None], precision=18, scale=6), pa.decimal128(18, 6))
+
+    def test_export(self):
+        description = [column('Id', pymssql.NUMBER), column('Amount', pymssql.DECIMAL),
+                       column('Opened', pymssql.DATETIME), column('Name', pymssql.STRING)]
+        rows = [(1, None, None, 'Adam'), (2, None, None, None),
+                (3, Decimal('1.500000'), date(2020, 1, 2), 'Eve'), (4, Decimal('2.250000'), None, 'Dan'),
+                (5, None, date(2020, 3, 4), 'Ann')]
+
+        rows_total = self.operator()._export(FakeConnection(description, rows), self.filepath)
+
+        self.assertEqual(rows_total, 5)
+        parquet_file = pq.ParquetFile(self.filepath)
+        self.assertEqual(parquet_file.num_row_groups, 3)
+        table = parquet_file.read()
+        self.assertEqual(table.schema.types, [pa.int64(), pa.decimal128(38, 6), pa.date32(), pa.string()])
+        self.assertEqual([tuple(row.values()) for row in table.to_pylist()], rows)
+
+    def test_export_empty(self):
+        rows_total = self.operator()._export(FakeConnection([column('Id', pymssql.NUMBER)], []), self.filepath)
+        self.assertEqual(rows_total, 0)
+        self.assertEqual(pq.read_table(self.filepath).num_rows, 0)
+
+    def test_export_schema(self):
+        description = [column('Amount', pymssql.DECIMAL)]
+        rows = [(Decimal('1.5'),), (Decimal('2.25'),), (Decimal('3.125'),)]
+        with self.assertRaises(AirflowException):
+            self.operator()._export(FakeConnection(description, rows), self.filepath)
+
+        operator = self.operator(schema={'Amount': pa.decimal128(18, 4)})
+        operator._export(FakeConnection(description, rows), self.filepath)
+        self.assertEqual(pq.read_table(self.filepath).column('Amount').to_pylist(),
+                         [Decimal('1.5000'), Decimal('2.2500'), Decimal('3.1250')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,7 @@
 import unittest
+from datetime import date, datetime
+from decimal import Decimal
+from unittest.mock import Mock
 from common.utils import etl_utils
 import pandas as pd
 
@@ -71,6 +74,202 @@ class TestETLUtils(unittest.TestCase):
             transformations={})),
             self.df.to_dict('records'))
 
+    def test_apply_transformations_vectorized(self):
+        records = list(etl_utils.apply_transformations(
+            df=self.df,
+            transformations={
+                "AccountNumber": etl_utils.vectorized(lambda df: df['AccountNumber'].str.strip()),
+                "FILTER:CheckEmpty": etl_utils.vectorized(lambda df: df['AccountNumber'] != ""),
+                "FILTER:CheckAddress": etl_utils.vectorized(lambda df: df['Address'] != ""),
+                "CustomerName": lambda row: "{} {}".format(row["FirstName"], row["LastName"]),
+                "RENAME:CustomerName": "Name"}))
+
+        self.assertEqual([(record['AccountNumber'], record['Name']) for record in records], [('12345', 'Adam Hyatt')])
+        self.assertNotIn('CustomerName', records[0])
+
+    def test_apply_transformations_row_wise_filter_after_vectorized(self):
+        calls = []
+
+        def customer_name(row):
+            calls.append(row['FirstName'])
+            return row['FirstName']
+
+        records = list(etl_utils.apply_transformations(
+            df=self.df,
+            transformations={
+                "FILTER:CheckEmpty": etl_utils.vectorized(lambda df: df['AccountNumber'].str.strip() != ""),
+                "CustomerName": customer_name,
+                "FILTER:CheckLastName": lambda row: row['LastName'] != ""}))
+
+        self.assertEqual([record['CustomerName'] for record in records], ['Adam'])
+        self.assertEqual(calls, ['Adam', 'Cristal'])
+
+    def test_apply_transformations_tuples(self):
+        self.assertEqual(list(etl_utils.apply_transformations(
+            df=self.df,
+            transformations={
+                "ID": 1234,
+                "FILTER:CheckEmpty": etl_utils.vectorized(lambda df: df['AccountNumber'] != "")},
+            columns=['ID', 'FirstName', 'MiddleName', 'AccountNumber'])),
+            [(1234, 'Adam', None, '     12345    '),
+             (1234, 'Cristal', None, '     1122    ')])
+
+    def test_prepare_transformations(self):
+        def check(row):
+            return True
+
+        def check_other(row):
+            return True
+
+        vectorized_check = etl_utils.vectorized(lambda df: df['B'] != '')
+        vectorized_check_other = etl_utils.vectorized(lambda df: df['D'] != '')
+
+        self.assertEqual(etl_utils.prepare_transformations({
+            "RENAME:A": "B",
+            "RENAME:C": "D",
+            "FILTER:Check": check,
+            "FILTER:CheckOther": check_other,
+            "FILTER:CheckVectorized": vectorized_check,
+            "FILTER:CheckVectorizedOther": vectorized_check_other,
+            "ID": 1}),
+            [('rename', {'A': 'B', 'C': 'D'}),
+             ('filter', [check]),
+             ('filter', [check_other]),
+             ('filter', [vectorized_check, vectorized_check_other]),
+             ('assign', 'ID', 1)])
+
+    def test_apply_transformations_chained_filters(self):
+        df = pd.DataFrame({"A": ['', '5', 'x', '7']})
+
+        self.assertEqual(list(etl_utils.apply_transformations(
+            df=df.copy(),
+            transformations={
+                "FILTER:NotEmpty": lambda row: row['A'] != '' and row['A'] != 'x',
+                "FILTER:Big": lambda row: int(row['A']) > 5})),
+            [{'A': '7'}])
+        self.assertEqual(list(etl_utils.apply_transformations(
+            df=df.copy(),
+            transformations={
+                "FILTER:IsDigit": etl_utils.vectorized(lambda df: df['A'].str.isdigit()),
+                "N": etl_utils.vectorized(lambda df: df['A'].astype(int)),
+                "FILTER:Big": lambda row: row['N'] > 5})),
+            [{'A': '7', 'N': 7}])
+
+    def test_schema_converters(self):
+        converters = etl_utils.schema_converters([
+            {"name": "ID", "type": "int", "max_length": None, "precision": 10, "scale": 0, "nullable": False},
+            {"name": "Name", "type": "nvarchar", "max_length": 50, "precision": None, "scale": None, "nullable": True},
+            {"name": "Amount", "type": "decimal", "max_length": None, "precision": 18, "scale": 2, "nullable": True},
+            {"name": "Active", "type": "bit", "max_length": None, "precision": None, "scale": None, "nullable": True},
+            {"name": "OpenDate", "type": "date", "max_length": None, "precision": None, "scale": None,
+             "nullable": True},
+            {"name": "Updated", "type": "datetime2", "max_length": None, "precision": None, "scale": None,
+             "nullable": True}])
+
+        self.assertEqual(sorted(converters), ['Active', 'Amount', 'ID', 'OpenDate', 'Updated'])
+        self.assertEqual(converters['ID'](' 12 '), 12)
+        self.assertEqual(converters['ID'](3.0), 3)
+        self.assertIsNone(converters['ID'](''))
+        self.assertEqual(converters['Amount']('1.50'), Decimal('1.50'))
+        self.assertEqual(converters['Active']('true'), True)
+        self.assertEqual(converters['OpenDate']('2020-01-02 00:00:00'), date(2020, 1, 2))
+        self.assertEqual(converters['Updated']('2020-01-02T03:04:05'), datetime(2020, 1, 2, 3, 4, 5))
+        with self.assertRaises(ValueError):
+            converters['ID']('1.5')
+        with self.assertRaises(ValueError):
+            converters['OpenDate']('2020-13-01')
+
+    def test_schema_converters_declared(self):
+        converters = etl_utils.schema_converters({"Cycle": "smallint",
+                                                  "OpenDate": "date",
+                                                  "FirstName": str.upper,
+                                                  "LastName": {"type": "varchar", "max_length": 10}},
+                                                 date_formats=['%m/%d/%Y'])
+
+        self.assertEqual(sorted(converters), ['Cycle', 'FirstName', 'OpenDate'])
+        self.assertEqual(converters['OpenDate']('01/02/2020'), date(2020, 1, 2))
+        self.assertEqual(converters['FirstName']('adam'), 'ADAM')
+
+    def test_resolve_schema(self):
+        table_schema = [{"name": "ID", "type": "int", "max_length": None, "precision": 10, "scale": 0,
+                         "nullable": False}]
+        dest_hook = Mock()
+        dest_hook.get_table_schema.return_value = table_schema
+
+        self.assertEqual(etl_utils.resolve_schema(None, dest_hook, 'Accounts'), (None, {}))
+        self.assertEqual(etl_utils.resolve_schema(None, dest_hook, 'Accounts', validate=True), (table_schema, {}))
+        schema, converters = etl_utils.resolve_schema('table', dest_hook, 'Accounts')
+        self.assertEqual((schema, list(converters)), (table_schema, ['ID']))
+        dest_hook.get_table_schema.assert_called_with('Accounts')
+
+        schema, converters = etl_utils.resolve_schema({"OpenDate": "date"}, dest_hook, 'Accounts', ['%m/%d/%Y'])
+        self.assertEqual([column['name'] for column in schema], ['OpenDate'])
+        self.assertEqual(converters['OpenDate']('01/02/2020'), date(2020, 1, 2))
+
+    def test_convert_types(self):
+        df = pd.DataFrame({"ID": ["1", "", "3"], "Name": ["a", "", "c"]})
+        df = etl_utils.convert_types(df, etl_utils.schema_converters({"ID": "int"}))
+
+        self.assertEqual(df['ID'].dtype, object)
+        self.assertEqual(df['ID'].tolist(), [1, None, 3])
+        self.assertEqual(df['Name'].tolist(), ['a', '', 'c'])
+
+    def test_convert_types_rejects(self):
+        df = pd.DataFrame({"ID": ["1", "x", "3"]})
+        rejects = {}
+        df = etl_utils.convert_types(df, etl_utils.schema_converters({"ID": "int"}), rejects)
+
+        self.assertEqual(df['ID'].tolist(), [1, None, 3])
+        self.assertEqual(rejects, {1: 'ID: invalid int'})
+
+    def test_apply_transformations_converters(self):
+        df = pd.DataFrame({"ID": ["1", "2", "TRAILER"], "Amount": ["1.50", "2", "3.50"]})
+        records = list(etl_utils.apply_transformations(
+            df=df,
+            transformations={"FILTER:Trailer": lambda row: row['ID'] != 'TRAILER',
+                             "Code": lambda row: row['ID'].zfill(3),
+                             "RENAME:Amount": "Total"},
+            converters=etl_utils.schema_converters({"ID": "int", "Total": "decimal"})))
+
+        self.assertEqual(records, [{'ID': 1, 'Total': Decimal('1.50'), 'Code': '001'},
+                                   {'ID': 2, 'Total': Decimal('2'), 'Code': '002'}])
+
+    def test_apply_transformations_with_rejects_filtered(self):
+        df = pd.DataFrame({"ID": ["1", "x", "TRAILER"]})
+        records, source, rejects = etl_utils.apply_transformations_with_rejects(
+            df=df,
+            transformations={"FILTER:Trailer": lambda row: row['ID'] != 'TRAILER'},
+            converters=etl_utils.schema_converters({"ID": "int"}))
+
+        self.assertEqual(records, [{'ID': 1}])
+        self.assertEqual(rejects[etl_utils.REJECT_REASON_COLUMN].tolist(), ['ID: invalid int'])
+
+    def test_validate_rows(self):
+        df = pd.DataFrame({"ID": [1, None, 3], "Code": ["ab", "abc", None]})
+        reasons = etl_utils.validate_rows(df, {"ID": {"type": "int", "nullable": False},
+                                               "Code": {"type": "varchar", "max_length": 2},
+                                               "Missing": {"type": "int", "nullable": False}})
+
+        self.assertEqual(reasons, {1: 'ID: NULL in NOT NULL column'})
+        df.loc[1, 'ID'] = 2
+        self.assertEqual(etl_utils.validate_rows(df, {"Code": {"type": "varchar", "max_length": 2}}),
+                         {1: 'Code: longer than 2'})
+
+    def test_apply_transformations_with_rejects(self):
+        records, source, rejects = etl_utils.apply_transformations_with_rejects(
+            df=self.df,
+            transformations={"ID": 1234},
+            schema={"AccountNumber": {"type": "int", "nullable": False},
+                    "LastName": {"type": "varchar", "max_length": 4}},
+            converters=etl_utils.schema_converters({"AccountNumber": "int"}),
+            columns=['ID', 'AccountNumber', 'FirstName'])
+
+        self.assertEqual(records, [(1234, 1122, 'Cristal')])
+        self.assertEqual(source['AccountNumber'].tolist(), ['     1122    '])
+        self.assertEqual(rejects['FirstName'].tolist(), ['Adam', 'Charles'])
+        self.assertEqual(rejects[etl_utils.REJECT_REASON_COLUMN].tolist(),
+                         ['LastName: longer than 4', 'AccountNumber: NULL in NOT NULL column'])
+
 
 if __name__ == '__main__':
     unittest.main()
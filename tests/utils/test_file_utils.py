@@ -0,0 +1,120 @@
+import gzip
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import Mock
+from common.utils import file_utils
+
+
+class TestFileUtils(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_open_output(self):
+        filepath = os.path.join(self.directory, 'test.csv')
+        with file_utils.open_output(filepath) as f:
+            f.write(b'a,b\n1,2\n')
+
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), b'a,b\n1,2\n')
+
+    def test_open_output_gzip(self):
+        filepath = os.path.join(self.directory, 'test.csv.gz')
+        with file_utils.open_output(filepath, compression='gzip') as f:
+            f.write(b'a,b\n')
+            f.write(b'1,2\n')
+
+        with gzip.open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), b'a,b\n1,2\n')
+
+    def test_open_output_invalid_compression(self):
+        with self.assertRaises(ValueError):
+            with file_utils.open_output(os.path.join(self.directory, 'test.csv'), compression='bz2'):
+                pass
+
+    def test_open_input(self):
+        filepath = os.path.join(self.directory, 'test.csv')
+        with open(filepath, 'wb') as f:
+            f.write(b'a,b\n1,2\n')
+        with gzip.open(filepath + '.gz', 'wb') as f:
+            f.write(b'a,b\n1,2\n')
+        with zipfile.ZipFile(filepath + '.zip', 'w') as f:
+            f.writestr('test.csv', b'a,b\n1,2\n')
+
+        for path in (filepath, filepath + '.gz', filepath + '.zip'):
+            with file_utils.open_input(path) as f:
+                self.assertEqual(f.read(), b'a,b\n1,2\n')
+
+    def test_open_input_zip_multiple_files(self):
+        filepath = os.path.join(self.directory, 'test.zip')
+        with zipfile.ZipFile(filepath, 'w') as f:
+            f.writestr('a.csv', b'a\n')
+            f.writestr('b.csv', b'b\n')
+
+        with self.assertRaises(ValueError):
+            with file_utils.open_input(filepath):
+                pass
+
+    @unittest.skipUnless(shutil.which('gpg'), 'gpg is not installed')
+    def test_open_input_gpg(self):
+        filepath = os.path.join(self.directory, 'test.csv.gz')
+        with gzip.open(filepath, 'wb') as f:
+            f.write(b'a,b\n1,2\n')
+        options = ['--homedir', self.directory]
+        self.addCleanup(subprocess.call, ['gpgconf', '--homedir', self.directory, '--kill', 'all'])
+        subprocess.check_call(['gpg', '--batch', '--quiet', '--pinentry-mode', 'loopback', '--passphrase', 'secret',
+                               '--symmetric', '--output', filepath + '.gpg'] + options + [filepath])
+
+        with file_utils.open_input(filepath + '.gpg', passphrase='secret', gpg_options=options) as f:
+            self.assertEqual(f.readline(), b'a,b\n')
+
+        with file_utils.open_input(filepath + '.gpg', passphrase='secret', gpg_options=options) as f:
+            self.assertEqual(f.read(), b'a,b\n1,2\n')
+
+        with self.assertRaises(IOError):
+            with file_utils.open_input(filepath + '.gpg', passphrase='wrong', gpg_options=options) as f:
+                f.read()
+
+    @unittest.skipUnless(shutil.which('gpg'), 'gpg is not installed')
+    def test_gpg_input_options(self):
+        key_directory = os.path.join(self.directory, 'key')
+        os.mkdir(key_directory, 0o700)
+        self.addCleanup(subprocess.call, ['gpgconf', '--homedir', key_directory, '--kill', 'all'])
+        self.addCleanup(subprocess.call, ['gpgconf', '--homedir', self.directory, '--kill', 'all'])
+        key_options = ['--homedir', key_directory, '--batch', '--quiet', '--pinentry-mode', 'loopback',
+                       '--passphrase', 'secret']
+        subprocess.check_call(['gpg'] + key_options + ['--quick-gen-key', 'test@example.com', 'default', 'default',
+                                                       'never'])
+        key_file = os.path.join(self.directory, 'test.asc')
+        subprocess.check_call(['gpg'] + key_options + ['--armor', '--output', key_file,
+                                                       '--export-secret-keys', 'test@example.com'])
+
+        conn = Mock(password='secret', extra_dejson={'key_file': key_file, 'options': ['--homedir', self.directory]})
+        self.assertEqual(file_utils.gpg_input_options(conn),
+                         {'passphrase': 'secret', 'gpg_options': ['--homedir', self.directory]})
+        self.assertIn(b'test@example.com', subprocess.check_output(
+            ['gpg', '--homedir', self.directory, '--list-secret-keys']))
+
+    def test_split_lines(self):
+        filepath = os.path.join(self.directory, 'test.csv')
+        with open(filepath, 'wb') as f:
+            f.write(b'a,b\n1,2\n33,44\n5,6')
+
+        self.assertEqual(file_utils.split_lines(filepath, 4), [(0, 4), (4, 8), (8, 14), (14, 17)])
+        self.assertEqual(file_utils.split_lines(filepath, 6, skip_lines=1), [(4, 14), (14, 17)])
+        self.assertEqual(file_utils.split_lines(filepath, 100, skip_lines=4), [])
+
+    def test_split_lines_empty_file(self):
+        filepath = os.path.join(self.directory, 'test.csv')
+        open(filepath, 'wb').close()
+        self.assertEqual(file_utils.split_lines(filepath, 4), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from common.utils import mssql_statistics
+
+
+class TestMsSqlStatistics(unittest.TestCase):
+    def setUp(self):
+        self.messages = [
+            "SQL Server parse and compile time: \n   CPU time = 15 ms, elapsed time = 17 ms.",
+            "Table 'Orders'. Scan count 1, logical reads 120, physical reads 2, page server reads 0, "
+            "read-ahead reads 40, lob logical reads 0, lob physical reads 0.",
+            "Table 'Worktable'. Scan count 0, logical reads 0, physical reads 0, read-ahead reads 0.",
+            "\n SQL Server Execution Times:\n   CPU time = 31 ms,  elapsed time = 250 ms."]
+
+    def test_parse_statistics(self):
+        statistics = mssql_statistics.parse_statistics(self.messages)
+
+        self.assertEqual(statistics['logical_reads'], 120)
+        self.assertEqual(statistics['physical_reads'], 2)
+        self.assertEqual(statistics['read_ahead_reads'], 40)
+        self.assertEqual(statistics['cpu_time_ms'], 31)
+        self.assertEqual(statistics['elapsed_time_ms'], 250)
+        self.assertEqual(statistics['compile_cpu_time_ms'], 15)
+        self.assertEqual(statistics['compile_elapsed_time_ms'], 17)
+        self.assertEqual(statistics['tables'][0],
+                         {'table': 'Orders',
+                          'scan_count': 1,
+                          'logical_reads': 120,
+                          'physical_reads': 2,
+                          'page_server_reads': 0,
+                          'read_ahead_reads': 40,
+                          'lob_logical_reads': 0,
+                          'lob_physical_reads': 0})
+        self.assertEqual(statistics['tables'][1]['table'], 'Worktable')
+
+    def test_parse_statistics_multiple_statements(self):
+        statistics = mssql_statistics.parse_statistics(self.messages + self.messages[1:])
+
+        self.assertEqual(statistics['logical_reads'], 240)
+        self.assertEqual(statistics['cpu_time_ms'], 62)
+        self.assertEqual(len(statistics['tables']), 4)
+
+    def test_parse_statistics_bytes_messages(self):
+        statistics = mssql_statistics.parse_statistics([m.encode('utf-8') for m in self.messages])
+
+        self.assertEqual(statistics['elapsed_time_ms'], 250)
+
+    def test_parse_statistics_empty(self):
+        statistics = mssql_statistics.parse_statistics([])
+
+        self.assertEqual(statistics['tables'], [])
+        self.assertEqual(statistics['logical_reads'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from common.utils import pandas2excel
+from common.utils.pandas2excel import col_letter, style_range
+from openpyxl import load_workbook
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.utils import column_index_from_string
+import pandas as pd
+
+
+def baseline_insert_df(writer, df, sheet_name, start_row=0, start_col=0, index=True, header=True, header_axis='both',
+                       is_full_border=False):
+    """Writes a data frame with the auto format of insert_df before named styles, cell by cell with style_range"""
+    writer.create_sheet(sheet_name)
+    df.to_excel(writer.writer, sheet_name, startrow=start_row, startcol=start_col, index=index, header=header)
+    worksheet = writer.writer.sheets[sheet_name]
+    header_index = str(start_row+1)
+    table_end = str(start_row + df.shape[0] + (1 if header else 0))
+    start_index = start_col+1
+    if index:
+        start_index += 1
+    end_index = start_index+df.shape[1]-1
+    header_font = Font(color='FFFFFF', bold=True)
+    header_fill = PatternFill('solid', fgColor='444444')
+    thin = Side(border_style="thin", color="000000")
+    border = Border(top=thin, left=thin, right=thin, bottom=thin)
+
+    to_apply = col_letter(start_index)+header_index+':'+col_letter(end_index)+table_end
+    style_range(worksheet, to_apply, border=border, is_full_border=is_full_border)
+    if header:
+        if header_axis in ['both', 1]:
+            to_apply = col_letter(start_index)+header_index+':'+col_letter(end_index)+header_index
+            style_range(worksheet, to_apply, font=header_font, fill=header_fill)
+            to_apply = col_letter(start_index)+header_index+':'+col_letter(end_index)+table_end
+            if not index:
+                to_apply = col_letter(start_index+1)+to_apply[1:]
+            style_range(worksheet, to_apply, alignment=Alignment(horizontal='right'))
+        if header_axis in ['both', 2]:
+            if index:
+                to_apply = col_letter(start_index-1)+header_index+':'+col_letter(start_index-1)+table_end
+            else:
+                to_apply = col_letter(start_index)+header_index+':'+col_letter(start_index)+table_end
+            style_range(worksheet, to_apply, font=header_font, fill=header_fill,
+                        alignment=Alignment(horizontal='left'))
+
+
+def baseline_resize_columns(worksheet):
+    """Returns the column widths of resize_columns before widths were measured from data frames"""
+    widths = {}
+    for i, col in enumerate(worksheet.columns):
+        longest = 0
+        longest_type = None
+        for cell in col:
+            longest_candidate = pandas2excel.cell_width(cell.value)
+            if longest_candidate[0] > longest:
+                longest, longest_type = longest_candidate
+        widths[col_letter(i+1)] = pandas2excel.scaled_width(longest, longest_type)
+    return widths
+
+
+def cell_style(cell):
+    border = cell.border
+    return (cell.value, cell.font.b, cell.font.color.rgb if cell.font.color else None, cell.font.name,
+            cell.fill.fill_type, cell.fill.fgColor.rgb, cell.alignment.horizontal, cell.alignment.vertical,
+            border.top.style, border.bottom.style, border.left.style, border.right.style, cell.number_format)
+
+
+def saved_cell_style(cell):
+    """Returns the style of a cell read from a saved file, colors and number formats as written by both engines"""
+    def color(value):
+        return value.rgb[-6:].upper() if value is not None and isinstance(value.rgb, str) else None
+    border = cell.border
+    return (cell.value, bool(cell.font.b), color(cell.font.color), cell.fill.fill_type,
+            color(cell.fill.fgColor) if cell.fill.fill_type else None, cell.alignment.horizontal,
+            cell.alignment.vertical, border.top.style, border.bottom.style, border.left.style, border.right.style,
+            cell.number_format.lower() if cell.value is not None else None)
+
+
+class TestPandas2Excel(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.df = pd.DataFrame({"Amount": [1.5, 2.25, 3.0],
+                                "Name": ["Adam", "Charles", None],
+                                "Date": [date(2020, 1, 2), date(2020, 2, 3), date(2020, 3, 4)]},
+                               index=pd.Index(["a", "b", "c"], name="Key"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_insert_df_styles_match_baseline(self):
+        options = [dict(index=index, header=header, header_axis=header_axis, is_full_border=is_full_border)
+                   for index in (True, False) for header in (True, False) for header_axis in ('both', 1, 2)
+                   for is_full_border in (False, True)]
+        for kwargs in options:
+            with self.subTest(**kwargs):
+                writer = pandas2excel.Writer(os.path.join(self.directory, 'test.xlsx'))
+                writer.insert_df(self.df, 'Sheet', start_row=1, start_col=1, **kwargs)
+                baseline = pandas2excel.Writer(os.path.join(self.directory, 'baseline.xlsx'))
+                baseline_insert_df(baseline, self.df, 'Sheet', start_row=1, start_col=1, **kwargs)
+
+                worksheet = writer.writer.sheets['Sheet']
+                baseline_worksheet = baseline.writer.sheets['Sheet']
+                for row, baseline_row in zip(worksheet.iter_rows(min_row=1, max_row=6, max_col=6),
+                                             baseline_worksheet.iter_rows(min_row=1, max_row=6, max_col=6)):
+                    for cell, baseline_cell in zip(row, baseline_row):
+                        self.assertEqual(cell_style(cell), cell_style(baseline_cell), cell.coordinate)
+
+    def write_report(self, writer_class, **kwargs):
+        writer = writer_class(os.path.join(self.directory, writer_class.__name__ + '.xlsx'))
+        writer.insert_df(self.df, 'Sheet', start_row=1, start_col=1, **kwargs)
+        writer.insert_df(self.df.head(1), 'Sheet', start_row=7, start_col=3, **kwargs)
+        writer.format_values('Sheet', 2, {'Amount': 'percent'}, search_index=2)
+        writer.paint_table('Sheet', 1, {'b': 'Blue', 'Charles': 'Red'}, search_index='B')
+        writer.resize_all()
+        writer.save()
+        return writer
+
+    def test_streaming_writer_matches_writer(self):
+        options = [dict(index=index, header=header, header_axis=header_axis, is_full_border=is_full_border,
+                        auto_format=auto_format)
+                   for index in (True, False) for header in (True, False) for header_axis in ('both', 1, 2)
+                   for is_full_border in (False, True) for auto_format in (True, False)]
+        for kwargs in options:
+            with self.subTest(**kwargs):
+                writer = self.write_report(pandas2excel.Writer, **kwargs)
+                streaming_writer = self.write_report(pandas2excel.StreamingWriter, **kwargs)
+                worksheet = load_workbook(writer.out_file)['Sheet']
+                streaming_worksheet = load_workbook(streaming_writer.out_file)['Sheet']
+                for row, streaming_row in zip(worksheet.iter_rows(min_row=1, max_row=11, max_col=8),
+                                              streaming_worksheet.iter_rows(min_row=1, max_row=11, max_col=8)):
+                    for cell, streaming_cell in zip(row, streaming_row):
+                        self.assertEqual(saved_cell_style(streaming_cell), saved_cell_style(cell), cell.coordinate)
+                # xlsxwriter adds padding to widths in the file, widths are compared before saving
+                widths = {column_index_from_string(column): dimension.width for column, dimension
+                          in writer.writer.sheets['Sheet'].column_dimensions.items()}
+                self.assertEqual(streaming_writer.sheets['Sheet']['widths'], widths)
+
+    def test_streaming_writer_rejects_multiindex(self):
+        writer = pandas2excel.StreamingWriter(os.path.join(self.directory, 'test.xlsx'))
+        columns = self.df.copy()
+        columns.columns = pd.MultiIndex.from_tuples([('Sale', 'Amount'), ('Sale', 'Name'), ('Sale', 'Date')])
+        with self.assertRaises(ValueError):
+            writer.insert_df(columns, 'Sheet')
+        rows = self.df.set_index('Name', append=True)
+        with self.assertRaises(ValueError):
+            writer.insert_df(rows, 'Sheet')
+        writer.insert_df(rows, 'Sheet', index=False)
+        self.assertEqual(len(writer.sheets['Sheet']['tables']), 1)
+
+    def test_invalid_axis(self):
+        for writer_class in (pandas2excel.Writer, pandas2excel.StreamingWriter):
+            with self.subTest(writer_class=writer_class.__name__):
+                writer = writer_class(os.path.join(self.directory, 'test.xlsx'))
+                with self.assertRaises(ValueError):
+                    writer.insert_df(self.df, 'Sheet', header_axis=3)
+                writer.insert_df(self.df, 'Sheet', header_axis=3, auto_format=False)
+                with self.assertRaises(ValueError):
+                    writer.format_values('Sheet', 3, {'a': '0.00'})
+                with self.assertRaises(ValueError):
+                    writer.paint_table('Sheet', 0, {'a': 'yellow'})
+
+    def test_resize_columns_match_baseline(self):
+        df = self.df.assign(Count=[1, None, 3], Active=[True, False, True], Note=["x" * 30, "", "short"])
+        writer = pandas2excel.Writer(os.path.join(self.directory, 'test.xlsx'))
+        writer.insert_df(df, 'Sheet', start_row=2, start_col=1)
+        writer.insert_df(df.reset_index(), 'Sheet', start_row=8, start_col=0, index=False)
+        worksheet = writer.writer.sheets['Sheet']
+        worksheet['A1'] = 'A title longer than the columns'
+        worksheet['J2'] = 12345.678
+        writer.resize_columns('Sheet')
+
+        widths = baseline_resize_columns(worksheet)
+        self.assertEqual({column: worksheet.column_dimensions[column].width for column in widths}, widths)
+
+    def test_column_widths(self):
+        self.assertEqual(pandas2excel.column_widths(pd.Series(pd.to_datetime(["2020-01-02", None]))),
+                         [(8, None), (8, None)])
+        self.assertEqual(pandas2excel.column_widths(pd.Series([1.234, 10.5])), [(5, float)])
+        self.assertEqual(pandas2excel.column_widths(pd.Series(["abc", None, 1])), [(8, None), (3, str), (8, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from common.utils import query_cache
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.cache = query_cache.QueryCache(self.location, ttl=60)
+        self.key = query_cache.QueryCache.make_key('SELECT * FROM Calendar WHERE Year = %(year)s',
+                                                   {'year': 2020}, 'mssql_default')
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_make_key(self):
+        self.assertEqual(self.key, query_cache.QueryCache.make_key('SELECT * FROM Calendar WHERE Year = %(year)s',
+                                                                   {'year': 2020}, 'mssql_default'))
+        self.assertNotEqual(self.key, query_cache.QueryCache.make_key('SELECT * FROM Calendar WHERE Year = %(year)s',
+                                                                      {'year': 2021}, 'mssql_default'))
+        self.assertNotEqual(self.key, query_cache.QueryCache.make_key('SELECT * FROM Calendar WHERE Year = %(year)s',
+                                                                      {'year': 2020}, 'mssql_other'))
+
+    def test_get_miss(self):
+        self.assertEqual(self.cache.get(self.key), (False, None))
+
+    def test_set_get_hit(self):
+        self.cache.set(self.key, [{'Year': 2020, 'Month': 1}])
+
+        self.assertEqual(self.cache.get(self.key), (True, [{'Year': 2020, 'Month': 1}]))
+
+    @patch('common.utils.query_cache.time.time')
+    def test_get_expired(self, mock_time):
+        mock_time.return_value = 1000
+        self.cache.set(self.key, [1, 2, 3])
+        mock_time.return_value = 1061
+
+        self.assertEqual(self.cache.get(self.key), (False, None))
+
+    def test_invalidate(self):
+        self.cache.set(self.key, [1, 2, 3])
+        self.cache.invalidate(self.key)
+
+        self.assertEqual(self.cache.get(self.key), (False, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+from airflow.exceptions import AirflowException
+from common.utils.reject_file import RejectFile, bulk_insert_rejecting
+from fakes import FakeConnection
+import ctds
+import pandas as pd
+
+
+class TestRejectFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.directory, 'rejects.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write(self):
+        reject_file = RejectFile(self.filepath, max_rejects=2)
+        reject_file.write(pd.DataFrame({"ID": ["x"], "RejectReason": ["ID: invalid int"]}))
+        reject_file.write(pd.DataFrame({"ID": ["y", ""], "RejectReason": ["ID: invalid int",
+                                                                          "ID: NULL in NOT NULL column"]}))
+
+        with open(self.filepath) as f:
+            self.assertEqual(f.read(), 'ID,RejectReason\nx,ID: invalid int\ny,ID: invalid int\n'
+                                       ',ID: NULL in NOT NULL column\n')
+        self.assertTrue(reject_file.exceeded())
+        self.assertEqual(reject_file.summary(), {"filepath": self.filepath,
+                                                 "rows": 3,
+                                                 "source_rows": 0,
+                                                 "reasons": {"ID: invalid int": 2, "ID: NULL in NOT NULL column": 1}})
+
+    def test_no_rejects(self):
+        open(self.filepath, 'w').close()
+        reject_file = RejectFile(self.filepath)
+        reject_file.write(pd.DataFrame({"ID": [], "RejectReason": []}))
+
+        self.assertFalse(os.path.exists(self.filepath))
+        self.assertFalse(reject_file.exceeded(final=True))
+        self.assertIsNone(reject_file.summary()['filepath'])
+
+    def test_exceeded_fraction(self):
+        reject_file = RejectFile(self.filepath, max_rejects=0.1)
+        reject_file.add_source_rows(10)
+        reject_file.write(pd.DataFrame({"ID": ["x", "y"], "RejectReason": ["a", "b"]}))
+
+        self.assertFalse(reject_file.exceeded())
+        self.assertTrue(reject_file.exceeded(final=True))
+        reject_file.add_source_rows(10)
+        self.assertFalse(reject_file.exceeded(final=True))
+
+    def test_reject(self):
+        reject_file = RejectFile(self.filepath, max_rejects=1)
+        reject_file.reject(pd.DataFrame({"ID": [], "RejectReason": []}), source_rows=5)
+        reject_file.reject(pd.DataFrame({"ID": ["x"], "RejectReason": ["ID: invalid int"]}), source_rows=5)
+
+        self.assertEqual((reject_file.rows, reject_file.source_rows), (1, 10))
+        with self.assertRaises(AirflowException):
+            reject_file.reject(pd.DataFrame({"ID": ["y"], "RejectReason": ["ID: invalid int"]}), source_rows=5)
+
+    def test_check(self):
+        reject_file = RejectFile(self.filepath, max_rejects=0.1)
+        reject_file.reject(pd.DataFrame({"ID": ["x"], "RejectReason": ["ID: invalid int"]}), source_rows=10)
+        reject_file.check()
+
+        reject_file.reject(pd.DataFrame({"ID": ["y"], "RejectReason": ["ID: invalid int"]}))
+        with self.assertRaises(AirflowException):
+            reject_file.check()
+
+    def test_bulk_insert_rejecting(self):
+        conn = FakeConnection(check_name=True)
+        source = pd.DataFrame({"ID": ["1", "2", "3"], "Name": ["Adam", "", "Cristal"]}, index=[10, 11, 12])
+        reject_file = RejectFile(self.filepath)
+
+        rows_saved = bulk_insert_rejecting(conn, 'Customers', [(1, 'Adam'), (2, None), (3, 'Cristal')], source,
+                                           reject_file)
+
+        self.assertEqual(rows_saved, 2)
+        self.assertEqual(conn.rows, [(1, 'Adam'), (3, 'Cristal')])
+        self.assertEqual(conn.calls[0], ('Customers', 3, None, True))
+        with open(self.filepath) as f:
+            self.assertEqual(f.read(), 'ID,Name,RejectReason\n2,,Insert failed: Cannot insert the value NULL '
+                                       'into column Name\n')
+
+    def test_bulk_insert_rejecting_without_reject_file(self):
+        conn = FakeConnection(check_name=True)
+
+        self.assertEqual(bulk_insert_rejecting(conn, 'Customers', [(1, 'Adam')], tablock=False, batch_size=100), 1)
+        self.assertEqual(conn.calls, [('Customers', 1, 100, False)])
+        with self.assertRaises(ctds.IntegrityError):
+            bulk_insert_rejecting(conn, 'Customers', [(2, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from unittest.mock import patch
+from common.utils import transfer_stats
+
+
+class TestTransferStats(unittest.TestCase):
+    def test_approximate_size(self):
+        self.assertEqual(transfer_stats.approximate_size([('abc', 1, None), (b'de', 2.5, 'f')]), 23)
+
+    def test_approximate_size_dict_rows(self):
+        self.assertEqual(transfer_stats.approximate_size([{'a': 'abcd', 'b': 1}]), 12)
+
+    def test_approximate_size_sampled(self):
+        self.assertEqual(transfer_stats.approximate_size([('ab',)] * 1000, sample_size=10), 2000)
+
+    def test_approximate_size_empty(self):
+        self.assertEqual(transfer_stats.approximate_size([]), 0)
+
+    @patch('common.utils.transfer_stats.Stats')
+    def test_summary(self, mock_stats):
+        stats = transfer_stats.TransferStats('mssql_transfer.dag.task')
+        for _ in stats.iterate([1, 2]):
+            with stats.timer('insert'):
+                pass
+            stats.add_chunk([('abcd',)])
+
+        summary = stats.summary()
+        self.assertEqual(summary['chunks'], 2)
+        self.assertEqual(summary['rows'], 2)
+        self.assertEqual(summary['bytes'], 8)
+        self.assertIn('fetch_time', summary)
+        self.assertIn('insert_time', summary)
+        mock_stats.incr.assert_any_call('mssql_transfer.dag.task.rows', 1)
+        mock_stats.incr.assert_any_call('mssql_transfer.dag.task.bytes', 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
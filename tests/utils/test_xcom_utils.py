@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from common.utils import xcom_utils
+
+
+class TestXComUtils(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.records = [{'id': i, 'name': 'name {0}'.format(i), 'amount': i * 1.5} for i in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_spill_records(self):
+        for file_format in ('parquet', 'arrow'):
+            with self.subTest(file_format=file_format):
+                filepath = os.path.join(self.directory, 'result' + xcom_utils.SPILL_FORMATS[file_format])
+                reference = xcom_utils.spill_records(self.records, filepath, file_format=file_format,
+                                                     row_group_size=2)
+                self.assertTrue(xcom_utils.is_spilled_result(reference))
+                self.assertEqual(reference['rows'], 5)
+                self.assertTrue(reference['is_dict'])
+
+                result = xcom_utils.load_result(reference)
+                self.assertEqual(len(result), 5)
+                self.assertEqual(list(result), self.records)
+                self.assertEqual([batch.num_rows for batch in result.iter_batches()], [2, 2, 1])
+                self.assertEqual(result.to_pandas().to_dict('records'), self.records)
+
+    def test_spill_records_tuples(self):
+        filepath = os.path.join(self.directory, 'result.parquet')
+        records = [(1, 'a'), (2, None)]
+        reference = xcom_utils.spill_records(records, filepath)
+        self.assertFalse(reference['is_dict'])
+        self.assertEqual(list(xcom_utils.load_result(reference)), records)
+
+    def test_spill_records_invalid_format(self):
+        with self.assertRaises(ValueError):
+            xcom_utils.spill_records(self.records, os.path.join(self.directory, 'result.csv'), file_format='csv')
+
+    def test_load_result_unchanged(self):
+        self.assertEqual(xcom_utils.load_result(self.records), self.records)
+        self.assertIsNone(xcom_utils.load_result(None))
+
+    @patch('common.hooks.s3_hook.S3Hook')
+    def test_spill_records_s3(self, mock_s3_hook):
+        stored = os.path.join(self.directory, 'stored.parquet')
+        local_filepaths = []
+
+        def store_file(remote_full_path, local_full_path):
+            local_filepaths.append(local_full_path)
+            shutil.copy(local_full_path, stored)
+
+        def retrieve_file(remote_full_path, local_full_path):
+            local_filepaths.append(local_full_path)
+            shutil.copy(stored, local_full_path)
+
+        mock_s3_hook.return_value.store_file.side_effect = store_file
+        mock_s3_hook.return_value.retrieve_file.side_effect = retrieve_file
+
+        path = 's3://bucket/prefix/result.parquet'
+        reference = xcom_utils.spill_records(self.records, path)
+        mock_s3_hook.return_value.store_file.assert_called_once_with(path, local_filepaths[0])
+        self.assertFalse(os.path.exists(local_filepaths[0]))
+
+        result = xcom_utils.load_result(reference)
+        self.assertEqual(list(result), self.records)
+        self.assertFalse(os.path.exists(local_filepaths[1]))
+        self.assertEqual(result.to_pandas().shape, (5, 3))
+        self.assertFalse(os.path.exists(local_filepaths[2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock, call
+from common.utils import xlsx_utils
+
+MINIMAL_XLSX = {
+    '[Content_Types].xml':
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/></Types>',
+    'xl/workbook.xml':
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Report" sheetId="1" r:id="rId1"/></sheets></workbook>',
+    'xl/_rels/workbook.xml.rels':
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '<Relationship Id="rId2" Target="styles.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/></Relationships>',
+    'xl/worksheets/sheet1.xml': '<worksheet><sheetData><row r="1"/></sheetData></worksheet>',
+}
+
+
+class TestXlsxUtils(unittest.TestCase):
+    def test_rollover_sheet_name(self):
+        self.assertEqual(xlsx_utils.rollover_sheet_name('Data', 1), 'Data')
+        self.assertEqual(xlsx_utils.rollover_sheet_name('Data', 2), 'Data (2)')
+        self.assertEqual(xlsx_utils.rollover_sheet_name('A' * 40, 1), 'A' * 31)
+        self.assertEqual(xlsx_utils.rollover_sheet_name('A' * 40, 12), 'A' * 26 + ' (12)')
+
+    def test_iter_sheet_rows(self):
+        worksheet = MagicMock()
+        worksheet.iter_rows.return_value = [[SimpleNamespace(value=v) for v in row] for row in [
+            ('Report', None), ('a', 'b'), (1.0, 'x'), (None, None), (2.5, 'y'), (3, None), ('Total', 3)]]
+
+        self.assertEqual(list(xlsx_utils.iter_sheet_rows(worksheet, skiprows=1, skipfooter=1)),
+                         [('a', 'b'), (1, 'x'), (2.5, 'y'), (3, None)])
+        self.assertEqual(list(xlsx_utils.iter_sheet_rows(worksheet, skiprows=7)), [])
+
+    def test_header_names(self):
+        self.assertEqual(xlsx_utils.header_names(['a', None, 'a', 1, 'a']), ['a', 'Unnamed: 1', 'a.1', '1', 'a.2'])
+
+    def test_streaming_sheet_writer_rollover(self):
+        workbook = MagicMock()
+        worksheets = [MagicMock(), MagicMock()]
+        workbook.add_worksheet.side_effect = worksheets
+
+        writer = xlsx_utils.StreamingSheetWriter(workbook, 'Data', ['a', 'b'], max_rows=3)
+        writer.write_rows([(1, 2), (3, 4)])
+        writer.write_rows([(5, 6)])
+
+        self.assertEqual(writer.sheet_names, ['Data', 'Data (2)'])
+        self.assertEqual(writer.rows_total, 3)
+        self.assertEqual(worksheets[0].write_row.mock_calls,
+                         [call(0, 0, ['a', 'b'], None), call(1, 0, (1, 2)), call(2, 0, (3, 4))])
+        self.assertEqual(worksheets[1].write_row.mock_calls,
+                         [call(0, 0, ['a', 'b'], None), call(1, 0, (5, 6))])
+
+    def test_streaming_sheet_writer_empty(self):
+        workbook = MagicMock()
+        writer = xlsx_utils.StreamingSheetWriter(workbook, 'Data', ['a'], header_format={'bold': True})
+        writer.close()
+
+        workbook.add_format.assert_called_once_with({'bold': True})
+        workbook.add_worksheet.assert_called_once_with('Data')
+
+    def test_column_letter(self):
+        self.assertEqual([xlsx_utils.column_letter(i) for i in (0, 25, 26, 701, 702)],
+                         ['A', 'Z', 'AA', 'ZZ', 'AAA'])
+
+
+class TestAppendSheet(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmp_dir, 'report.xlsx')
+        with zipfile.ZipFile(self.filepath, 'w', zipfile.ZIP_DEFLATED) as f:
+            for name, data in MINIMAL_XLSX.items():
+                f.writestr(name, data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_append_sheet(self):
+        rows = [(1, 'a & b', None), (2.5, ' x', datetime(2020, 1, 2, 3, 4, 5)), (True, 'c', 'd')]
+        sheet_names, rows_total = xlsx_utils.append_sheet(self.filepath, 'New', rows, header=['n', 's', 'd'])
+
+        self.assertEqual(sheet_names, ['New'])
+        self.assertEqual(rows_total, 3)
+        self.assertEqual(os.listdir(self.tmp_dir), ['report.xlsx'])
+        with zipfile.ZipFile(self.filepath) as f:
+            self.assertEqual(f.read('xl/worksheets/sheet1.xml').decode(), MINIMAL_XLSX['xl/worksheets/sheet1.xml'])
+            self.assertIn('<sheet name="New" sheetId="2" r:id="rId3"/></sheets>', f.read('xl/workbook.xml').decode())
+            self.assertIn('<Relationship Id="rId3" Type="{0}" Target="worksheets/sheet2.xml"/>'.format(
+                xlsx_utils.WORKSHEET_RELATIONSHIP_TYPE), f.read('xl/_rels/workbook.xml.rels').decode())
+            self.assertIn('<Override PartName="/xl/worksheets/sheet2.xml"', f.read('[Content_Types].xml').decode())
+
+            sheet = f.read('xl/worksheets/sheet2.xml').decode()
+            self.assertIn('<row r="1"><c r="A1" t="inlineStr"><is><t>n</t></is></c>', sheet)
+            self.assertIn('<row r="2"><c r="A2"><v>1</v></c><c r="B2" t="inlineStr"><is><t>a &amp; b</t></is></c>'
+                          '</row>', sheet)
+            self.assertIn('<t xml:space="preserve"> x</t>', sheet)
+            self.assertIn('<t>2020-01-02 03:04:05</t>', sheet)
+            self.assertIn('<c r="A4" t="b"><v>1</v></c>', sheet)
+
+    def test_append_sheet_rollover(self):
+        sheet_names, rows_total = xlsx_utils.append_sheet(self.filepath, 'New', [(i,) for i in range(5)],
+                                                          header=['n'], max_rows=3)
+
+        self.assertEqual(sheet_names, ['New', 'New (2)', 'New (3)'])
+        self.assertEqual(rows_total, 5)
+        with zipfile.ZipFile(self.filepath) as f:
+            self.assertIn('<sheet name="New (3)" sheetId="4" r:id="rId5"/>', f.read('xl/workbook.xml').decode())
+            self.assertIn('<row r="2"><c r="A2"><v>4</v></c></row></sheetData>',
+                          f.read('xl/worksheets/sheet4.xml').decode())
+
+    def test_append_sheet_existing_name(self):
+        with self.assertRaises(ValueError):
+            xlsx_utils.append_sheet(self.filepath, 'Report', [])
+        self.assertEqual(os.listdir(self.tmp_dir), ['report.xlsx'])
+
+
+if __name__ == '__main__':
+    unittest.main()